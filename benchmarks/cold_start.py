@@ -0,0 +1,77 @@
+"""
+Arranque en frío de ATIM: tiempo desde lanzar el proceso hasta el primer
+`GET /api/v1/health` con 200, como al escalar con un contenedor nuevo.
+
+Cada ronda arranca uvicorn con un worker en un proceso nuevo (sin cachés de
+módulos en memoria), sondea /health cada 10 ms y lo para.
+
+Uso:
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --runs 10 --env STORAGE_SCP_ENABLED=true
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure(env: dict, timeout: float) -> float:
+    """Segundos hasta el primer /health sano de un proceso recién lanzado."""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/api/v1/health").status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                if process.poll() is not None:
+                    raise RuntimeError(f"ATIM terminó al arrancar (código {process.returncode})")
+                time.sleep(0.01)
+        raise RuntimeError(f"Sin /health sano en {timeout:.0f}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR",
+                        help="variable de entorno para ATIM (repetible)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    env = dict(os.environ, APP_ENV="production")
+    env.update(item.split("=", 1) for item in args.env)
+    times = [measure(env, args.timeout) for _ in range(max(1, args.runs))]
+    for i, seconds in enumerate(times, 1):
+        print(f"  ronda {i}: {1000 * seconds:.0f} ms")
+    print(
+        f"Primer /health sano: mediana {1000 * statistics.median(times):.0f} ms, "
+        f"mín {1000 * min(times):.0f} ms, máx {1000 * max(times):.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
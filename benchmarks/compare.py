@@ -0,0 +1,75 @@
+"""
+Comparar dos resultados de `benchmarks.run`.
+
+Uso:
+    python -m benchmarks.compare benchmarks/results/abc123.json benchmarks/results/def456.json
+    python -m benchmarks.compare base.json head.json --threshold 15
+
+Marca como regresión cualquier escenario cuyo p95 o pico de tracemalloc suba,
+o cuyo throughput baje, más del umbral (en %). Sale con código 1 si hay alguna.
+"""
+import argparse
+import json
+import sys
+
+# (ruta dentro del escenario, True si más alto es peor)
+METRICS = [
+    (("latency_ms", "p50"), True),
+    (("latency_ms", "p95"), True),
+    (("latency_ms", "p99"), True),
+    (("throughput_rps",), False),
+    (("tracemalloc_peak_mb",), True),
+    (("upstream_calls", "orthanc"), True),
+]
+GATED = {("latency_ms", "p95"), ("throughput_rps",), ("tracemalloc_peak_mb",)}
+
+
+def _value(scenario: dict, path: tuple) -> float:
+    for key in path:
+        scenario = scenario.get(key, {}) if isinstance(scenario, dict) else {}
+    return scenario if isinstance(scenario, (int, float)) else 0.0
+
+
+def compare(base: dict, head: dict, threshold: float) -> bool:
+    """Imprimir la comparación y devolver True si hay regresiones."""
+    regressions = False
+    print(f"base={base['meta']['commit']} {base['meta'].get('label', '')}  "
+          f"head={head['meta']['commit']} {head['meta'].get('label', '')}")
+    print(f"{'escenario':<18} {'métrica':<26} {'base':>12} {'head':>12} {'Δ%':>8}")
+
+    for name, head_scenario in head["scenarios"].items():
+        base_scenario = base["scenarios"].get(name)
+        if base_scenario is None:
+            print(f"{name:<18} (nuevo)")
+            continue
+
+        for path, higher_is_worse in METRICS:
+            before, after = _value(base_scenario, path), _value(head_scenario, path)
+            delta = (after - before) / before * 100 if before else 0.0
+            worse = delta > threshold if higher_is_worse else delta < -threshold
+            flag = ""
+            if worse and path in GATED:
+                flag = "  REGRESIÓN"
+                regressions = True
+            print(f"{name:<18} {'.'.join(path):<26} {before:>12.2f} {after:>12.2f} {delta:>7.1f}%{flag}")
+
+    return regressions
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    sys.exit(1 if compare(base, head, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
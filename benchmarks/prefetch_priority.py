@@ -0,0 +1,109 @@
+"""
+Prefetch frente a peticiones interactivas: con varios estudios precargándose,
+una llamada interactiva a Orthanc no debe esperar hueco en el planificador.
+
+Mide la latencia de `get_study_details` contra un Orthanc simulado sin
+prefetch y con todos los estudios precargándose a la vez, y comprueba en el
+planificador de Orthanc que ninguna llamada interactiva tuvo que esperar
+mientras el prefetch estaba activo. Termina con código 1 si alguna esperó.
+
+Uso:
+    python -m benchmarks.prefetch_priority
+    python -m benchmarks.prefetch_priority --latency-ms 50 --requests 40
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+from benchmarks.standins.link import Link
+from benchmarks.standins.orthanc import create_fake_orthanc
+from benchmarks.standins.server import BackgroundServer
+from benchmarks.synthetic import Geometry, generate_archive
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--studies", type=int, default=8)
+    parser.add_argument("--instances", type=int, default=30, help="instancias por serie")
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--requests", type=int, default=20, help="llamadas interactivas por fase")
+    parser.add_argument("--capacity", type=int, default=4, help="SCHEDULER_ORTHANC_CONCURRENCY")
+    parser.add_argument("--reserved", type=int, default=2, help="SCHEDULER_INTERACTIVE_RESERVED")
+    return parser.parse_args(argv)
+
+
+async def interactive_latencies(repo, study_ids: List[str], count: int) -> List[float]:
+    """Milisegundos de `count` llamadas interactivas seguidas."""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        await repo.get_study_details(study_ids[i % len(study_ids)])
+        latencies.append(1000 * (time.perf_counter() - start))
+    return latencies
+
+
+async def run(args: argparse.Namespace) -> bool:
+    archive = generate_archive(args.studies, 2, args.instances, Geometry(1, 16, 16))
+    orthanc = create_fake_orthanc(archive, Link(latency_ms=args.latency_ms))
+
+    with BackgroundServer(orthanc) as server:
+        os.environ.update({
+            "APP_ENV": "test",
+            "ORTHANC_HOST": server.host,
+            "ORTHANC_HTTP_PORT": str(server.port),
+            "SCHEDULER_ADAPTIVE": "false",
+            "SCHEDULER_ORTHANC_CONCURRENCY": str(args.capacity),
+            "SCHEDULER_INTERACTIVE_RESERVED": str(args.reserved),
+            "PREFETCH_ENABLED": "true",
+            "PREFETCH_CONCURRENCY": str(2 * args.capacity),
+            "PREFETCH_MAX_ACTIVE": str(args.studies),
+            "PREFETCH_PREVIEWS_PER_SERIES": str(args.instances),
+            "PREFETCH_BUDGET_SECONDS": "300",
+        })
+        from src.config.settings import get_settings
+        from src.repositories.orthanc_repository import OrthancRepository
+        from src.services.prefetch_service import prefetcher
+
+        repo = OrthancRepository(get_settings())
+        study_ids = [study.orthanc_id for study in archive]
+        baseline = await interactive_latencies(repo, study_ids, args.requests)
+
+        for study in archive:
+            prefetcher.schedule(repo, study.orthanc_id, [series.orthanc_id for series in study.series])
+        await asyncio.sleep(5 * args.latency_ms / 1000)
+
+        before = repo.scheduler.stats()["classes"]["interactive"]["waited"]
+        loaded = await interactive_latencies(repo, study_ids, args.requests)
+        stats = repo.scheduler.stats()
+        waited = stats["classes"]["interactive"]["waited"] - before
+        active = prefetcher.stats()["active"]
+
+        tasks = list(prefetcher._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    print(f"Sin prefetch:  mediana {statistics.median(baseline):.1f} ms, máx {max(baseline):.1f} ms")
+    print(f"Con prefetch:  mediana {statistics.median(loaded):.1f} ms, máx {max(loaded):.1f} ms")
+    print(
+        f"Estudios precargándose al terminar: {active}; huecos masivos en uso: "
+        f"{stats['classes']['bulk']['active']}/{args.capacity}; "
+        f"llamadas interactivas que esperaron hueco: {waited}"
+    )
+    if active == 0:
+        print("El prefetch terminó antes de medir: aumentar --instances o --latency-ms")
+        return False
+    return waited == 0
+
+
+def main(argv=None) -> None:
+    if not asyncio.run(run(parse_args(argv))):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Benchmark de ATIM contra Orthanc y JoyCare simulados.
+
+Levanta en el propio proceso un Orthanc y un JoyCare falsos (con latencia y
+ancho de banda configurables) sobre un archivo DICOM sintético de ecografías
+multiframe, arranca ATIM apuntando a ellos y mide cada escenario:
+percentiles de latencia, throughput, memoria (RSS pico y pico de
+tracemalloc) y llamadas que llegaron a cada upstream.
+
+Uso:
+    python -m benchmarks.run
+    python -m benchmarks.run --instances 50 --frames 60 --orthanc-mbps 200
+    python -m benchmarks.run --scenarios study_detail,instance_file --out /tmp/r.json
+    python -m benchmarks.run --dicomweb --label dicomweb
+    python -m benchmarks.run --dimse --label dimse --scenarios transfer_series
+
+El resultado se guarda en JSON (por defecto benchmarks/results/<commit>.json)
+para comparar entre commits con `python -m benchmarks.compare`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.standins.dicom_scp import FakeDicomScp
+from benchmarks.standins.joycare import create_fake_joycare
+from benchmarks.standins.link import Link
+from benchmarks.standins.orthanc import create_fake_orthanc
+from benchmarks.standins.server import BackgroundServer
+from benchmarks.synthetic import Geometry, SyntheticStudy, generate_archive
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Cada escenario genera, para la iteración i, (método, ruta, cuerpo JSON)
+Request = Tuple[str, str, dict]
+
+
+def build_scenarios(archive: List[SyntheticStudy]) -> Dict[str, Callable[[int], Request]]:
+    studies = [s.orthanc_id for s in archive]
+    series = [r.orthanc_id for s in archive for r in s.series]
+    instances = [i.orthanc_id for s in archive for r in s.series for i in r.instances]
+
+    return {
+        "list_patients": lambda i: ("GET", "/api/v1/patients", None),
+        "list_studies": lambda i: ("GET", "/api/v1/studies", None),
+        "search_studies": lambda i: (
+            "GET", f"/api/v1/studies/search?patient_id={archive[i % len(archive)].patient_tags['PatientID']}", None
+        ),
+        "study_detail": lambda i: ("GET", f"/api/v1/studies/{studies[i % len(studies)]}", None),
+        "series_instances": lambda i: (
+            "GET", f"/api/v1/series/{series[i % len(series)]}/instances", None
+        ),
+        "instance_file": lambda i: (
+            "GET", f"/api/v1/instances/{instances[i % len(instances)]}/file", None
+        ),
+        "instance_frame": lambda i: (
+            "GET", f"/api/v1/instances/{instances[i % len(instances)]}/frames/0?format=raw", None
+        ),
+        "transfer_series": lambda i: ("POST", "/api/v1/transfer/series", {
+            "series_id": series[i % len(series)],
+            "neonato_id": 1 + i % 20,
+            "uploader_medico_id": 1,
+        }),
+    }
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB, macOS en bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+async def run_scenario(
+    base_url: str,
+    make_request: Callable[[int], Request],
+    requests: int,
+    concurrency: int,
+) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    received = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=600.0,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    ) as client:
+        async def one(i: int) -> None:
+            nonlocal errors, received
+            method, path, body = make_request(i)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with client.stream(method, path, json=body) as response:
+                        async for chunk in response.aiter_raw():
+                            received += len(chunk)
+                        if response.status_code >= 400:
+                            errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        rss_before = current_rss_mb()
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    traced_peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p90": round(percentile(latencies, 90), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        },
+        "throughput_rps": round(requests / wall, 3) if wall else 0.0,
+        "bytes_received": received,
+        "throughput_mbps": round(received * 8 / wall / 1_000_000, 3) if wall else 0.0,
+        "wall_seconds": round(wall, 3),
+        "rss_mb": {
+            "before": round(rss_before, 1),
+            "after": round(current_rss_mb(), 1),
+            "process_peak": round(peak_rss_mb(), 1),
+        },
+        "tracemalloc_peak_mb": round(traced_peak / 1024 / 1024, 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--studies", type=int, default=4)
+    parser.add_argument("--series-per-study", type=int, default=2)
+    parser.add_argument("--instances", type=int, default=10, help="instancias por serie")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--rows", type=int, default=480)
+    parser.add_argument("--columns", type=int, default=640)
+    parser.add_argument("--orthanc-latency-ms", type=float, default=5.0)
+    parser.add_argument("--orthanc-mbps", type=float, default=0.0, help="0 = sin límite")
+    parser.add_argument("--joycare-latency-ms", type=float, default=5.0)
+    parser.add_argument("--joycare-mbps", type=float, default=0.0, help="0 = sin límite")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--transfer-requests", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", default="all", help="lista separada por comas o 'all'")
+    parser.add_argument("--dicomweb", action="store_true",
+                        help="usar QIDO-RS/WADO-RS en lugar de la API REST de Orthanc")
+    parser.add_argument("--dimse", action="store_true",
+                        help="recuperar series con C-GET contra un SCP pynetdicom simulado")
+    parser.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR",
+                        help="variable de entorno extra para ATIM (repetible)")
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="no medir con tracemalloc (más rápido, sin pico de Python)")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--out", default="")
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    geometry = Geometry(frames=args.frames, rows=args.rows, columns=args.columns)
+    archive = generate_archive(args.studies, args.series_per_study, args.instances, geometry)
+
+    orthanc_app = create_fake_orthanc(archive, Link(args.orthanc_latency_ms, args.orthanc_mbps))
+    joycare_app = create_fake_joycare(Link(args.joycare_latency_ms, args.joycare_mbps))
+
+    with ExitStack() as stack:
+        orthanc = stack.enter_context(BackgroundServer(orthanc_app))
+        joycare = stack.enter_context(BackgroundServer(joycare_app))
+        # El SCP comparte el enlace simulado del Orthanc HTTP
+        scp = stack.enter_context(
+            FakeDicomScp(archive, Link(args.orthanc_latency_ms, args.orthanc_mbps))
+        ) if args.dimse else None
+
+        os.environ.update({
+            "APP_ENV": "benchmark",
+            "ORTHANC_HOST": orthanc.host,
+            "ORTHANC_HTTP_PORT": str(orthanc.port),
+            "ORTHANC_USE_DICOMWEB": "true" if args.dicomweb else "false",
+            "JOYCARE_HOST": joycare.host,
+            "JOYCARE_PORT": str(joycare.port),
+            "DIMSE_ENABLED": "true" if scp else "false",
+        })
+        if scp:
+            os.environ["ORTHANC_DICOM_PORT"] = str(scp.port)
+        for item in args.env:
+            key, _, value = item.partition("=")
+            os.environ[key] = value
+
+        from src.main import create_app
+        logging.getLogger("atim").setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+        scenarios = build_scenarios(archive)
+        selected = list(scenarios) if args.scenarios == "all" else args.scenarios.split(",")
+
+        results = {}
+        with BackgroundServer(create_app()) as atim:
+            for name in selected:
+                requests = args.transfer_requests if name == "transfer_series" else args.requests
+                orthanc_before = sum(orthanc_app.state.calls.values())
+                dimse_before = scp.calls["c-get"] if scp else 0
+                joycare_before = sum(joycare_app.state.calls.values())
+
+                result = await run_scenario(atim.url, scenarios[name], requests, args.concurrency)
+                result["upstream_calls"] = {
+                    "orthanc": sum(orthanc_app.state.calls.values()) - orthanc_before,
+                    "joycare": sum(joycare_app.state.calls.values()) - joycare_before,
+                    "dimse": (scp.calls["c-get"] if scp else 0) - dimse_before,
+                }
+                results[name] = result
+                print(
+                    f"{name:<18} p50={result['latency_ms']['p50']:>9.2f}ms "
+                    f"p99={result['latency_ms']['p99']:>9.2f}ms "
+                    f"{result['throughput_rps']:>8.1f} req/s "
+                    f"{result['throughput_mbps']:>8.1f} Mbit/s "
+                    f"errores={result['errors']} "
+                    f"orthanc={result['upstream_calls']['orthanc']}"
+                )
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "label": args.label,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "instance_bytes": archive[0].series[0].instances[0].size if archive else 0,
+        },
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "scenarios": results,
+    }
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    report = asyncio.run(run(args))
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+SCP DICOM simulado (pynetdicom) para benchmarks.
+
+Responde a C-GET a nivel de serie sobre el mismo archivo sintético que el
+Orthanc falso, enviando cada instancia como sub-operación C-STORE por la
+asociación del solicitante. Aplica la latencia del enlace a cada C-GET y su
+ancho de banda a cada instancia enviada.
+"""
+from collections import Counter
+from io import BytesIO
+from typing import Dict, List
+
+from pydicom import dcmread
+from pydicom.dataset import Dataset
+from pynetdicom import AE, ALL_TRANSFER_SYNTAXES, evt
+from pynetdicom.sop_class import StudyRootQueryRetrieveInformationModelGet
+
+from benchmarks.standins.link import Link
+from benchmarks.standins.server import free_port
+from benchmarks.synthetic import SyntheticInstance, SyntheticStudy
+from src.repositories.dimse_repository import STORAGE_SOP_CLASSES
+
+
+class FakeDicomScp:
+    """Servidor C-GET en un hilo de fondo; se usa como context manager."""
+
+    def __init__(self, archive: List[SyntheticStudy], link: Link = Link(),
+                 ae_title: str = "ORTHANC", port: int = 0, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = port or free_port()
+        self.ae_title = ae_title
+        self.link = link
+        self.calls = Counter()
+        self._series: Dict[tuple, List[SyntheticInstance]] = {
+            (study.study_instance_uid, series.series_instance_uid): series.instances
+            for study in archive for series in study.series
+        }
+
+        self.ae = AE(ae_title=ae_title)
+        self.ae.maximum_pdu_size = 0  # sin límite, como Orthanc
+        self.ae.add_supported_context(StudyRootQueryRetrieveInformationModelGet)
+        for uid in STORAGE_SOP_CLASSES:
+            self.ae.add_supported_context(uid, ALL_TRANSFER_SYNTAXES, scp_role=True, scu_role=False)
+        self.server = None
+
+    def _on_associate(self, event: evt.Event) -> None:
+        self.calls["associations"] += 1
+
+    def _on_get(self, event: evt.Event):
+        self.calls["c-get"] += 1
+        self.link.delay_blocking()
+        identifier = event.identifier
+        instances = self._series.get(
+            (identifier.get("StudyInstanceUID"), identifier.get("SeriesInstanceUID")), []
+        )
+        yield len(instances)
+        for instance in instances:
+            if event.is_cancelled:
+                yield 0xFE00, None
+                return
+            self.link.pace_blocking(instance.size)
+            self.calls["c-store"] += 1
+            yield 0xFF00, self._dataset(instance)
+
+    @staticmethod
+    def _dataset(instance: SyntheticInstance) -> Dataset:
+        return dcmread(BytesIO(instance.to_bytes()))
+
+    def start(self) -> "FakeDicomScp":
+        self.server = self.ae.start_server(
+            (self.host, self.port),
+            block=False,
+            evt_handlers=[
+                (evt.EVT_C_GET, self._on_get),
+                (evt.EVT_ACCEPTED, self._on_associate),
+            ],
+        )
+        return self
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+
+    def __enter__(self) -> "FakeDicomScp":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
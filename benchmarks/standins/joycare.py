@@ -0,0 +1,115 @@
+"""
+JoyCare simulado para benchmarks.
+
+Lista neonatos y acepta la subida de ecografías consumiendo el cuerpo de la
+petición al ritmo del enlace configurado, sin guardarlo. Implementa también
+el lado servidor de la subida por partes reanudable (sesión + PATCH con
+`Upload-Offset`); `part_failure_rate` hace que una fracción de las partes se
+corte a mitad (se confirma solo lo recibido y se responde 503) para ejercitar
+la reanudación. Con `chunked=False` imita a un JoyCare sin subida por partes.
+"""
+import itertools
+import random
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from benchmarks.standins.link import Link
+
+
+def create_fake_joycare(
+    link: Link = Link(),
+    neonatos: int = 20,
+    chunked: bool = True,
+    part_failure_rate: float = 0.0,
+    seed: int = 0,
+) -> FastAPI:
+    """App FastAPI que imita al backend de JoyCare."""
+    app = FastAPI(title="Fake JoyCare")
+    app.state.calls = Counter()
+    app.state.bytes_received = 0
+    app.state.uploads = {}
+    ids = itertools.count(1)
+    rng = random.Random(seed)
+
+    @app.middleware("http")
+    async def simulate_link(request: Request, call_next):
+        await link.delay()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        app.state.calls[route.path if route else request.url.path] += 1
+        return response
+
+    def created(neonato_id: int, size: int) -> dict:
+        ecografia_id = next(ids)
+        return {
+            "id": ecografia_id,
+            "neonato_id": neonato_id,
+            "filepath": f"/uploads/neonatos/{neonato_id}/{ecografia_id}.dcm",
+            "size": size,
+        }
+
+    @app.get("/api/neonatos")
+    async def list_neonatos():
+        return [
+            {"id": n, "nombre": f"Neonato {n}", "documento": f"NEO{n:04d}"}
+            for n in range(1, neonatos + 1)
+        ]
+
+    @app.post("/api/ecografias/{neonato_id}")
+    async def upload_ecografia(neonato_id: int, request: Request):
+        size = 0
+        async for chunk in request.stream():
+            await link.pace(len(chunk))
+            size += len(chunk)
+        app.state.bytes_received += size
+        return created(neonato_id, size)
+
+    if not chunked:
+        return app
+
+    @app.post("/api/ecografias/{neonato_id}/uploads")
+    async def create_upload(neonato_id: int, request: Request):
+        body = await request.json()
+        upload_id = uuid.uuid4().hex
+        app.state.uploads[upload_id] = {
+            "neonato_id": neonato_id, "size": int(body["size"]), "offset": 0, "result": None,
+        }
+        return {"upload_id": upload_id, "offset": 0}
+
+    @app.get("/api/ecografias/uploads/{upload_id}")
+    async def upload_status(upload_id: str):
+        upload = app.state.uploads.get(upload_id)
+        if upload is None:
+            return JSONResponse({"detail": "Subida no encontrada"}, status_code=404)
+        return {"offset": upload["offset"], "size": upload["size"]}
+
+    @app.patch("/api/ecografias/uploads/{upload_id}")
+    async def upload_part(upload_id: str, request: Request):
+        upload = app.state.uploads.get(upload_id)
+        if upload is None:
+            return JSONResponse({"detail": "Subida no encontrada"}, status_code=404)
+        if int(request.headers.get("upload-offset", -1)) != upload["offset"]:
+            return JSONResponse({"offset": upload["offset"]}, status_code=409)
+
+        cut = None
+        if part_failure_rate and rng.random() < part_failure_rate:
+            cut = int(request.headers.get("content-length", 0)) // 2
+        received = 0
+        async for chunk in request.stream():
+            await link.pace(len(chunk))
+            if cut is not None:
+                chunk = chunk[:max(0, cut - received)]
+            received += len(chunk)
+        upload["offset"] = min(upload["size"], upload["offset"] + received)
+        app.state.bytes_received += received
+        if cut is not None:
+            return JSONResponse({"offset": upload["offset"]}, status_code=503)
+
+        if upload["offset"] >= upload["size"] and upload["result"] is None:
+            upload["result"] = created(upload["neonato_id"], upload["size"])
+        return {"offset": upload["offset"], "result": upload["result"]}
+
+    return app
@@ -0,0 +1,38 @@
+"""Simulación de red: latencia por petición y ancho de banda limitado."""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable
+
+
+@dataclass
+class Link:
+    """Características del enlace entre ATIM y un sistema simulado."""
+    latency_ms: float = 0.0
+    bandwidth_mbps: float = 0.0  # 0 = sin límite
+
+    async def delay(self) -> None:
+        """Esperar la latencia de ida y vuelta de una petición."""
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    async def pace(self, size: int) -> None:
+        """Esperar lo que tardaría en transmitirse `size` bytes."""
+        if self.bandwidth_mbps > 0 and size:
+            await asyncio.sleep(size * 8 / (self.bandwidth_mbps * 1_000_000))
+
+    def delay_blocking(self) -> None:
+        """Como `delay`, para código síncrono (hilos de pynetdicom)."""
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+    def pace_blocking(self, size: int) -> None:
+        """Como `pace`, para código síncrono (hilos de pynetdicom)."""
+        if self.bandwidth_mbps > 0 and size:
+            time.sleep(size * 8 / (self.bandwidth_mbps * 1_000_000))
+
+    async def throttle(self, chunks: Iterable[bytes]) -> AsyncIterator[bytes]:
+        """Entregar los trozos respetando el ancho de banda."""
+        for chunk in chunks:
+            await self.pace(len(chunk))
+            yield chunk
@@ -0,0 +1,393 @@
+"""
+Orthanc simulado para benchmarks.
+
+Implementa el subconjunto de la API REST de Orthanc que usa ATIM sobre un
+archivo sintético (ver `benchmarks.synthetic`), con latencia y ancho de banda
+configurables. Cuenta las llamadas recibidas por ruta.
+
+`/changes` sirve el registro de cambios del archivo (NewStudy, NewSeries,
+NewInstance y StableStudy por recurso); `app.state.add_change` añade cambios
+nuevos para simular la llegada de estudios.
+"""
+import fnmatch
+import struct
+import uuid
+import zlib
+from collections import Counter
+from typing import List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from benchmarks.standins.link import Link
+from benchmarks.synthetic import SyntheticInstance, SyntheticStudy, index_archive, pixel_blob
+from src.utils.dicom_json import TAGS
+from src.utils.zip_stream import ZipStream
+
+_LAST_UPDATE = "20240601T120000"
+_EXPLICIT_VR_LITTLE_ENDIAN = "1.2.840.10008.1.2.1"
+_VR = {"PatientName": "PN", "StudyDate": "DA", "PatientBirthDate": "DA", "Modality": "CS",
+       "ModalitiesInStudy": "CS", "PatientSex": "CS"}
+
+
+def to_dicom_json(tags: dict) -> dict:
+    """Tags simplificados → DICOM JSON (PS3.18 F.2), como responde QIDO-RS."""
+    result = {}
+    for keyword, value in tags.items():
+        tag = TAGS.get(keyword)
+        if tag is None:
+            continue
+        vr = _VR.get(keyword, "UI" if keyword.endswith("UID") else "IS" if keyword.startswith("NumberOf") else "LO")
+        result[tag] = {"vr": vr, "Value": [{"Alphabetic": value} if vr == "PN" else value]}
+    return result
+
+
+def tiny_png(width: int = 64, height: int = 64) -> bytes:
+    """PNG en escala de grises, suficiente como respuesta de /preview."""
+    raw = b"".join(b"\x00" + bytes((x + y) % 256 for x in range(width)) for y in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+def matches(tags: dict, query: dict) -> bool:
+    """Criterios de /tools/find: comodines * y ?, rangos de fecha A-B, sin mayúsculas."""
+    for keyword, wanted in query.items():
+        value = str(tags.get(keyword, ""))
+        if keyword.endswith("Date") and "-" in wanted:
+            start, _, end = wanted.partition("-")
+            if (start and value < start) or (end and value > end):
+                return False
+        elif not fnmatch.fnmatchcase(value.upper(), wanted.upper()):
+            return False
+    return True
+
+
+def _instance_resource(series_id: str, index: int, inst: SyntheticInstance) -> dict:
+    return {
+        "ID": inst.orthanc_id,
+        "Type": "Instance",
+        "FileSize": inst.size,
+        "FileUuid": inst.orthanc_id,
+        "IndexInSeries": index + 1,
+        "ParentSeries": series_id,
+        "MainDicomTags": {
+            "SOPInstanceUID": inst.sop_instance_uid,
+            "InstanceNumber": str(inst.instance_number),
+            "NumberOfFrames": str(inst.geometry.frames),
+        },
+    }
+
+
+def create_fake_orthanc(
+    archive: List[SyntheticStudy], link: Link = Link(), extended_find: bool = False
+) -> FastAPI:
+    """
+    App FastAPI que imita a Orthanc sobre `archive`. Con `extended_find` se
+    anuncia como 1.12.5 (`HasExtendedFind`) y /tools/find admite `OrderBy`.
+    """
+    app = FastAPI(title="Fake Orthanc")
+    app.state.calls = Counter()
+    studies, series_index, instances = index_archive(archive)
+    patients = {}
+    for study in archive:
+        patients.setdefault(study.patient_orthanc_id, []).append(study)
+    preview = tiny_png()
+
+    @app.middleware("http")
+    async def simulate_link(request: Request, call_next):
+        await link.delay()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        app.state.calls[route.path if route else request.url.path] += 1
+        return response
+
+    def lookup(index: dict, key: str):
+        if key not in index:
+            raise HTTPException(status_code=404, detail="Unknown resource")
+        return index[key]
+
+    @app.get("/system")
+    async def system():
+        if extended_find:
+            return {
+                "Name": "FakeOrthanc", "Version": "1.12.5", "ApiVersion": 25,
+                "Capabilities": {"HasExtendedChanges": True, "HasExtendedFind": True},
+            }
+        return {"Name": "FakeOrthanc", "Version": "1.12.4", "ApiVersion": 24}
+
+    @app.get("/patients")
+    async def list_patients():
+        return list(patients)
+
+    @app.get("/patients/{patient_id}")
+    async def get_patient(patient_id: str):
+        patient_studies = lookup(patients, patient_id)
+        return {
+            "ID": patient_id,
+            "Type": "Patient",
+            "MainDicomTags": patient_studies[0].patient_tags,
+            "Studies": [s.orthanc_id for s in patient_studies],
+        }
+
+    @app.get("/studies")
+    async def list_studies():
+        return list(studies)
+
+    @app.get("/studies/{study_id}")
+    async def get_study(study_id: str):
+        study = lookup(studies, study_id)
+        return {
+            "ID": study.orthanc_id,
+            "Type": "Study",
+            "IsStable": True,
+            "LastUpdate": _LAST_UPDATE,
+            "ParentPatient": study.patient_orthanc_id,
+            "MainDicomTags": study.tags,
+            "PatientMainDicomTags": study.patient_tags,
+            "Series": [s.orthanc_id for s in study.series],
+        }
+
+    @app.get("/studies/{study_id}/series")
+    async def get_study_series(study_id: str):
+        study = lookup(studies, study_id)
+        return [await get_series(s.orthanc_id) for s in study.series]
+
+    @app.get("/series/{series_id}")
+    async def get_series(series_id: str):
+        study, series = lookup(series_index, series_id)
+        return {
+            "ID": series.orthanc_id,
+            "Type": "Series",
+            "Status": "Unknown",
+            "IsStable": True,
+            "LastUpdate": _LAST_UPDATE,
+            "ParentStudy": study.orthanc_id,
+            "MainDicomTags": series.tags,
+            "Instances": [i.orthanc_id for i in series.instances],
+        }
+
+    @app.get("/series/{series_id}/instances")
+    async def get_series_instances(series_id: str):
+        _, series = lookup(series_index, series_id)
+        return [_instance_resource(series_id, n, i) for n, i in enumerate(series.instances)]
+
+    @app.get("/instances/{instance_id}")
+    async def get_instance(instance_id: str):
+        _, series, inst = lookup(instances, instance_id)
+        return _instance_resource(series.orthanc_id, series.instances.index(inst), inst)
+
+    @app.get("/instances/{instance_id}/file")
+    async def get_instance_file(instance_id: str):
+        _, _, inst = lookup(instances, instance_id)
+        return StreamingResponse(
+            link.throttle(inst.iter_bytes()),
+            media_type="application/dicom",
+            headers={"Content-Length": str(inst.size)},
+        )
+
+    def zip_archive(study: SyntheticStudy, series_list: list):
+        archive = ZipStream()
+        for series in series_list:
+            for inst in series.instances:
+                name = f"{study.patient_tags['PatientID']}/{study.orthanc_id}/{series.orthanc_id}/{inst.orthanc_id}.dcm"
+                yield archive.add(name, inst.to_bytes())
+        yield archive.close()
+
+    @app.get("/series/{series_id}/archive")
+    async def get_series_archive(series_id: str):
+        study, series = lookup(series_index, series_id)
+        return StreamingResponse(link.throttle(zip_archive(study, [series])), media_type="application/zip")
+
+    @app.get("/studies/{study_id}/archive")
+    async def get_study_archive(study_id: str):
+        study = lookup(studies, study_id)
+        return StreamingResponse(link.throttle(zip_archive(study, study.series)), media_type="application/zip")
+
+    @app.get("/instances/{instance_id}/preview")
+    async def get_instance_preview(instance_id: str):
+        lookup(instances, instance_id)
+        await link.pace(len(preview))
+        return Response(preview, media_type="image/png")
+
+    @app.get("/instances/{instance_id}/frames/{frame}/rendered")
+    async def get_instance_frame_rendered(instance_id: str, frame: int):
+        _, _, inst = lookup(instances, instance_id)
+        if not 0 <= frame < inst.geometry.frames:
+            raise HTTPException(status_code=400, detail="Bad frame number")
+        await link.pace(len(preview))
+        return Response(preview, media_type="image/png")
+
+    @app.get("/instances/{instance_id}/frames/{frame}/raw")
+    async def get_instance_frame_raw(instance_id: str, frame: int):
+        _, _, inst = lookup(instances, instance_id)
+        if not 0 <= frame < inst.geometry.frames:
+            raise HTTPException(status_code=400, detail="Bad frame number")
+        size = inst.geometry.pixel_bytes // inst.geometry.frames
+        data = pixel_blob(inst.geometry)[frame * size:(frame + 1) * size]
+        await link.pace(len(data))
+        return Response(data, media_type="application/octet-stream")
+
+    # === DICOMweb ===
+
+    @app.get("/dicom-web/studies")
+    async def qido_studies():
+        return [
+            to_dicom_json({
+                **study.patient_tags, **study.tags,
+                "ModalitiesInStudy": "US",
+                "NumberOfStudyRelatedSeries": len(study.series),
+            })
+            for study in archive
+        ]
+
+    @app.get("/dicom-web/studies/{study_uid}/series")
+    async def qido_series(study_uid: str):
+        study = next((s for s in archive if s.study_instance_uid == study_uid), None)
+        if study is None:
+            raise HTTPException(status_code=404, detail="Unknown study")
+        return [
+            to_dicom_json({**series.tags, "NumberOfSeriesRelatedInstances": len(series.instances)})
+            for series in study.series
+        ]
+
+    @app.get("/dicom-web/studies/{study_uid}/series/{series_uid}")
+    async def wado_series(study_uid: str, series_uid: str):
+        match = [
+            s for study in archive if study.study_instance_uid == study_uid
+            for s in study.series if s.series_instance_uid == series_uid
+        ]
+        if not match:
+            raise HTTPException(status_code=404, detail="Unknown series")
+        boundary = uuid.uuid4().hex
+
+        def parts():
+            for inst in match[0].instances:
+                yield f"--{boundary}\r\nContent-Type: application/dicom\r\n\r\n".encode()
+                yield from inst.iter_bytes()
+                yield b"\r\n"
+            yield f"--{boundary}--\r\n".encode()
+
+        return StreamingResponse(
+            link.throttle(parts()),
+            media_type=f'multipart/related; type="application/dicom"; boundary={boundary}',
+        )
+
+    @app.get("/instances/{instance_id}/simplified-tags")
+    async def get_instance_tags(instance_id: str):
+        _, _, inst = lookup(instances, instance_id)
+        return instance_tags(inst)
+
+    def instance_tags(inst: SyntheticInstance) -> dict:
+        return {
+            **inst.tags,
+            "NumberOfFrames": str(inst.geometry.frames),
+            "Rows": str(inst.geometry.rows),
+            "Columns": str(inst.geometry.columns),
+            "SamplesPerPixel": "3",
+            "PhotometricInterpretation": "RGB",
+            "PlanarConfiguration": "0",
+            "BitsAllocated": "8",
+            "BitsStored": "8",
+            "HighBit": "7",
+            "PixelRepresentation": "0",
+        }
+
+    @app.get("/instances/{instance_id}/metadata/TransferSyntax")
+    async def get_instance_transfer_syntax(instance_id: str):
+        lookup(instances, instance_id)
+        return Response(_EXPLICIT_VR_LITTLE_ENDIAN, media_type="text/plain")
+
+    @app.get("/series/{series_id}/instances-tags")
+    async def get_series_instances_tags(series_id: str):
+        _, series = lookup(series_index, series_id)
+        return {inst.orthanc_id: instance_tags(inst) for inst in series.instances}
+
+    @app.post("/tools/find")
+    async def find(request: Request):
+        body = await request.json()
+        level = body.get("Level", "").lower()
+        query = body.get("Query", {})
+        requested = body.get("RequestedTags", [])
+        limit = body.get("Limit") or 0
+        since = body.get("Since") or 0
+
+        if level == "study":
+            candidates = [
+                ({**study.tags, **study.patient_tags, "ModalitiesInStudy": "US"}, await get_study(study.orthanc_id))
+                for study in archive
+            ]
+        elif level == "instance":
+            candidates = [
+                (instance_tags(inst), _instance_resource(series.orthanc_id, n, inst))
+                for study in archive for series in study.series
+                for n, inst in enumerate(series.instances)
+            ]
+        else:
+            raise HTTPException(status_code=400, detail=f"Unsupported level {level}")
+
+        order_by = body.get("OrderBy", [])
+        if order_by and not extended_find:
+            raise HTTPException(status_code=400, detail="Unknown key: OrderBy")
+        for order in reversed(order_by):
+            candidates.sort(
+                key=lambda candidate: candidate[0].get(order["Key"], ""),
+                reverse=order.get("Direction") == "DESC",
+            )
+
+        found = []
+        for tags, resource in candidates:
+            if not matches(tags, query):
+                continue
+            if since:
+                since -= 1
+                continue
+            if not body.get("Expand"):
+                found.append(resource["ID"])
+                continue
+            if requested:
+                resource = {**resource, "RequestedTags": {k: tags[k] for k in requested if k in tags}}
+            found.append(resource)
+            if limit and len(found) >= limit:
+                break
+        return found
+
+    # Registro de cambios: el archivo completo ya "llegado" al arrancar
+    app.state.changes = []
+
+    def add_change(change_type: str, resource_type: str, resource_id: str) -> int:
+        seq = len(app.state.changes) + 1
+        app.state.changes.append({
+            "ChangeType": change_type,
+            "Date": _LAST_UPDATE,
+            "ID": resource_id,
+            "Path": f"/{resource_type.lower()}s/{resource_id}",
+            "ResourceType": resource_type,
+            "Seq": seq,
+        })
+        return seq
+
+    app.state.add_change = add_change
+    for study in archive:
+        add_change("NewStudy", "Study", study.orthanc_id)
+        for series in study.series:
+            add_change("NewSeries", "Series", series.orthanc_id)
+            for inst in series.instances:
+                add_change("NewInstance", "Instance", inst.orthanc_id)
+        add_change("StableStudy", "Study", study.orthanc_id)
+
+    @app.get("/changes")
+    async def get_changes(request: Request, since: int = 0, limit: int = 100):
+        changes = app.state.changes
+        if "last" in request.query_params:
+            return {"Changes": changes[-1:], "Done": True, "Last": len(changes)}
+        page = changes[since:since + limit]
+        last = page[-1]["Seq"] if page else len(changes)
+        return {"Changes": page, "Done": since + limit >= len(changes), "Last": last}
+
+    return app
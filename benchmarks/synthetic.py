@@ -0,0 +1,186 @@
+"""
+Generador de DICOM sintético para los benchmarks.
+
+Produce series de ecografía multiframe (US Multi-frame Image Storage, RGB de
+8 bits, sin comprimir) del tamaño pedido. Para no inflar la memoria del propio
+benchmark, todas las instancias de una misma geometría comparten un único
+bloque de pixel data: cada archivo es su cabecera propia seguida del
+elemento PixelData, que se sirve por trozos sin concatenarlo.
+"""
+import io
+import struct
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, UltrasoundMultiFrameImageStorage, generate_uid
+
+from src.utils.dicom_ids import orthanc_id
+
+_CHUNK_BYTES = 64 * 1024
+
+
+@dataclass(frozen=True)
+class Geometry:
+    """Tamaño de cada instancia multiframe."""
+    frames: int = 30
+    rows: int = 480
+    columns: int = 640
+
+    @property
+    def pixel_bytes(self) -> int:
+        return self.frames * self.rows * self.columns * 3
+
+
+_pixel_blobs: Dict[Geometry, bytes] = {}
+
+
+def pixel_blob(geometry: Geometry) -> bytes:
+    """Pixel data compartido para una geometría (un degradado que cambia por frame)."""
+    blob = _pixel_blobs.get(geometry)
+    if blob is None:
+        row = bytes(i % 256 for i in range(geometry.columns * 3))
+        frame = row * geometry.rows
+        blob = b"".join(frame[f % len(row):] + frame[:f % len(row)] for f in range(geometry.frames))
+        _pixel_blobs[geometry] = blob
+    return blob
+
+
+@dataclass
+class SyntheticInstance:
+    orthanc_id: str
+    sop_instance_uid: str
+    instance_number: int
+    header: bytes
+    geometry: Geometry
+    tags: dict
+
+    @property
+    def size(self) -> int:
+        return len(self.header) + 12 + self.geometry.pixel_bytes
+
+    def iter_bytes(self, chunk_size: int = _CHUNK_BYTES) -> Iterator[bytes]:
+        """Contenido del archivo DICOM por trozos (cabecera + PixelData compartido)."""
+        length = self.geometry.pixel_bytes
+        yield self.header + struct.pack("<HH2sHI", 0x7FE0, 0x0010, b"OB", 0, length)
+        view = memoryview(pixel_blob(self.geometry))
+        for start in range(0, length, chunk_size):
+            yield bytes(view[start:start + chunk_size])
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.iter_bytes())
+
+
+@dataclass
+class SyntheticSeries:
+    orthanc_id: str
+    series_instance_uid: str
+    tags: dict
+    instances: List[SyntheticInstance] = field(default_factory=list)
+
+
+@dataclass
+class SyntheticStudy:
+    orthanc_id: str
+    study_instance_uid: str
+    patient_orthanc_id: str
+    tags: dict
+    patient_tags: dict
+    series: List[SyntheticSeries] = field(default_factory=list)
+
+
+def _header(tags: dict, geometry: Geometry) -> bytes:
+    """Archivo DICOM completo salvo el elemento PixelData (que va al final)."""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = UltrasoundMultiFrameImageStorage
+    meta.MediaStorageSOPInstanceUID = tags["SOPInstanceUID"]
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    ds.SOPClassUID = UltrasoundMultiFrameImageStorage
+    for keyword, value in tags.items():
+        setattr(ds, keyword, value)
+    ds.SamplesPerPixel = 3
+    ds.PhotometricInterpretation = "RGB"
+    ds.PlanarConfiguration = 0
+    ds.NumberOfFrames = geometry.frames
+    ds.Rows = geometry.rows
+    ds.Columns = geometry.columns
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    ds.FrameTime = 33.3
+
+    buffer = io.BytesIO()
+    ds.save_as(buffer, write_like_original=False)
+    return buffer.getvalue()
+
+
+def generate_archive(
+    studies: int = 2,
+    series_per_study: int = 2,
+    instances_per_series: int = 10,
+    geometry: Geometry = Geometry(),
+) -> List[SyntheticStudy]:
+    """Generar un archivo completo de pacientes → estudios → series → instancias."""
+    archive = []
+    for s in range(studies):
+        patient_id = f"NEO{s:04d}"
+        patient_tags = {"PatientID": patient_id, "PatientName": f"BENCH^PACIENTE{s}",
+                        "PatientBirthDate": "20240101", "PatientSex": "F"}
+        study_uid = generate_uid()
+        study = SyntheticStudy(
+            orthanc_id=orthanc_id(patient_id, study_uid),
+            study_instance_uid=study_uid,
+            patient_orthanc_id=orthanc_id(patient_id),
+            tags={"StudyInstanceUID": study_uid, "StudyDate": "20240601",
+                  "StudyDescription": "ECOGRAFIA TRANSFONTANELAR",
+                  "InstitutionName": "HOSPITAL BENCH", "AccessionNumber": f"ACC{s:06d}"},
+            patient_tags=patient_tags,
+        )
+
+        for r in range(series_per_study):
+            series_uid = generate_uid()
+            series = SyntheticSeries(
+                orthanc_id=orthanc_id(patient_id, study_uid, series_uid),
+                series_instance_uid=series_uid,
+                tags={"SeriesInstanceUID": series_uid, "Modality": "US",
+                      "SeriesDescription": f"CINE {r + 1}", "SeriesNumber": str(r + 1)},
+            )
+
+            for i in range(instances_per_series):
+                sop_uid = generate_uid()
+                tags = {
+                    **patient_tags, **study.tags, **series.tags,
+                    "SOPInstanceUID": sop_uid,
+                    "InstanceNumber": str(i + 1),
+                    "AcquisitionDateTime": f"20240601{10 + i // 60:02d}{i % 60:02d}00",
+                }
+                series.instances.append(SyntheticInstance(
+                    orthanc_id=orthanc_id(patient_id, study_uid, series_uid, sop_uid),
+                    sop_instance_uid=sop_uid,
+                    instance_number=i + 1,
+                    header=_header(tags, geometry),
+                    geometry=geometry,
+                    tags=tags,
+                ))
+
+            study.series.append(series)
+        archive.append(study)
+    return archive
+
+
+def index_archive(archive: List[SyntheticStudy]) -> Tuple[dict, dict, dict]:
+    """Índices por ID Orthanc: estudios, series e instancias (con su serie)."""
+    studies, series, instances = {}, {}, {}
+    for study in archive:
+        studies[study.orthanc_id] = study
+        for s in study.series:
+            series[s.orthanc_id] = (study, s)
+            for inst in s.instances:
+                instances[inst.orthanc_id] = (study, s, inst)
+    return studies, series, instances
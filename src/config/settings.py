@@ -1,6 +1,42 @@
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class PacsBackend(BaseModel):
+    """
+    Un PACS (Orthanc) con nombre. Las URLs son réplicas de lectura del mismo
+    archivo: las peticiones se reparten entre ellas.
+    """
+    name: str
+    urls: List[str] = Field(min_length=1)
+    username: str = "orthanc"
+    password: str = "orthanc"
+    timeout_seconds: Optional[float] = None
+    # DIMSE: sin puerto DICOM el backend solo se usa por HTTP
+    dicom_host: Optional[str] = None  # vacío = host de la primera URL
+    dicom_port: Optional[int] = None
+    ae_title: str = "ORTHANC"
+
+
+class AutoRouteRule(BaseModel):
+    """
+    Regla de enrutado automático: un estudio estable que cumple todos los
+    criterios (listas vacías = cualquiera; admiten comodines * y ?) se envía
+    al neonato que le corresponde según `patient_neonato_map`.
+    """
+    name: str
+    modalities: List[str] = []
+    institutions: List[str] = []
+    patient_ids: List[str] = []
+    backends: List[str] = []
+    uploader_medico_id: Optional[int] = None  # vacío = autoroute_uploader_medico_id
+    sede_id: Optional[int] = None
+
+
 class Settings(BaseSettings):
     """Configuración centralizada de ATIM cargada desde variables de entorno."""
 
@@ -13,6 +49,21 @@ class Settings(BaseSettings):
     # Server
     host: str = "0.0.0.0"
     port: int = 8000
+    server_workers: int = 0  # 0 = según las CPUs disponibles
+    server_max_requests: int = 0  # reciclar cada worker tras N peticiones (0 = nunca)
+    server_graceful_timeout_seconds: float = 30.0
+    # Al apagar: tiempo máximo para terminar las transferencias en segundo
+    # plano (Storage SCP, enrutado automático) tras las peticiones HTTP
+    shutdown_drain_seconds: float = 20.0
+    # Cachés calientes (metadatos, ubicaciones, neonatos) guardadas al apagar
+    # y cargadas al arrancar; vacío = deshabilitado
+    cache_snapshot_path: str = ""
+    # Esquema OpenAPI generado al construir la imagen (python -m src.openapi)
+    openapi_schema_path: str = "openapi.json"
+
+    # Caché compartida entre workers (SQLite); vacía = deshabilitada
+    shared_cache_path: str = ""
+    shared_cache_max_mb: int = 512
 
     # Orthanc (PACS)
     orthanc_host: str = "localhost"
@@ -21,11 +72,134 @@ class Settings(BaseSettings):
     orthanc_username: str = "orthanc"
     orthanc_password: str = "orthanc"
     orthanc_use_dicomweb: bool = True
+    orthanc_single_flight: bool = True
+    # 0 = sin caché de metadatos; con PREFETCH_ENABLED las previews se
+    # precargan igual, pero las listas de instancias solo se calientan con un
+    # TTL mayor que 0 (si no, solo se piden para elegir las previews)
+    orthanc_metadata_cache_ttl_seconds: float = 0.0
+    orthanc_preview_cache_ttl_seconds: float = 900.0
+    # Búsquedas en Orthanc < 1.12.5 (sin OrderBy): coincidencias que se
+    # recorren como mucho para quedarse con las más recientes
+    orthanc_find_max_scan: int = 5000
+    orthanc_ae_title: str = "ORTHANC"
+
+    # DIMSE: recuperar series completas con C-GET contra el puerto DICOM de
+    # Orthanc (que debe conocer a ATIM en DicomModalities o permitir C-GET)
+    dimse_enabled: bool = False
+    dimse_ae_title: str = "ATIM"
+    dimse_max_associations: int = 2  # por backend
+    dimse_idle_seconds: float = 20.0  # cerrar asociaciones ociosas tras este tiempo
+    dimse_timeout_seconds: float = 60.0
+    dimse_spool_dir: str = ""  # vacío = directorio temporal del sistema
+
+    # Storage SCP embebido: recibe instancias por C-STORE (AE dimse_ae_title)
+    # y las reenvía directamente a JoyCare sin pasar por Orthanc
+    storage_scp_enabled: bool = False
+    storage_scp_port: int = 11112
+    storage_scp_queue_size: int = 16  # instancias en espera de subir
+    storage_scp_upload_concurrency: int = 2
+    storage_scp_enqueue_timeout_seconds: float = 30.0
+    storage_scp_uploader_medico_id: Optional[int] = None
+    storage_scp_sede_id: Optional[int] = None
+    storage_scp_upload_retries: int = 3  # reintentos de errores transitorios de JoyCare
+    storage_scp_retry_backoff_seconds: float = 2.0  # espera inicial (se duplica)
+    storage_scp_rescan_seconds: float = 300.0  # cada cuánto se reencola lo que quedó en el spool
+    # PatientID DICOM → neonato de JoyCare (JSON)
+    patient_neonato_map: Dict[str, int] = {}
+
+    # Federación de PACS: lista JSON de backends con nombre. Si está vacía se
+    # usa un único backend "orthanc" construido a partir de orthanc_host/puerto
+    pacs_backends: List[PacsBackend] = []
+    pacs_fanout_timeout_seconds: float = 10.0
+
+    # Prefetch (precarga de instancias y previews al abrir un estudio)
+    prefetch_enabled: bool = False
+    prefetch_previews_per_series: int = 4
+    prefetch_concurrency: int = 2
+    prefetch_budget_seconds: float = 10.0
+    prefetch_max_active: int = 4
+
+    # Previews renderizadas en ATIM (pydicom + NumPy en un pool de procesos)
+    # en lugar de la PNG de Orthanc
+    preview_local_render: bool = False
+    preview_size: int = 256  # lado mayor en píxeles
+    preview_format: str = "png"  # png, jpeg o webp
+    preview_quality: int = 80
+    preview_render_workers: int = 2  # procesos por worker de ATIM
+
+    # Mosaico de una serie: todas sus miniaturas en una sola imagen
+    mosaic_tile_size: int = 128
+    mosaic_format: str = "jpeg"
+    mosaic_quality: int = 80
+    mosaic_concurrency: int = 8  # miniaturas renderizándose a la vez
+    mosaic_max_instances: int = 1024
+    mosaic_max_pixels: int = 32 * 1024 * 1024  # lienzo máximo (RGB: 3 bytes por píxel)
+    mosaic_cache_ttl_seconds: float = 3600.0
+
+    # Descarga de series y estudios en ZIP: generado en streaming por ATIM o,
+    # con archive_proxy_orthanc, el /archive de Orthanc reenviado tal cual
+    archive_proxy_orthanc: bool = False
+    archive_concurrency: int = 4  # instancias descargándose por adelantado
+    archive_compression: str = "stored"  # stored o deflated
+
+    # Frames de instancias multiframe (cine de ecografía)
+    frames_jpeg_quality: int = 90
+    frames_stream_concurrency: int = 4  # frames pedidos por adelantado al hacer streaming
+
+    # Eventos (SSE): un único poller de /changes por backend los reparte a
+    # todos los clientes conectados
+    changes_poll_interval_seconds: float = 2.0
+    changes_batch_limit: int = 100
+    changes_event_types: List[str] = ["NewStudy", "NewSeries", "NewInstance", "StableStudy", "StableSeries"]
+    changes_buffer_size: int = 1000  # eventos recientes para reanudar con Last-Event-ID
+    changes_client_queue_size: int = 256  # un cliente más lento que esto se desconecta
+    changes_heartbeat_seconds: float = 15.0
+    changes_idle_seconds: float = 60.0  # parar el poller tras este tiempo sin clientes
+
+    # Enrutado automático: los estudios estables (StableStudy) que cumplen
+    # alguna regla se transfieren solos a JoyCare, en lotes y en segundo plano
+    autoroute_enabled: bool = False
+    autoroute_rules: List[AutoRouteRule] = []
+    autoroute_uploader_medico_id: Optional[int] = None
+    autoroute_sede_id: Optional[int] = None
+    autoroute_batch_size: int = 8  # estudios por lote
+    autoroute_batch_seconds: float = 5.0  # espera máxima para completar un lote
+    autoroute_concurrency: int = 2  # series transfiriéndose a la vez
+    autoroute_window: str = ""  # p. ej. "20:00-07:00"; vacío = siempre
+    autoroute_retry_seconds: float = 60.0
+    autoroute_max_retries: int = 5  # reintentos de un estudio con instancias fallidas
+
+    # Control de admisión de transferencias: lo que no cabe espera en cola y,
+    # si la cola está llena o se agota la espera, se responde 429
+    transfer_max_concurrent: int = 4
+    transfer_max_inflight_bytes: int = 512 * 1024 * 1024
+    transfer_max_queued: int = 16
+    transfer_queue_timeout_seconds: float = 30.0
+
+    # Planificador por prioridad de las llamadas a Orthanc (por backend) y a
+    # JoyCare: lo interactivo tiene huecos reservados que lo masivo no ocupa
+    scheduler_orthanc_concurrency: int = 16
+    scheduler_joycare_concurrency: int = 8
+    scheduler_interactive_reserved: int = 4
+    # Concurrencia adaptativa: las capacidades anteriores son solo el punto de
+    # partida y se ajustan según la latencia y los errores de cada upstream
+    scheduler_adaptive: bool = True
+    scheduler_adaptive_min: int = 2
+    scheduler_adaptive_max: int = 64
+    scheduler_adaptive_tolerance: float = 2.0  # latencia reciente / de referencia tolerada
+    scheduler_adaptive_backoff: float = 0.9  # factor al que baja el límite tras un error
 
     # JoyCare
     joycare_host: str = "joycare-backend"
     joycare_port: int = 3000
     joycare_upload_endpoint: str = "/api/upload"
+    # Subida por partes reanudable; los archivos pequeños van en una sola petición
+    joycare_chunked_upload: bool = True
+    joycare_chunked_threshold_bytes: int = 8 * 1024 * 1024
+    joycare_chunk_size_bytes: int = 4 * 1024 * 1024
+    joycare_upload_part_timeout_seconds: float = 60.0
+    joycare_upload_part_retries: int = 5
+    joycare_neonatos_cache_ttl_seconds: float = 300.0
 
     # Security
     secret_key: str = "cambiar-esto-en-produccion-con-algo-seguro"
@@ -43,6 +217,26 @@ class Settings(BaseSettings):
         """URL de DICOMweb de Orthanc."""
         return f"{self.orthanc_url}/dicom-web"
 
+    @property
+    def resolved_pacs_backends(self) -> List[PacsBackend]:
+        """Backends PACS configurados; el primero es el principal."""
+        if self.pacs_backends:
+            return self.pacs_backends
+        return [PacsBackend(
+            name="orthanc",
+            urls=[self.orthanc_url],
+            username=self.orthanc_username,
+            password=self.orthanc_password,
+            dicom_host=self.orthanc_host,
+            dicom_port=self.orthanc_dicom_port,
+            ae_title=self.orthanc_ae_title,
+        )]
+
+    @property
+    def resolved_dimse_spool_dir(self) -> str:
+        """Directorio donde se escriben las instancias recibidas por DIMSE."""
+        return self.dimse_spool_dir or os.path.join(tempfile.gettempdir(), "atim-dimse")
+
     @property
     def joycare_url(self) -> str:
         """URL base de JoyCare."""
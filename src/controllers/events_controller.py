@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from src.config.settings import Settings, get_settings
+from src.services.changes_service import change_feed
+
+router = APIRouter()
+
+
+# ============================
+# EVENTOS (SSE)
+# ============================
+
+@router.get(
+    "/events",
+    summary="Eventos de llegada de estudios (SSE)",
+    description=(
+        "Flujo `text/event-stream` con la llegada de estudios, series e "
+        "instancias al PACS (`NewStudy`, `NewSeries`, `NewInstance`, "
+        "`StableStudy`, `StableSeries`), para no tener que sondear `/studies`. "
+        "Un único poller de `/changes` por PACS alimenta a todos los clientes. "
+        "Al reconectarse, el navegador envía `Last-Event-ID` y se reenvía lo "
+        "perdido; si ya no está disponible llega un evento `reset` y conviene "
+        "recargar el listado."
+    ),
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}}
+)
+async def stream_events(
+    types: Optional[str] = Query(None, description="Tipos de cambio separados por comas (todos si se omite)"),
+    last_event_id: Optional[str] = Query(None, description="Reanudar tras este ID (alternativa a la cabecera)"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    settings: Settings = Depends(get_settings)
+):
+    wanted = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    return StreamingResponse(
+        change_feed.stream(settings, last_event_id_header or last_event_id, wanted),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,8 +1,23 @@
 from fastapi import APIRouter, Depends
+from typing import List
 
 from src.config.settings import Settings, get_settings
 from src.services.health_service import HealthService
-from src.models.schemas import HealthResponse, PacsStatusResponse
+from src.utils.startup_timing import startup_timer
+from src.models.schemas import (
+    HealthResponse,
+    PacsStatusResponse,
+    SingleFlightStats,
+    CacheStats,
+    PrefetchStats,
+    PacsBackendStatus,
+    DimsePoolStats,
+    StorageScpStats,
+    TransferAdmissionStats,
+    SchedulerStats,
+    ChangeFeedStats,
+    AutoRouteStats,
+)
 
 router = APIRouter()
 
@@ -19,7 +34,9 @@ def get_health_service(settings: Settings = Depends(get_settings)) -> HealthServ
     description="Verifica que la API ATIM esté funcionando correctamente."
 )
 def health_check(service: HealthService = Depends(get_health_service)):
-    return service.get_health()
+    health = service.get_health()
+    startup_timer.healthy()
+    return health
 
 
 @router.get(
@@ -29,4 +46,130 @@ def health_check(service: HealthService = Depends(get_health_service)):
     description="Verifica la conexión con Orthanc (PACS) y la disponibilidad de DICOMweb."
 )
 async def pacs_status(service: HealthService = Depends(get_health_service)):
-    return await service.get_pacs_status()
\ No newline at end of file
+    return await service.get_pacs_status()
+
+
+@router.get(
+    "/health/pacs/backends",
+    response_model=List[PacsBackendStatus],
+    summary="Backends PACS federados",
+    description=(
+        "Lista los PACS configurados y, para cada réplica de lectura, las "
+        "peticiones en curso, servidas y los fallos de conexión."
+    )
+)
+def pacs_backends(service: HealthService = Depends(get_health_service)):
+    return service.get_pacs_backends()
+
+
+@router.get(
+    "/health/single-flight",
+    response_model=SingleFlightStats,
+    summary="Coalescencia de peticiones",
+    description=(
+        "Contadores de las llamadas idénticas a Orthanc que se compartieron "
+        "en lugar de repetirse (detalle de estudio, instancias de serie y previews)."
+    )
+)
+def single_flight_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_single_flight_stats()
+
+
+@router.get(
+    "/health/caches",
+    response_model=List[CacheStats],
+    summary="Estado de las cachés",
+    description="Entradas, bytes, aciertos y fallos de las cachés en memoria de ATIM."
+)
+def cache_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_cache_stats()
+
+
+@router.get(
+    "/health/prefetch",
+    response_model=PrefetchStats,
+    summary="Estado del prefetch",
+    description="Contadores de la precarga de instancias y previews al abrir un estudio."
+)
+def prefetch_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_prefetch_stats()
+
+
+@router.get(
+    "/health/dimse",
+    response_model=List[DimsePoolStats],
+    summary="Asociaciones DIMSE",
+    description=(
+        "Asociaciones C-GET abiertas con cada PACS: en uso, ociosas, "
+        "abiertas, reutilizadas y rechazadas."
+    )
+)
+def dimse_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_dimse_stats()
+
+
+@router.get(
+    "/health/storage-scp",
+    response_model=StorageScpStats,
+    summary="Storage SCP embebido",
+    description=(
+        "Instancias recibidas por C-STORE, reenviadas a JoyCare, rechazadas y "
+        "en cola, y cuántas veces se frenó al emisor por la cola llena."
+    )
+)
+def storage_scp_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_storage_scp_stats()
+
+
+@router.get(
+    "/health/transfers",
+    response_model=TransferAdmissionStats,
+    summary="Control de admisión de transferencias",
+    description=(
+        "Transferencias en curso y en cola, bytes reservados frente al "
+        "presupuesto, rechazos (429) y espera media en cola."
+    )
+)
+def transfer_admission_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_transfer_admission_stats()
+
+
+@router.get(
+    "/health/scheduler",
+    response_model=List[SchedulerStats],
+    summary="Planificador por prioridad",
+    description=(
+        "Capacidad de cada upstream (Orthanc por backend y JoyCare), huecos "
+        "reservados para lo interactivo, espera en cola por clase de prioridad "
+        "y, con concurrencia adaptativa, el límite actual y su historial."
+    )
+)
+def scheduler_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_scheduler_stats()
+
+
+@router.get(
+    "/health/events",
+    response_model=ChangeFeedStats,
+    summary="Eventos (SSE)",
+    description=(
+        "Clientes conectados al flujo de eventos, eventos publicados y "
+        "reenviados al reconectar, y sondeos del registro /changes de Orthanc."
+    )
+)
+def change_feed_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_change_feed_stats()
+
+
+@router.get(
+    "/health/autoroute",
+    response_model=AutoRouteStats,
+    summary="Enrutado automático",
+    description=(
+        "Estudios estables evaluados, los que cumplen alguna regla, en cola y "
+        "enviados, instancias transferidas u omitidas por ya enviadas, y "
+        "reintentos por falta de capacidad."
+    )
+)
+def autoroute_stats(service: HealthService = Depends(get_health_service)):
+    return service.get_autoroute_stats()
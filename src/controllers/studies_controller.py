@@ -1,19 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Optional
 
 from src.config.settings import Settings, get_settings
-from src.services.studies_service import StudiesService
+from src.services.studies_service import FRAME_MEDIA_TYPES, MosaicTooLarge, StudiesService
 from src.models.schemas import (
     PatientSummary,
     StudySummary,
     StudyDetail,
     InstanceSummary,
+    InstanceTags,
+    SeriesMosaic,
     ErrorResponse,
 )
 
 router = APIRouter()
 
+_DATE_PATTERN = r"^\d{4}-?\d{2}-?\d{2}$"
+_FRAME_FORMAT_PATTERN = r"^(jpeg|png|raw)$"
+_PREVIEW_FORMAT_PATTERN = r"^(jpeg|png|webp)$"
+
 
 def get_studies_service(settings: Settings = Depends(get_settings)) -> StudiesService:
     """Inyección de dependencias para el servicio de estudios."""
@@ -56,6 +62,40 @@ async def list_studies(service: StudiesService = Depends(get_studies_service)):
         raise HTTPException(status_code=502, detail=f"Error al conectar con Orthanc: {str(e)}")
 
 
+@router.get(
+    "/studies/search",
+    response_model=List[StudySummary],
+    summary="Buscar estudios",
+    description=(
+        "Busca estudios por paciente, fechas y modalidad. Los filtros se "
+        "resuelven en Orthanc con una sola consulta, así que solo viajan los "
+        "estudios que coinciden. Nombre e ID de paciente admiten comodines "
+        "`*` y `?` (p. ej. `GARCIA*`)."
+    ),
+    responses={502: {"model": ErrorResponse}}
+)
+async def search_studies(
+    patient_name: Optional[str] = Query(None, description="Nombre del paciente (DICOM PN, admite comodines)"),
+    patient_id: Optional[str] = Query(None, description="PatientID (admite comodines)"),
+    date_from: Optional[str] = Query(None, pattern=_DATE_PATTERN, description="Fecha inicial (AAAAMMDD o AAAA-MM-DD)"),
+    date_to: Optional[str] = Query(None, pattern=_DATE_PATTERN, description="Fecha final (AAAAMMDD o AAAA-MM-DD)"),
+    modality: Optional[str] = Query(None, description="Modalidad, p. ej. US"),
+    limit: int = Query(100, ge=1, le=1000, description="Máximo de estudios devueltos"),
+    service: StudiesService = Depends(get_studies_service)
+):
+    try:
+        return await service.search_studies(
+            patient_name=patient_name,
+            patient_id=patient_id,
+            date_from=date_from.replace("-", "") if date_from else None,
+            date_to=date_to.replace("-", "") if date_to else None,
+            modality=modality,
+            limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error al conectar con Orthanc: {str(e)}")
+
+
 @router.get(
     "/studies/{study_id}",
     response_model=StudyDetail,
@@ -93,6 +133,87 @@ async def list_series_instances(
         raise HTTPException(status_code=502, detail=f"Error al conectar con Orthanc: {str(e)}")
 
 
+@router.get(
+    "/series/{series_id}/tags",
+    response_model=List[InstanceTags],
+    summary="Tags DICOM de todas las instancias de una serie",
+    description=(
+        "Obtiene los tags de todas las instancias de una serie con una sola "
+        "llamada a Orthanc. Con `fields` solo se leen y devuelven esos tags."
+    ),
+    responses={502: {"model": ErrorResponse}}
+)
+async def get_series_tags(
+    series_id: str,
+    fields: Optional[str] = Query(
+        None,
+        description="Tags separados por comas, p. ej. `AcquisitionDateTime,InstanceNumber`"
+    ),
+    service: StudiesService = Depends(get_studies_service)
+):
+    requested = [field.strip() for field in (fields or "").split(",") if field.strip()]
+    try:
+        return await service.get_series_tags(series_id, requested)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error al obtener tags: {str(e)}")
+
+
+@router.get(
+    "/series/{series_id}/mosaic",
+    summary="Mosaico de miniaturas de una serie",
+    description=(
+        "Una sola imagen con la miniatura de cada instancia de la serie (por "
+        "InstanceNumber) en una rejilla de recuadros de `tile` píxeles, en "
+        "lugar de una preview por instancia. La posición de cada instancia "
+        "está en `/series/{id}/mosaic/index` con los mismos parámetros."
+    ),
+    responses={404: {"model": ErrorResponse}, 422: {"model": ErrorResponse}, 502: {"model": ErrorResponse}}
+)
+async def get_series_mosaic(
+    series_id: str,
+    tile: Optional[int] = Query(None, ge=16, le=512),
+    columns: Optional[int] = Query(None, ge=1, le=64),
+    format: Optional[str] = Query(None, pattern=_PREVIEW_FORMAT_PATTERN),
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    service: StudiesService = Depends(get_studies_service)
+):
+    try:
+        image, index = await service.get_series_mosaic(series_id, tile, columns, format, quality)
+    except MosaicTooLarge as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail=f"Serie {series_id} no encontrada")
+        raise HTTPException(status_code=502, detail=f"Error al generar el mosaico: {str(e)}")
+    return Response(content=image, media_type=FRAME_MEDIA_TYPES[index.format])
+
+
+@router.get(
+    "/series/{series_id}/mosaic/index",
+    response_model=SeriesMosaic,
+    summary="Índice del mosaico de una serie",
+    description="Rectángulo (x, y, ancho, alto) de cada instancia dentro del mosaico.",
+    responses={404: {"model": ErrorResponse}, 422: {"model": ErrorResponse}, 502: {"model": ErrorResponse}}
+)
+async def get_series_mosaic_index(
+    series_id: str,
+    tile: Optional[int] = Query(None, ge=16, le=512),
+    columns: Optional[int] = Query(None, ge=1, le=64),
+    format: Optional[str] = Query(None, pattern=_PREVIEW_FORMAT_PATTERN),
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    service: StudiesService = Depends(get_studies_service)
+):
+    try:
+        _, index = await service.get_series_mosaic(series_id, tile, columns, format, quality)
+    except MosaicTooLarge as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail=f"Serie {series_id} no encontrada")
+        raise HTTPException(status_code=502, detail=f"Error al generar el mosaico: {str(e)}")
+    return index
+
+
 # ============================
 # INSTANCIAS (Descarga)
 # ============================
@@ -120,26 +241,147 @@ async def download_instance_file(
         raise HTTPException(status_code=502, detail=f"Error al descargar: {str(e)}")
 
 
+@router.get(
+    "/series/{series_id}/archive",
+    summary="Descargar una serie en ZIP",
+    description=(
+        "ZIP con todos los archivos DICOM de la serie, generado mientras se "
+        "descargan de Orthanc (memoria constante, sin archivos temporales), "
+        "con nombres al estilo DICOMDIR: `DICOM/PAT00001/STU00001/SER00001/IMG00001`."
+    ),
+    responses={404: {"model": ErrorResponse}, 502: {"model": ErrorResponse}}
+)
+async def download_series_archive(
+    series_id: str,
+    service: StudiesService = Depends(get_studies_service)
+):
+    try:
+        chunks = await service.archive_series(series_id)
+    except Exception as e:
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail=f"Serie {series_id} no encontrada")
+        raise HTTPException(status_code=502, detail=f"Error al generar el ZIP: {str(e)}")
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={series_id}.zip"}
+    )
+
+
+@router.get(
+    "/studies/{study_id}/archive",
+    summary="Descargar un estudio en ZIP",
+    description=(
+        "ZIP con todas las series del estudio (`SER00001`, `SER00002`... por "
+        "SeriesNumber), generado en streaming como el de una serie."
+    ),
+    responses={404: {"model": ErrorResponse}, 502: {"model": ErrorResponse}}
+)
+async def download_study_archive(
+    study_id: str,
+    service: StudiesService = Depends(get_studies_service)
+):
+    try:
+        chunks = await service.archive_study(study_id)
+    except Exception as e:
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail=f"Estudio {study_id} no encontrado")
+        raise HTTPException(status_code=502, detail=f"Error al generar el ZIP: {str(e)}")
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={study_id}.zip"}
+    )
+
+
 @router.get(
     "/instances/{instance_id}/preview",
     summary="Vista previa de imagen",
-    description="Obtiene una vista previa PNG de la instancia DICOM.",
+    description=(
+        "Miniatura del primer frame de la instancia, renderizada en ATIM: lado "
+        "mayor `size`, formato y calidad, y ventana/nivel (`wc`/`ww`, por "
+        "defecto los del archivo). Con el render local deshabilitado y sin "
+        "parámetros, la PNG de Orthanc."
+    ),
     responses={502: {"model": ErrorResponse}}
 )
 async def get_instance_preview(
     instance_id: str,
+    size: Optional[int] = Query(None, ge=16, le=2048),
+    format: Optional[str] = Query(None, pattern=_PREVIEW_FORMAT_PATTERN),
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    wc: Optional[float] = Query(None, description="Centro de ventana"),
+    ww: Optional[float] = Query(None, gt=0, description="Ancho de ventana"),
     service: StudiesService = Depends(get_studies_service)
 ):
     try:
-        preview_bytes = await service.get_instance_preview(instance_id)
+        preview_bytes, media_type = await service.get_instance_preview(
+            instance_id, size, format, quality, wc, ww
+        )
         return Response(
             content=preview_bytes,
-            media_type="image/png"
+            media_type=media_type
         )
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Error al obtener preview: {str(e)}")
 
 
+@router.get(
+    "/instances/{instance_id}/frames/{frame}",
+    summary="Un frame de una instancia multiframe",
+    description=(
+        "Obtiene solo el frame pedido (índice desde 0) sin descargar el archivo "
+        "completo: renderizado en JPEG o PNG, o `raw` con los bytes tal como "
+        "están almacenados (p. ej. el fragmento JPEG de un cine)."
+    ),
+    responses={404: {"model": ErrorResponse}, 502: {"model": ErrorResponse}}
+)
+async def get_instance_frame(
+    instance_id: str,
+    frame: int,
+    format: str = Query("jpeg", pattern=_FRAME_FORMAT_PATTERN),
+    service: StudiesService = Depends(get_studies_service)
+):
+    try:
+        frame_bytes = await service.get_instance_frame(instance_id, frame, format)
+        return Response(content=frame_bytes, media_type=FRAME_MEDIA_TYPES[format])
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail=f"Instancia {instance_id} no encontrada")
+        raise HTTPException(status_code=502, detail=f"Error al obtener frame: {str(e)}")
+
+
+@router.get(
+    "/instances/{instance_id}/frames",
+    summary="Streaming de un rango de frames",
+    description=(
+        "Entrega los frames `start`..`end` (inclusive, desde 0; por defecto "
+        "todos) como `multipart/mixed`, una parte por frame en orden y en "
+        "cuanto está disponible, para empezar la reproducción sin esperar al "
+        "clip completo. Cada parte lleva la cabecera `X-Frame-Index`."
+    ),
+    responses={404: {"model": ErrorResponse}, 502: {"model": ErrorResponse}}
+)
+async def stream_instance_frames(
+    instance_id: str,
+    start: int = Query(0, ge=0),
+    end: Optional[int] = Query(None, ge=0),
+    format: str = Query("jpeg", pattern=_FRAME_FORMAT_PATTERN),
+    service: StudiesService = Depends(get_studies_service)
+):
+    try:
+        parts, boundary = await service.stream_instance_frames(instance_id, start, end, format)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        if "404" in str(e):
+            raise HTTPException(status_code=404, detail=f"Instancia {instance_id} no encontrada")
+        raise HTTPException(status_code=502, detail=f"Error al obtener frames: {str(e)}")
+    return StreamingResponse(parts, media_type=f"multipart/mixed; boundary={boundary}")
+
+
 @router.get(
     "/instances/{instance_id}/tags",
     summary="Tags DICOM de una instancia",
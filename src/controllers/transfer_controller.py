@@ -4,6 +4,7 @@ from typing import Optional
 
 from src.config.settings import Settings, get_settings
 from src.services.transfer_service import TransferService
+from src.utils.admission import AdmissionRejected
 from src.models.schemas import (
     TransferInstanceRequest,
     TransferSeriesRequest,
@@ -20,6 +21,15 @@ def get_transfer_service(settings: Settings = Depends(get_settings)) -> Transfer
     return TransferService(settings)
 
 
+def _too_many_requests(e: AdmissionRejected) -> HTTPException:
+    """429 con Retry-After cuando el control de admisión rechaza la transferencia."""
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
 # ============================
 # ESTADO DE JOYCARE
 # ============================
@@ -64,6 +74,7 @@ async def list_joycare_neonatos(service: TransferService = Depends(get_transfer_
     ),
     responses={
         400: {"model": ErrorResponse},
+        429: {"model": ErrorResponse},
         502: {"model": ErrorResponse}
     }
 )
@@ -79,6 +90,8 @@ async def transfer_instance(
             sede_id=request.sede_id
         )
         return result
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except httpx.HTTPStatusError as e:
         if e.response.status_code == 404:
             raise HTTPException(
@@ -100,6 +113,7 @@ async def transfer_instance(
     ),
     responses={
         400: {"model": ErrorResponse},
+        429: {"model": ErrorResponse},
         502: {"model": ErrorResponse}
     }
 )
@@ -115,5 +129,7 @@ async def transfer_series(
             sede_id=request.sede_id
         )
         return result
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Error en la transferencia: {str(e)}")
\ No newline at end of file
@@ -1,11 +1,28 @@
+# Antes que nada: medir lo que tarda en importarse cada módulo
+from src.utils.startup_timing import startup_timer
+startup_timer.install()
+
+import asyncio
 import logging
+import time
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from src.config.settings import get_settings
+from src.repositories.joycare_repository import joycare_neonatos_cache
+from src.repositories.orthanc_repository import orthanc_metadata_cache
+from src.repositories.pacs_federation import resource_locations
+from src.utils.cache_snapshot import load_snapshot, save_snapshot
+from src.utils.preview_render import shutdown_render_pool
+from src.services.autoroute_service import auto_router
+from src.services.changes_service import change_feed
+from src.services.storage_scp_service import storage_scp
+from src.services.transfer_service import transfer_admission
 from src.routes.router import api_router
 from src.middlewares.logging_middleware import logging_middleware
+from src.openapi import use_precomputed_openapi
 
 # Configurar logging
 logging.basicConfig(
@@ -15,6 +32,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger("atim")
 
+# Cachés que sobreviven a un reinicio (CACHE_SNAPSHOT_PATH): metadatos y
+# ubicaciones de Orthanc y neonatos de JoyCare. Las previews no: son
+# binarias, grandes y se regeneran solas. Lo ya enrutado lo persiste el
+# propio enrutado en el spool
+SNAPSHOT_CACHES = [orthanc_metadata_cache, resource_locations, joycare_neonatos_cache]
+
+startup_timer.mark("importación")
+
 
 def create_app() -> FastAPI:
     """Factory para crear la aplicación FastAPI."""
@@ -51,6 +76,8 @@ def create_app() -> FastAPI:
 
     # === Rutas ===
     app.include_router(api_router)
+    use_precomputed_openapi(app, settings.openapi_schema_path)
+    startup_timer.mark("aplicación")
 
     # === Eventos ===
     @app.on_event("startup")
@@ -60,11 +87,45 @@ def create_app() -> FastAPI:
         logger.info(f"  Entorno: {settings.app_env}")
         logger.info(f"  PACS configurado: {settings.orthanc_url}")
         logger.info(f"  DICOMweb: {'Habilitado' if settings.orthanc_use_dicomweb else 'Deshabilitado'}")
+        logger.info(f"  DIMSE (C-GET): {'Habilitado' if settings.dimse_enabled else 'Deshabilitado'}")
+        logger.info(f"  Storage SCP: {'Habilitado' if settings.storage_scp_enabled else 'Deshabilitado'}")
+        logger.info(f"  Enrutado automático: {'Habilitado' if settings.autoroute_enabled else 'Deshabilitado'}")
         logger.info("=" * 60)
+        if settings.cache_snapshot_path:
+            try:
+                loaded = await asyncio.to_thread(load_snapshot, settings.cache_snapshot_path, SNAPSHOT_CACHES)
+                logger.info(f"Snapshot de cachés: {loaded} entradas cargadas")
+            except Exception as e:
+                logger.warning(f"No se pudo cargar el snapshot de cachés: {e}")
+        await storage_scp.start(settings)
+        await auto_router.start(settings)
+        startup_timer.mark("startup")
+        startup_timer.report()
 
     @app.on_event("shutdown")
     async def shutdown_event():
         logger.info("ATIM se está apagando...")
+        # Las peticiones HTTP ya terminaron (server_graceful_timeout_seconds);
+        # ahora las transferencias en segundo plano, con un plazo común
+        deadline = time.monotonic() + settings.shutdown_drain_seconds
+        await storage_scp.stop(deadline - time.monotonic())
+        await auto_router.stop(deadline - time.monotonic())
+        if not await transfer_admission.wait_idle(max(0.0, deadline - time.monotonic())):
+            logger.warning(
+                f"Apagado: {transfer_admission.active} transferencias siguen en curso "
+                f"tras {settings.shutdown_drain_seconds:.0f}s"
+            )
+        await change_feed.stop()
+        if settings.dimse_enabled:
+            from src.repositories.dimse_repository import close_dimse_pools
+            close_dimse_pools()
+        shutdown_render_pool()
+        if settings.cache_snapshot_path:
+            try:
+                saved = await asyncio.to_thread(save_snapshot, settings.cache_snapshot_path, SNAPSHOT_CACHES)
+                logger.info(f"Snapshot de cachés: {saved} entradas guardadas")
+            except Exception as e:
+                logger.warning(f"No se pudo guardar el snapshot de cachés: {e}")
 
     return app
 
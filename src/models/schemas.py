@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 
@@ -27,6 +27,185 @@ class PacsStatusResponse(BaseModel):
     timestamp: datetime
 
 
+class SingleFlightStats(BaseModel):
+    """Contadores de coalescencia de peticiones idénticas hacia un upstream."""
+    name: str
+    calls: int
+    upstream_calls: int
+    coalesced: int
+    errors: int
+    cancelled: int
+    in_flight: int
+
+
+class CacheStats(BaseModel):
+    """Estado de una caché en memoria."""
+    name: str
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class PrefetchStats(BaseModel):
+    """Contadores de la precarga en segundo plano al abrir estudios."""
+    enabled: bool
+    active: int
+    scheduled: int
+    completed: int
+    cancelled: int
+    failed: int
+    budget_exhausted: int
+    series_warmed: int
+    previews_warmed: int
+
+
+class ReplicaStatus(BaseModel):
+    """Carga de una réplica de lectura de un PACS."""
+    url: str
+    outstanding: int
+    served: int
+    failures: int
+
+
+class PacsBackendStatus(BaseModel):
+    """Estado de un backend PACS de la federación."""
+    name: str
+    primary: bool
+    timeout_seconds: float
+    replicas: List[ReplicaStatus]
+
+
+class DimsePoolStats(BaseModel):
+    """Estado del pool de asociaciones DIMSE de un backend PACS."""
+    backend: str
+    peer: str
+    max_size: int
+    active: int
+    idle: int
+    opened: int
+    reused: int
+    failed: int
+    closed_idle: int
+
+
+class StorageScpStats(BaseModel):
+    """Contadores del Storage SCP embebido (ingesta directa a JoyCare)."""
+    enabled: bool
+    listening: bool
+    ae_title: str
+    port: int
+    queue_size: int
+    queued: int
+    received: int
+    rejected: int
+    forwarded: int
+    failed: int
+    retried: int
+    deferred: int
+    recovered: int
+    backpressure_waits: int
+    backpressure_timeouts: int
+
+
+class TransferAdmissionStats(BaseModel):
+    """Uso del control de admisión de transferencias."""
+    max_concurrent: int
+    active: int
+    max_inflight_bytes: int
+    inflight_bytes: int
+    concurrency_utilization: float
+    bytes_utilization: float
+    max_queued: int
+    queued: int
+    admitted: int
+    queued_total: int
+    rejected: int
+    avg_queue_wait_ms: float
+    avg_duration_seconds: float
+    retry_after_seconds: int
+
+
+class PriorityClassStats(BaseModel):
+    """Ocupación y espera en cola de una clase de prioridad."""
+    active: int
+    queued: int
+    granted: int
+    waited: int
+    avg_wait_ms: float
+    max_wait_ms: float
+
+
+class LimitChange(BaseModel):
+    """Cambio del límite de concurrencia adaptativo."""
+    at: datetime
+    limit: int
+    reason: str
+
+
+class AdaptiveLimitStats(BaseModel):
+    """Límite de concurrencia adaptativo de un upstream y su historial."""
+    limit: int
+    min_limit: int
+    max_limit: int
+    short_rtt_ms: float
+    baseline_rtt_ms: float
+    samples: int
+    errors: int
+    increases: int
+    decreases: int
+    history: List[LimitChange]
+
+
+class SchedulerStats(BaseModel):
+    """Planificador por prioridad de las llamadas a un upstream."""
+    name: str
+    capacity: int
+    interactive_reserved: int
+    bulk_keys: int
+    classes: Dict[str, PriorityClassStats]
+    adaptive: Optional[AdaptiveLimitStats] = None
+
+
+class ChangeFeedStats(BaseModel):
+    """Reparto de eventos de llegada de estudios (SSE)."""
+    running: bool
+    subscribers: int
+    published: int
+    replayed: int
+    resets: int
+    dropped_subscribers: int
+    buffered: int
+    polls: int
+    poll_errors: int
+    last_change: Dict[str, int]
+
+
+class AutoRouteStats(BaseModel):
+    """Enrutado automático de estudios estables a JoyCare."""
+    enabled: bool
+    running: bool
+    rules: List[str]
+    window: str
+    queued: int
+    in_progress: int
+    retrying: int
+    events: int
+    matched: int
+    unmatched: int
+    unmapped: int
+    batches: int
+    studies_completed: int
+    series_transferred: int
+    instances_transferred: int
+    instances_skipped: int
+    instances_failed: int
+    deferred: int
+    abandoned: int
+    errors: int
+
+
 class ErrorResponse(BaseModel):
     """Respuesta estándar de error."""
     error: str
@@ -46,6 +225,7 @@ class PatientSummary(BaseModel):
     birth_date: Optional[str] = None
     sex: Optional[str] = None
     studies_count: int = 0
+    source: Optional[str] = None
 
 
 # ============================
@@ -61,6 +241,7 @@ class StudySummary(BaseModel):
     patient_name: Optional[str] = None
     patient_id: Optional[str] = None
     series_count: int = 0
+    source: Optional[str] = None
 
 
 class StudyDetail(StudySummary):
@@ -72,6 +253,31 @@ class StudyDetail(StudySummary):
 # SERIES
 # ============================
 
+class MosaicTile(BaseModel):
+    """Posición de la miniatura de una instancia dentro del mosaico."""
+    instance_id: str
+    instance_number: Optional[str] = None
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class SeriesMosaic(BaseModel):
+    """Índice del mosaico de una serie (qué instancia ocupa cada recuadro)."""
+    series_id: str
+    last_update: Optional[str] = None
+    tile_size: int
+    columns: int
+    rows: int
+    width: int
+    height: int
+    format: str
+    total_instances: int
+    tiles: List[MosaicTile] = []
+    missing: List[str] = []
+
+
 class SeriesSummary(BaseModel):
     """Resumen de una serie."""
     orthanc_id: str
@@ -92,6 +298,12 @@ class InstanceSummary(BaseModel):
     instance_number: Optional[str] = None
 
 
+class InstanceTags(BaseModel):
+    """Tags simplificados de una instancia (o solo los pedidos con `fields`)."""
+    orthanc_id: str
+    tags: Dict[str, Any] = {}
+
+
 # ============================
 # TRANSFERENCIA
 # ============================
@@ -129,5 +341,6 @@ class TransferSeriesResult(BaseModel):
     total_instances: int
     transferred: int
     failed: int
+    skipped: int = 0
     results: List[dict] = []
     errors: List[dict] = []
\ No newline at end of file
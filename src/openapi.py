@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import Optional
+
+from fastapi import FastAPI
+
+logger = logging.getLogger("atim")
+
+_SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def schema_fingerprint(app: FastAPI) -> str:
+    """
+    Huella del código que determina el esquema (los `.py` de `src`, título y
+    versión): si algo cambia, el esquema precalculado deja de valer.
+    """
+    digest = hashlib.sha256(f"{app.title}|{app.version}".encode())
+    for root, dirs, files in os.walk(_SRC_DIR):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, _SRC_DIR).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def write_openapi_schema(app: FastAPI, path: str) -> None:
+    """Generar el esquema OpenAPI y guardarlo con su huella (al construir la imagen)."""
+    document = {"fingerprint": schema_fingerprint(app), "schema": app.openapi()}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _read_schema(app: FastAPI, path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            document = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Esquema OpenAPI precalculado ilegible en {path}: {e}")
+        return None
+    if document.get("fingerprint") != schema_fingerprint(app):
+        logger.warning(f"Esquema OpenAPI precalculado desactualizado ({path}): se genera de nuevo")
+        return None
+    return document.get("schema")
+
+
+def use_precomputed_openapi(app: FastAPI, path: str) -> None:
+    """
+    Servir `/openapi.json` (y `/docs`) desde el esquema generado con
+    `python -m src.openapi`, en lugar de construirlo en la primera petición.
+    Si no existe o no corresponde a este código, se genera como siempre.
+    """
+    generate = app.openapi
+
+    def openapi() -> dict:
+        if app.openapi_schema is None:
+            app.openapi_schema = _read_schema(app, path) if path else None
+        if app.openapi_schema is None:
+            return generate()
+        return app.openapi_schema
+
+    app.openapi = openapi
+
+
+if __name__ == "__main__":
+    from src.config.settings import get_settings
+    from src.main import app
+
+    target = sys.argv[1] if len(sys.argv) > 1 else get_settings().openapi_schema_path
+    write_openapi_schema(app, target)
+    print(f"Esquema OpenAPI guardado en {target}")
@@ -0,0 +1,106 @@
+import logging
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from src.repositories.orthanc_repository import OrthancRepository
+from src.utils.cache import TTLCache
+from src.utils.dicom_json import simplify
+from src.utils.multipart import MultipartParser, parse_boundary
+
+logger = logging.getLogger("atim")
+
+# Backends en los que DICOMweb falló recientemente: se usa REST mientras tanto
+dicomweb_unavailable = TTLCache("dicomweb-unavailable", max_entries=64)
+_UNAVAILABLE_TTL_SECONDS = 60.0
+
+STUDY_FIELDS = [
+    "StudyInstanceUID", "StudyDate", "StudyDescription", "PatientName",
+    "PatientID", "NumberOfStudyRelatedSeries", "ModalitiesInStudy",
+]
+SERIES_FIELDS = [
+    "SeriesInstanceUID", "Modality", "SeriesDescription", "SeriesNumber",
+    "NumberOfSeriesRelatedInstances",
+]
+
+
+class DicomWebRepository:
+    """
+    Cliente DICOMweb (QIDO-RS / WADO-RS) del plugin de Orthanc.
+
+    QIDO-RS devuelve los metadatos de todos los estudios o series en una sola
+    llamada (con `includefield`) en lugar de una llamada REST por recurso.
+    WADO-RS devuelve una serie completa como un único `multipart/related` que
+    se procesa en streaming, instancia a instancia.
+
+    Usa el transporte del OrthancRepository del backend (réplicas y auth).
+    """
+
+    def __init__(self, orthanc_repo: OrthancRepository):
+        self.orthanc = orthanc_repo
+        self.name = orthanc_repo.name
+
+    @property
+    def enabled(self) -> bool:
+        """DICOMweb habilitado en la configuración y sin fallos recientes en este backend."""
+        return (
+            self.orthanc.settings.orthanc_use_dicomweb
+            and not dicomweb_unavailable.contains(self.name)
+        )
+
+    def mark_unavailable(self, error: Exception) -> None:
+        """Usar REST en este backend durante un tiempo tras un fallo de DICOMweb."""
+        logger.warning(
+            f"DICOMweb no disponible en PACS '{self.name}', se usa REST "
+            f"durante {_UNAVAILABLE_TTL_SECONDS:.0f}s: {error}"
+        )
+        dicomweb_unavailable.set(self.name, True, _UNAVAILABLE_TTL_SECONDS)
+
+    # ============================
+    # QIDO-RS
+    # ============================
+
+    async def _qido(self, path: str, fields: List[str], query: Optional[dict], limit: Optional[int]) -> List[dict]:
+        params = [("includefield", field) for field in fields]
+        params += [(key, value) for key, value in (query or {}).items() if value]
+        if limit:
+            params.append(("limit", str(limit)))
+
+        response = await self.orthanc._get(
+            f"/dicom-web{path}",
+            timeout=30.0,
+            params=params,
+            headers={"Accept": "application/dicom+json"}
+        )
+        response.raise_for_status()
+        if response.status_code == 204 or not response.content:
+            return []
+        return [simplify(dataset) for dataset in response.json()]
+
+    async def search_studies(self, query: Optional[dict] = None, limit: Optional[int] = None) -> List[dict]:
+        """Buscar estudios (QIDO-RS) con los campos de resumen incluidos."""
+        return await self._qido("/studies", STUDY_FIELDS, query, limit)
+
+    async def search_series(self, study_uid: str) -> List[dict]:
+        """Listar las series de un estudio (QIDO-RS) con sus campos de resumen."""
+        return await self._qido(f"/studies/{study_uid}/series", SERIES_FIELDS, None, None)
+
+    # ============================
+    # WADO-RS
+    # ============================
+
+    async def retrieve_series(self, study_uid: str, series_uid: str) -> AsyncIterator[bytes]:
+        """
+        Descargar una serie completa (WADO-RS) y entregar cada instancia DICOM
+        en cuanto termina de llegar, sin esperar a la respuesta entera.
+        """
+        async with self.orthanc._stream(
+            f"/dicom-web/studies/{study_uid}/series/{series_uid}",
+            timeout=httpx.Timeout(60.0, read=300.0),
+            headers={"Accept": 'multipart/related; type="application/dicom"'}
+        ) as response:
+            response.raise_for_status()
+            parser = MultipartParser(parse_boundary(response.headers.get("content-type", "")))
+            async for chunk in response.aiter_bytes():
+                for _, body in parser.feed(chunk):
+                    yield body
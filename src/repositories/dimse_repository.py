@@ -0,0 +1,264 @@
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import threading
+import uuid
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlparse
+
+from pydicom.dataset import Dataset
+from pydicom.uid import (
+    DeflatedExplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+    ExplicitVRLittleEndian,
+    ImplicitVRLittleEndian,
+    JPEG2000,
+    JPEG2000Lossless,
+    JPEGBaseline8Bit,
+    JPEGExtended12Bit,
+    JPEGLosslessSV1,
+    JPEGLSLossless,
+    RLELossless,
+)
+from pynetdicom import _config, evt
+from pynetdicom.sop_class import (
+    ComputedRadiographyImageStorage,
+    CTImageStorage,
+    DigitalXRayImageStorageForPresentation,
+    EncapsulatedPDFStorage,
+    EnhancedUSVolumeStorage,
+    MRImageStorage,
+    MultiFrameGrayscaleByteSecondaryCaptureImageStorage,
+    MultiFrameTrueColorSecondaryCaptureImageStorage,
+    SecondaryCaptureImageStorage,
+    StudyRootQueryRetrieveInformationModelGet,
+    UltrasoundImageStorage,
+    UltrasoundMultiFrameImageStorage,
+)
+
+from src.config.settings import PacsBackend, Settings
+from src.repositories.orthanc_repository import OrthancRepository
+from src.utils.association_pool import AssociationPool
+from src.utils.cache import TTLCache
+
+logger = logging.getLogger("atim")
+# pynetdicom registra cada PDU en INFO
+logging.getLogger("pynetdicom").setLevel(logging.WARNING)
+
+# Las instancias recibidas por C-STORE se escriben directamente a un archivo
+# temporal en lugar de decodificarse en memoria
+_config.STORE_RECV_CHUNKED_DATASET = True
+
+# Backends en los que DIMSE falló recientemente: se usa HTTP mientras tanto
+dimse_unavailable = TTLCache("dimse-unavailable", max_entries=64)
+_UNAVAILABLE_TTL_SECONDS = 60.0
+
+# Clases de almacenamiento que aceptamos en C-GET (ecografía primero; el
+# total de contextos de presentación está limitado a 128)
+STORAGE_SOP_CLASSES = [
+    UltrasoundMultiFrameImageStorage,
+    UltrasoundImageStorage,
+    EnhancedUSVolumeStorage,
+    SecondaryCaptureImageStorage,
+    MultiFrameTrueColorSecondaryCaptureImageStorage,
+    MultiFrameGrayscaleByteSecondaryCaptureImageStorage,
+    EncapsulatedPDFStorage,
+    ComputedRadiographyImageStorage,
+    DigitalXRayImageStorageForPresentation,
+    CTImageStorage,
+    MRImageStorage,
+]
+
+# Aceptar también las sintaxis comprimidas evita que Orthanc transcodifique
+TRANSFER_SYNTAXES = [
+    ExplicitVRLittleEndian,
+    ImplicitVRLittleEndian,
+    DeflatedExplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+    JPEGBaseline8Bit,
+    JPEGExtended12Bit,
+    JPEGLosslessSV1,
+    JPEGLSLossless,
+    JPEG2000Lossless,
+    JPEG2000,
+    RLELossless,
+]
+
+# C-STORE: éxito y "sin recursos" (rechazo de una sub-operación)
+_STATUS_SUCCESS = 0x0000
+_STATUS_OUT_OF_RESOURCES = 0xA700
+# C-GET: pendiente, cancelado y terminado con sub-operaciones fallidas
+_STATUS_PENDING = (0xFF00, 0xFF01)
+_STATUS_CANCEL = 0xFE00
+_STATUS_WARNING = 0xB000
+
+dimse_pools: Dict[str, AssociationPool] = {}
+_message_ids = itertools.count(1)
+
+
+class DimseError(RuntimeError):
+    """La recuperación DIMSE terminó con un estado de error."""
+
+
+def dicom_address(backend: PacsBackend) -> Optional[tuple]:
+    """(host, puerto) DICOM del backend, o None si no tiene puerto DICOM."""
+    if not backend.dicom_port:
+        return None
+    host = backend.dicom_host or urlparse(backend.urls[0]).hostname
+    return host, backend.dicom_port
+
+
+def get_association_pool(settings: Settings, backend: PacsBackend) -> AssociationPool:
+    """Pool de asociaciones del backend (compartido por todas las peticiones)."""
+    pool = dimse_pools.get(backend.name)
+    if pool is None:
+        host, port = dicom_address(backend)
+        pool = AssociationPool(
+            ae_title=settings.dimse_ae_title,
+            host=host,
+            port=port,
+            called_ae_title=backend.ae_title,
+            contexts=(
+                [(StudyRootQueryRetrieveInformationModelGet, None)]
+                + [(uid, TRANSFER_SYNTAXES) for uid in STORAGE_SOP_CLASSES]
+            ),
+            scp_sop_classes=STORAGE_SOP_CLASSES,
+            max_size=settings.dimse_max_associations,
+            idle_seconds=settings.dimse_idle_seconds,
+            timeout_seconds=settings.dimse_timeout_seconds,
+        )
+        dimse_pools[backend.name] = pool
+    return pool
+
+
+def close_dimse_pools() -> None:
+    """Liberar todas las asociaciones ociosas (al apagar ATIM)."""
+    for pool in dimse_pools.values():
+        pool.close_idle(force=True)
+
+
+def _discard(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class DimseRepository:
+    """
+    Recuperación de series completas por DIMSE (C-GET) con pynetdicom.
+
+    Una sola operación C-GET trae todas las instancias de la serie por una
+    asociación que se reutiliza entre peticiones, en lugar de una llamada
+    HTTP `/file` por instancia. Cada instancia recibida se escribe en disco
+    (spool) y se entrega en cuanto llega, mientras el resto sigue llegando.
+    """
+
+    def __init__(self, orthanc_repo: OrthancRepository):
+        self.settings = orthanc_repo.settings
+        self.backend = orthanc_repo.backend
+        self.name = orthanc_repo.name
+        self.spool_dir = self.settings.resolved_dimse_spool_dir
+
+    @property
+    def enabled(self) -> bool:
+        """DIMSE habilitado, con puerto DICOM en este backend y sin fallos recientes."""
+        return (
+            self.settings.dimse_enabled
+            and dicom_address(self.backend) is not None
+            and not dimse_unavailable.contains(self.name)
+        )
+
+    def mark_unavailable(self, error: Exception) -> None:
+        """Usar HTTP en este backend durante un tiempo tras un fallo de DIMSE."""
+        logger.warning(
+            f"DIMSE no disponible en PACS '{self.name}', se usa HTTP "
+            f"durante {_UNAVAILABLE_TTL_SECONDS:.0f}s: {error}"
+        )
+        dimse_unavailable.set(self.name, True, _UNAVAILABLE_TTL_SECONDS)
+
+    @property
+    def pool(self) -> AssociationPool:
+        return get_association_pool(self.settings, self.backend)
+
+    async def retrieve_series(self, study_uid: str, series_uid: str) -> AsyncIterator[str]:
+        """
+        Recuperar una serie con C-GET y entregar la ruta de cada instancia en
+        el spool según llega. El archivo pasa a ser de quien lo recibe, que
+        debe borrarlo al terminar con él.
+
+        Si se deja de consumir antes del final, se cancela el C-GET.
+        """
+        os.makedirs(self.spool_dir, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        message_id = next(_message_ids) % 65536 or 1
+        running = {}
+
+        def sink(event: evt.Event) -> int:
+            # Hilo de la asociación: mover el archivo temporal al spool
+            if stop.is_set():
+                _discard(event.dataset_path)
+                return _STATUS_OUT_OF_RESOURCES
+            path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}.dcm")
+            shutil.move(event.dataset_path, path)
+            loop.call_soon_threadsafe(queue.put_nowait, path)
+            return _STATUS_SUCCESS
+
+        def run() -> Dataset:
+            identifier = Dataset()
+            identifier.QueryRetrieveLevel = "SERIES"
+            identifier.StudyInstanceUID = study_uid
+            identifier.SeriesInstanceUID = series_uid
+
+            final = None
+            with self.pool.acquire(sink) as assoc:
+                running["assoc"] = assoc
+                for status, _ in assoc.send_c_get(
+                    identifier, StudyRootQueryRetrieveInformationModelGet, msg_id=message_id
+                ):
+                    if not status:
+                        # Sin respuesta: timeout o asociación caída
+                        raise ConnectionError("El SCP no respondió al C-GET")
+                    if status.Status not in _STATUS_PENDING:
+                        final = status
+            if final is None:
+                raise ConnectionError("C-GET sin respuesta final")
+            return final
+
+        future = loop.run_in_executor(self.pool.executor, run)
+        future.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                path = await queue.get()
+                if path is None:
+                    break
+                yield path
+
+            final = future.result()
+            code = final.Status
+            if code == _STATUS_WARNING:
+                logger.warning(
+                    f"C-GET de la serie {series_uid} incompleto: "
+                    f"{final.get('NumberOfFailedSuboperations', '?')} sub-operaciones fallidas"
+                )
+            elif code not in (_STATUS_SUCCESS, _STATUS_CANCEL):
+                raise DimseError(f"C-GET terminó con estado 0x{code:04X}")
+        finally:
+            def discard_pending(_=None) -> None:
+                while not queue.empty():
+                    path = queue.get_nowait()
+                    if path is not None:
+                        _discard(path)
+
+            if not future.done():
+                stop.set()
+                assoc = running.get("assoc")
+                if assoc is not None and assoc.is_established:
+                    assoc.send_c_cancel(message_id, query_model=StudyRootQueryRetrieveInformationModelGet)
+                # Lo que aún esté llegando se borra cuando termine el C-GET
+                future.add_done_callback(discard_pending)
+            discard_pending()
@@ -1,10 +1,29 @@
+import asyncio
 import httpx
 import logging
 
 from src.config.settings import Settings
+from src.utils.adaptive_limit import OVERLOAD_STATUS_CODES, adaptive_limiter
+from src.utils.cache import TTLCache
+from src.utils.priority_scheduler import PriorityScheduler, get_scheduler
 
 logger = logging.getLogger("atim")
 
+# JoyCare sin subida por partes: se usa la subida en una sola petición un tiempo
+joycare_chunked_unsupported = TTLCache("joycare-chunked-unsupported", max_entries=16)
+_UNSUPPORTED_TTL_SECONDS = 300.0
+
+# Lista de neonatos: cambia poco y la pide el frontend en cada transferencia
+joycare_neonatos_cache = TTLCache("joycare-neonatos", max_entries=16)
+
+
+class ChunkedUploadUnsupported(Exception):
+    """El backend de JoyCare no implementa la subida por partes."""
+
+
+class ChunkedUploadError(Exception):
+    """La subida por partes no pudo completarse (p. ej. respuestas sin offset legible)."""
+
 
 class JoyCareRepository:
     """Repositorio para comunicación con el backend de JoyCare."""
@@ -13,6 +32,16 @@ class JoyCareRepository:
         self.settings = settings
         self.base_url = settings.joycare_url
 
+    @property
+    def scheduler(self) -> PriorityScheduler:
+        """Planificador por prioridad (y límite adaptativo) de las llamadas a JoyCare."""
+        return get_scheduler(
+            "joycare",
+            self.settings.scheduler_joycare_concurrency,
+            self.settings.scheduler_interactive_reserved,
+            limiter=lambda: adaptive_limiter(self.settings, self.settings.scheduler_joycare_concurrency)
+        )
+
     async def check_connection(self) -> dict:
         """Verificar si JoyCare backend está accesible."""
         try:
@@ -34,11 +63,18 @@ class JoyCareRepository:
             }
 
     async def get_neonatos(self) -> list:
-        """Obtener la lista de neonatos desde JoyCare."""
+        """Obtener la lista de neonatos desde JoyCare (en caché `joycare_neonatos_cache_ttl_seconds`)."""
+        neonatos = joycare_neonatos_cache.get(self.base_url)
+        if neonatos is not None:
+            return neonatos
         async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{self.base_url}/api/neonatos")
+            async with self.scheduler.slot() as ticket:
+                response = await client.get(f"{self.base_url}/api/neonatos")
+                ticket.error = response.status_code in OVERLOAD_STATUS_CODES
             response.raise_for_status()
-            return response.json()
+            neonatos = response.json()
+        joycare_neonatos_cache.set(self.base_url, neonatos, self.settings.joycare_neonatos_cache_ttl_seconds)
+        return neonatos
 
     async def upload_ecografia(
         self,
@@ -51,16 +87,62 @@ class JoyCareRepository:
     ) -> dict:
         """
         Subir una ecografía al backend de JoyCare.
-        
-        Envía el archivo como multipart/form-data al endpoint:
-        POST /api/ecografias/{neonatoId}
+
+        Los archivos grandes se suben por partes de tamaño fijo con reintentos
+        y reanudación (ver `_upload_chunked`); los pequeños, o si JoyCare no
+        admite la subida por partes, en una sola petición multipart.
         """
         logger.info(
             f"Subiendo ecografía a JoyCare: neonato={neonato_id}, "
             f"archivo={filename}, tamaño={len(file_bytes)} bytes"
         )
 
-        # Construir el formulario multipart
+        chunked = (
+            self.settings.joycare_chunked_upload
+            and len(file_bytes) >= self.settings.joycare_chunked_threshold_bytes
+            and not joycare_chunked_unsupported.contains(self.base_url)
+        )
+        if chunked:
+            try:
+                result = await self._upload_chunked(
+                    neonato_id, file_bytes, filename, uploader_medico_id, sede_id, mime_type
+                )
+            except ChunkedUploadUnsupported:
+                logger.warning(
+                    f"JoyCare no admite subida por partes, se usa una sola petición "
+                    f"durante {_UNSUPPORTED_TTL_SECONDS:.0f}s"
+                )
+                joycare_chunked_unsupported.set(self.base_url, True, _UNSUPPORTED_TTL_SECONDS)
+            else:
+                self._log_uploaded(result)
+                return result
+
+        result = await self._upload_single(
+            neonato_id, file_bytes, filename, uploader_medico_id, sede_id, mime_type
+        )
+        self._log_uploaded(result)
+        return result
+
+    @staticmethod
+    def _log_uploaded(result: dict) -> None:
+        logger.info(
+            f"Ecografía subida exitosamente a JoyCare: "
+            f"id={result.get('id')}, filepath={result.get('filepath')}"
+        )
+
+    async def _upload_single(
+        self,
+        neonato_id: int,
+        file_bytes: bytes,
+        filename: str,
+        uploader_medico_id: int,
+        sede_id: int,
+        mime_type: str
+    ) -> dict:
+        """
+        Subida en una sola petición multipart/form-data al endpoint:
+        POST /api/ecografias/{neonatoId}
+        """
         files = {
             "imagen": (filename, file_bytes, mime_type)
         }
@@ -71,16 +153,153 @@ class JoyCareRepository:
             data["sede_id"] = str(sede_id)
 
         async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{self.base_url}/api/ecografias/{neonato_id}",
-                files=files,
-                data=data
-            )
+            async with self.scheduler.slot() as ticket:
+                response = await client.post(
+                    f"{self.base_url}/api/ecografias/{neonato_id}",
+                    files=files,
+                    data=data
+                )
+                ticket.error = response.status_code in OVERLOAD_STATUS_CODES
             response.raise_for_status()
+            return response.json()
+
+    async def _upload_chunked(
+        self,
+        neonato_id: int,
+        file_bytes: bytes,
+        filename: str,
+        uploader_medico_id: int,
+        sede_id: int,
+        mime_type: str
+    ) -> dict:
+        """
+        Subida por partes reanudable:
+
+        1. POST /api/ecografias/{neonatoId}/uploads con los metadatos y el
+           tamaño total → `upload_id` y `offset` ya recibido.
+        2. PATCH /api/ecografias/uploads/{uploadId} por cada parte, con la
+           cabecera `Upload-Offset`; la respuesta trae el nuevo `offset` y, al
+           completar el archivo, el `result` de la ecografía creada.
+        3. Si una parte falla, se consulta GET /api/ecografias/uploads/{uploadId}
+           y se reanuda desde el último offset confirmado (cada parte se
+           reintenta hasta `joycare_upload_part_retries` veces). Un 409 indica
+           que el servidor tiene otro offset y trae el correcto. Los 409 y las
+           partes aceptadas sin que el offset avance cuentan como fallos, así
+           que una subida que no progresa termina con error. El offset se lee
+           de la cabecera `Upload-Offset` o, si no viene, del cuerpo; una
+           respuesta sin offset legible también cuenta como fallo.
 
-            result = response.json()
-            logger.info(
-                f"Ecografía subida exitosamente a JoyCare: "
-                f"id={result.get('id')}, filepath={result.get('filepath')}"
-            )
-            return result
\ No newline at end of file
+        Cada petición ocupa su propio hueco del planificador, de modo que lo
+        interactivo puede adelantarse entre una parte y la siguiente.
+        """
+        size = len(file_bytes)
+        chunk_size = max(1, self.settings.joycare_chunk_size_bytes)
+        retries = max(0, self.settings.joycare_upload_part_retries)
+        view = memoryview(file_bytes)
+        timeout = httpx.Timeout(self.settings.joycare_upload_part_timeout_seconds, connect=10.0)
+
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            async with self.scheduler.slot() as ticket:
+                response = await client.post(
+                    f"{self.base_url}/api/ecografias/{neonato_id}/uploads",
+                    json={
+                        "filename": filename,
+                        "size": size,
+                        "mime_type": mime_type,
+                        "uploader_medico_id": uploader_medico_id,
+                        "sede_id": sede_id,
+                    }
+                )
+                ticket.error = response.status_code in OVERLOAD_STATUS_CODES
+            if response.status_code in (404, 405, 501):
+                raise ChunkedUploadUnsupported()
+            response.raise_for_status()
+            session = response.json()
+            upload_url = f"{self.base_url}/api/ecografias/uploads/{session['upload_id']}"
+            offset = int(session.get("offset", 0))
+
+            failures = 0
+            while True:
+                part = view[offset:offset + chunk_size]
+                try:
+                    async with self.scheduler.slot() as ticket:
+                        response = await client.patch(
+                            upload_url,
+                            content=bytes(part),
+                            headers={
+                                "Upload-Offset": str(offset),
+                                "Content-Type": "application/offset+octet-stream",
+                            }
+                        )
+                        ticket.error = response.status_code in OVERLOAD_STATUS_CODES
+                    if response.status_code != 409:
+                        response.raise_for_status()
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                        raise
+                    failures += 1
+                    if failures > retries:
+                        raise
+                    logger.warning(
+                        f"Parte de {filename} en offset {offset} falló "
+                        f"(intento {failures}/{retries}): {e}"
+                    )
+                    await asyncio.sleep(min(2 ** (failures - 1), 10) * 0.5)
+                    offset = await self._upload_offset(client, upload_url, offset)
+                    continue
+
+                try:
+                    confirmed = self._confirmed_offset(response)
+                    if response.status_code != 409 and confirmed >= size:
+                        return response.json()["result"]
+                except (ChunkedUploadError, KeyError, TypeError, ValueError) as e:
+                    failures += 1
+                    if failures > retries:
+                        raise ChunkedUploadError(
+                            f"La subida por partes de {filename} falló en offset {offset}: {e}"
+                        ) from e
+                    logger.warning(
+                        f"Respuesta ilegible de JoyCare para {filename} en offset {offset} "
+                        f"(intento {failures}/{retries}): {e}"
+                    )
+                    await asyncio.sleep(min(2 ** (failures - 1), 10) * 0.5)
+                    offset = await self._upload_offset(client, upload_url, offset)
+                    continue
+
+                if response.status_code != 409:
+                    if confirmed > offset:
+                        failures = 0
+                        offset = confirmed
+                        continue
+
+                # 409 (offset desincronizado) o parte aceptada sin avanzar
+                failures += 1
+                if failures > retries:
+                    raise ChunkedUploadError(
+                        f"La subida por partes de {filename} no avanza "
+                        f"(offset {offset}, JoyCare confirma {confirmed})"
+                    )
+                offset = confirmed
+
+    async def _upload_offset(self, client: httpx.AsyncClient, upload_url: str, fallback: int) -> int:
+        """Último offset confirmado por JoyCare (o `fallback` si no responde)."""
+        try:
+            async with self.scheduler.slot():
+                response = await client.get(upload_url)
+            response.raise_for_status()
+            return self._confirmed_offset(response)
+        except (httpx.HTTPError, ChunkedUploadError):
+            return fallback
+
+    @staticmethod
+    def _confirmed_offset(response: httpx.Response) -> int:
+        """Offset confirmado por JoyCare: cabecera `Upload-Offset` o, si no viene, `offset` del cuerpo."""
+        header = response.headers.get("Upload-Offset")
+        try:
+            if header is not None:
+                return int(header)
+            return int(response.json()["offset"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ChunkedUploadError(
+                f"JoyCare respondió {response.status_code} sin un offset válido"
+            ) from e
@@ -1,17 +1,173 @@
+import asyncio
+import heapq
 import httpx
-from typing import Optional
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence
 
-from src.config.settings import Settings
+from src.config.settings import PacsBackend, Settings
+from src.utils.adaptive_limit import OVERLOAD_STATUS_CODES, adaptive_limiter
+from src.utils.cache import TTLCache
+from src.utils.preview_render import PreviewOptions, preview_options, run_in_render_pool
+from src.utils.priority_scheduler import PriorityScheduler, get_scheduler
+from src.utils.replica_pool import ReplicaPool
+from src.utils.shared_cache import get_shared_cache
+from src.utils.single_flight import SingleFlight
+
+logger = logging.getLogger("atim")
+
+# Coalescencia y cachés compartidas por todas las instancias del repositorio: los
+# servicios se crean por petición, así que el estado debe vivir a nivel de módulo
+orthanc_flight = SingleFlight("orthanc")
+orthanc_metadata_cache = TTLCache("orthanc-metadata", max_entries=4096)
+orthanc_preview_cache = TTLCache(
+    "orthanc-previews", max_entries=4096, max_bytes=128 * 1024 * 1024
+)
+orthanc_replica_pools: Dict[str, ReplicaPool] = {}
+
+# Orthanc con /tools/find extendido (`OrderBy`, ≥ 1.12.5): se consulta /system
+# como mucho cada 5 minutos por backend
+orthanc_capabilities = TTLCache("orthanc-capabilities", max_entries=64)
+_CAPABILITIES_TTL_SECONDS = 300.0
+
+# Estudios por página de /tools/find al buscar los más recientes sin `OrderBy`
+FIND_PAGE_SIZE = 1000
+
+
+def get_replica_pool(backend: PacsBackend) -> ReplicaPool:
+    """Pool de réplicas compartido de un backend (se recrea si cambian sus URLs)."""
+    pool = orthanc_replica_pools.get(backend.name)
+    if pool is None or pool.urls != backend.urls:
+        pool = ReplicaPool(backend.urls)
+        orthanc_replica_pools[backend.name] = pool
+    return pool
 
 
 class OrthancRepository:
     """Repositorio para comunicación directa con Orthanc via API REST y DICOMweb."""
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, backend: Optional[PacsBackend] = None):
         self.settings = settings
-        self.base_url = settings.orthanc_url
-        self.dicomweb_url = settings.orthanc_dicomweb_url
-        self.auth = (settings.orthanc_username, settings.orthanc_password)
+        self.backend = backend or settings.resolved_pacs_backends[0]
+        self.name = self.backend.name
+        self.base_url = self.backend.urls[0]
+        self.dicomweb_url = f"{self.base_url}/dicom-web"
+        self.auth = (self.backend.username, self.backend.password)
+        self.pool = get_replica_pool(self.backend)
+
+    @property
+    def scheduler(self) -> PriorityScheduler:
+        """Planificador por prioridad (y límite adaptativo) de las llamadas a este backend."""
+        return get_scheduler(
+            f"orthanc:{self.name}",
+            self.settings.scheduler_orthanc_concurrency,
+            self.settings.scheduler_interactive_reserved,
+            limiter=lambda: adaptive_limiter(self.settings, self.settings.scheduler_orthanc_concurrency)
+        )
+
+    async def _get(self, path: str, timeout: float, **kwargs) -> httpx.Response:
+        """
+        GET contra la réplica con menos peticiones en curso.
+
+        Si una réplica no acepta la conexión se reintenta en las demás.
+        """
+        return await self._request("GET", path, timeout, **kwargs)
+
+    async def _post(self, path: str, timeout: float, **kwargs) -> httpx.Response:
+        """POST de solo lectura (p. ej. /tools/find), con el mismo reparto que `_get`."""
+        return await self._request("POST", path, timeout, **kwargs)
+
+    async def _request(self, method: str, path: str, timeout: float, **kwargs) -> httpx.Response:
+        tried = frozenset()
+        async with self.scheduler.slot() as ticket:
+            while True:
+                with self.pool.acquire(exclude=tried) as index:
+                    try:
+                        async with httpx.AsyncClient(timeout=timeout) as client:
+                            response = await client.request(
+                                method,
+                                f"{self.pool.urls[index]}{path}",
+                                auth=self.auth,
+                                **kwargs
+                            )
+                            ticket.error = response.status_code in OVERLOAD_STATUS_CODES
+                            return response
+                    except httpx.ConnectError:
+                        self.pool.mark_failed(index)
+                        tried = tried | {index}
+                        if len(tried) >= len(self.pool.urls):
+                            raise
+
+    @asynccontextmanager
+    async def _stream(self, path: str, timeout: float, **kwargs) -> AsyncIterator[httpx.Response]:
+        """GET en streaming contra la réplica con menos peticiones en curso."""
+        async with self.scheduler.slot(sample=False):
+            with self.pool.acquire() as index:
+                try:
+                    async with httpx.AsyncClient(timeout=timeout) as client:
+                        async with client.stream(
+                            "GET",
+                            f"{self.pool.urls[index]}{path}",
+                            auth=self.auth,
+                            **kwargs
+                        ) as response:
+                            yield response
+                except httpx.ConnectError:
+                    self.pool.mark_failed(index)
+                    raise
+
+    async def _coalesce(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Compartir una misma llamada upstream entre peticiones idénticas concurrentes."""
+        if not self.settings.orthanc_single_flight:
+            return await fn()
+        return await orthanc_flight.do((self.name, *key), fn)
+
+    async def _cached(
+        self,
+        cache: TTLCache,
+        ttl: float,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Servir desde caché si hay un valor vigente; si no, llamar (coalescido) y guardar.
+
+        La caché en memoria es del proceso; si hay caché compartida configurada
+        se consulta después, de modo que varios workers no repitan la misma
+        llamada a Orthanc.
+        """
+        cache_key = (self.name, *key)
+        value = cache.get(cache_key)
+        if value is not None:
+            return value
+
+        shared = get_shared_cache(
+            self.settings.shared_cache_path,
+            self.settings.shared_cache_max_mb * 1024 * 1024
+        )
+        shared_key = "|".join(str(part) for part in cache_key)
+        if shared is not None:
+            value = await shared.get(shared_key)
+            if value is not None:
+                cache.set(cache_key, value, ttl)
+                return value
+
+        value = await self._coalesce(key, fn)
+        cache.set(cache_key, value, ttl)
+        if shared is not None:
+            await shared.set(shared_key, value, ttl)
+        return value
+
+    def _preview_key(self, instance_id: str, options: Optional[PreviewOptions]) -> tuple:
+        if options is None:
+            options = preview_options(self.settings)
+        if options is None:
+            return ("preview", instance_id)
+        return ("rendered", instance_id, *options)
+
+    def is_preview_cached(self, instance_id: str, options: Optional[PreviewOptions] = None) -> bool:
+        """Saber si la preview de una instancia ya está en caché."""
+        return orthanc_preview_cache.contains((self.name, *self._preview_key(instance_id, options)))
 
     # ============================
     # CONEXIÓN
@@ -50,6 +206,20 @@ class OrthancRepository:
                 "message": f"Error inesperado: {str(e)}"
             }
 
+    async def has_extended_find(self) -> bool:
+        """Saber si Orthanc admite `OrderBy` en /tools/find (`HasExtendedFind`, ≥ 1.12.5)."""
+        extended = orthanc_capabilities.get(self.name)
+        if extended is not None:
+            return extended
+        try:
+            response = await self._get("/system", timeout=10.0)
+            response.raise_for_status()
+            extended = bool(response.json().get("Capabilities", {}).get("HasExtendedFind"))
+        except (httpx.HTTPError, ValueError, AttributeError):
+            extended = False
+        orthanc_capabilities.set(self.name, extended, _CAPABILITIES_TTL_SECONDS)
+        return extended
+
     async def check_dicomweb(self) -> bool:
         """Verificar si el plugin DICOMweb está disponible en Orthanc."""
         try:
@@ -62,29 +232,26 @@ class OrthancRepository:
         except Exception:
             return False
 
+    async def has_resource(self, kind: str, resource_id: str, timeout: float = 10.0) -> bool:
+        """Saber si este Orthanc tiene un recurso ("studies", "series", "instances")."""
+        response = await self._get(f"/{kind}/{resource_id}", timeout=timeout)
+        return response.status_code == 200
+
     # ============================
     # PACIENTES
     # ============================
 
     async def get_all_patients(self) -> list:
         """Obtener la lista de IDs de todos los pacientes."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/patients",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._get("/patients", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
 
     async def get_patient_details(self, patient_id: str) -> dict:
         """Obtener los detalles de un paciente específico."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/patients/{patient_id}",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(f"/patients/{patient_id}", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
 
     # ============================
     # ESTUDIOS
@@ -92,47 +259,131 @@ class OrthancRepository:
 
     async def get_all_studies(self) -> list:
         """Obtener la lista de IDs de todos los estudios."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/studies",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._get("/studies", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
 
     async def get_study_details(self, study_id: str) -> dict:
         """Obtener los detalles de un estudio específico."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/studies/{study_id}",
-                auth=self.auth
-            )
+        return await self._cached(
+            orthanc_metadata_cache,
+            self.settings.orthanc_metadata_cache_ttl_seconds,
+            ("study", study_id),
+            lambda: self._fetch_study_details(study_id)
+        )
+
+    async def _fetch_study_details(self, study_id: str) -> dict:
+        response = await self._get(f"/studies/{study_id}", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+    async def find_studies(self, query: Dict[str, str], limit: int) -> list:
+        """
+        Buscar estudios en Orthanc (/tools/find) con criterios DICOM: admite
+        comodines (`*`, `?`) y rangos de fecha (`AAAAMMDD-AAAAMMDD`). Devuelve
+        los `limit` estudios más recientes (por StudyDate) expandidos, como
+        `get_study_details`.
+
+        Orthanc aplica `Limit` en su orden interno, no por fecha. Desde 1.12.5
+        se le pide ordenar (`OrderBy` StudyDate descendente) y solo se expanden
+        las `limit` primeras. En versiones anteriores se recorren las
+        coincidencias en páginas de FIND_PAGE_SIZE (`Since`), como mucho
+        `orthanc_find_max_scan`, y se conservan las `limit` más recientes.
+        """
+        find = {"Level": "Study", "Query": query, "Expand": True, "CaseSensitive": False}
+        if await self.has_extended_find():
+            response = await self._post("/tools/find", timeout=30.0, json={
+                **find,
+                "OrderBy": [{"Type": "DicomTag", "Key": "StudyDate", "Direction": "DESC"}],
+                "Limit": limit,
+            })
             response.raise_for_status()
             return response.json()
 
+        max_scan = max(limit, self.settings.orthanc_find_max_scan)
+        newest: list = []
+        since = 0
+        while since < max_scan:
+            page_size = min(FIND_PAGE_SIZE, max_scan - since)
+            response = await self._post("/tools/find", timeout=30.0, json={
+                **find, "Since": since, "Limit": page_size,
+            })
+            response.raise_for_status()
+            page = response.json()
+            newest = heapq.nlargest(
+                limit, newest + page,
+                key=lambda study: study.get("MainDicomTags", {}).get("StudyDate") or ""
+            )
+            if len(page) < page_size:
+                return newest
+            since += len(page)
+        logger.warning(
+            f"Búsqueda {query} en {self.name} truncada: más de {max_scan} coincidencias "
+            "(ORTHANC_FIND_MAX_SCAN); se devuelven las más recientes entre ellas"
+        )
+        return newest
+
     # ============================
     # SERIES
     # ============================
 
     async def get_study_series(self, study_id: str) -> list:
         """Obtener todas las series de un estudio."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/studies/{study_id}/series",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(f"/studies/{study_id}/series", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
 
     async def get_series_details(self, series_id: str) -> dict:
         """Obtener los detalles de una serie específica."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/series/{series_id}",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.json()
+        return await self._cached(
+            orthanc_metadata_cache,
+            self.settings.orthanc_metadata_cache_ttl_seconds,
+            ("series", series_id),
+            lambda: self._fetch_series_details(series_id)
+        )
+
+    async def _fetch_series_details(self, series_id: str) -> dict:
+        response = await self._get(f"/series/{series_id}", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_series_instances_tags(self, series_id: str, fields: Sequence[str] = ()) -> Dict[str, dict]:
+        """
+        Tags de todas las instancias de una serie en una sola llamada, por ID
+        de instancia. Con `fields` solo se piden (y devuelven) esos tags.
+        """
+        return await self._cached(
+            orthanc_metadata_cache,
+            self.settings.orthanc_metadata_cache_ttl_seconds,
+            ("series-tags", series_id, tuple(fields)),
+            lambda: self._fetch_series_instances_tags(series_id, list(fields))
+        )
+
+    async def _fetch_series_instances_tags(self, series_id: str, fields: List[str]) -> Dict[str, dict]:
+        if fields:
+            # /tools/find con RequestedTags: Orthanc solo lee esos tags
+            series = await self.get_series_details(series_id)
+            response = await self._post("/tools/find", timeout=30.0, json={
+                "Level": "Instance",
+                "Query": {"SeriesInstanceUID": series["MainDicomTags"]["SeriesInstanceUID"]},
+                "Expand": True,
+                "RequestedTags": fields,
+            })
+            if response.status_code < 400:
+                found = response.json()
+                # Un Orthanc anterior a 1.11 ignora RequestedTags: usar instances-tags
+                if all("RequestedTags" in item for item in found):
+                    return {
+                        item["ID"]: _project({**item.get("MainDicomTags", {}), **item["RequestedTags"]}, fields)
+                        for item in found
+                    }
+
+        response = await self._get(f"/series/{series_id}/instances-tags?simplify", timeout=60.0)
+        response.raise_for_status()
+        return {
+            instance_id: _project(tags, fields) if fields else tags
+            for instance_id, tags in response.json().items()
+        }
 
     # ============================
     # INSTANCIAS (imágenes individuales)
@@ -140,50 +391,136 @@ class OrthancRepository:
 
     async def get_series_instances(self, series_id: str) -> list:
         """Obtener todas las instancias (imágenes) de una serie."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/series/{series_id}/instances",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.json()
+        return await self._cached(
+            orthanc_metadata_cache,
+            self.settings.orthanc_metadata_cache_ttl_seconds,
+            ("series-instances", series_id),
+            lambda: self._fetch_series_instances(series_id)
+        )
+
+    async def _fetch_series_instances(self, series_id: str) -> list:
+        response = await self._get(f"/series/{series_id}/instances", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
 
     async def get_instance_details(self, instance_id: str) -> dict:
         """Obtener los detalles de una instancia específica."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/instances/{instance_id}",
-                auth=self.auth
+        return await self._cached(
+            orthanc_metadata_cache,
+            self.settings.orthanc_metadata_cache_ttl_seconds,
+            ("instance", instance_id),
+            lambda: self._fetch_instance_details(instance_id)
+        )
+
+    async def _fetch_instance_details(self, instance_id: str) -> dict:
+        response = await self._get(f"/instances/{instance_id}", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_instance_frame(self, instance_id: str, frame: int, image_format: str) -> bytes:
+        """
+        Obtener un único frame de una instancia (índice desde 0) sin descargar
+        el archivo entero: renderizado (`jpeg`/`png`) o los bytes tal como
+        están en el archivo (`raw`, p. ej. el fragmento JPEG de un cine).
+        """
+        return await self._cached(
+            orthanc_preview_cache,
+            self.settings.orthanc_preview_cache_ttl_seconds,
+            ("frame", instance_id, frame, image_format),
+            lambda: self._fetch_instance_frame(instance_id, frame, image_format)
+        )
+
+    async def _fetch_instance_frame(self, instance_id: str, frame: int, image_format: str) -> bytes:
+        if image_format == "raw":
+            response = await self._get(f"/instances/{instance_id}/frames/{frame}/raw", timeout=30.0)
+        else:
+            params = {"quality": self.settings.frames_jpeg_quality} if image_format == "jpeg" else {}
+            response = await self._get(
+                f"/instances/{instance_id}/frames/{frame}/rendered",
+                timeout=30.0,
+                params=params,
+                headers={"Accept": f"image/{image_format}"}
             )
-            response.raise_for_status()
-            return response.json()
+        response.raise_for_status()
+        return response.content
 
     async def get_instance_file(self, instance_id: str) -> bytes:
         """Descargar el archivo DICOM de una instancia."""
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(
-                f"{self.base_url}/instances/{instance_id}/file",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.content
-
-    async def get_instance_preview(self, instance_id: str) -> bytes:
-        """Obtener una vista previa PNG de una instancia."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/instances/{instance_id}/preview",
-                auth=self.auth
+        response = await self._get(f"/instances/{instance_id}/file", timeout=60.0)
+        response.raise_for_status()
+        return response.content
+
+    async def get_instance_preview(self, instance_id: str, options: Optional[PreviewOptions] = None) -> bytes:
+        """
+        Obtener una vista previa de una instancia: renderizada en ATIM con
+        `options` (o los valores de la configuración) o, con el render local
+        deshabilitado, la PNG de Orthanc.
+        """
+        key = self._preview_key(instance_id, options)
+        if key[0] == "preview":
+            fetch = lambda: self._fetch_instance_preview(instance_id)
+        else:
+            fetch = lambda: self._render_instance_preview(instance_id, PreviewOptions(*key[2:]))
+        return await self._cached(
+            orthanc_preview_cache,
+            self.settings.orthanc_preview_cache_ttl_seconds,
+            key,
+            fetch
+        )
+
+    async def _render_instance_preview(self, instance_id: str, options: PreviewOptions) -> bytes:
+        # Solo el primer frame (no el cine completo) y los tags para
+        # decodificarlo: la reducción y la ventana son trabajo de ATIM
+        syntax_response, tags, frame = await asyncio.gather(
+            self._get(f"/instances/{instance_id}/metadata/TransferSyntax", timeout=30.0),
+            self.get_instance_tags(instance_id),
+            self.get_instance_frame(instance_id, 0, "raw"),
+        )
+        if syntax_response.status_code == 404:
+            # Orthanc sin esa metadata: decodificar el archivo completo
+            file_bytes = await self.get_instance_file(instance_id)
+            return await run_in_render_pool(
+                self.settings.preview_render_workers, "render_preview", file_bytes, options
             )
+        syntax_response.raise_for_status()
+        return await run_in_render_pool(
+            self.settings.preview_render_workers, "render_frame_preview",
+            tags, syntax_response.text.strip(), frame, options
+        )
+
+    async def _fetch_instance_preview(self, instance_id: str) -> bytes:
+        response = await self._get(f"/instances/{instance_id}/preview", timeout=30.0)
+        response.raise_for_status()
+        return response.content
+
+    async def stream_archive(self, kind: str, resource_id: str) -> AsyncIterator[bytes]:
+        """ZIP de una serie o estudio generado por Orthanc (`/{kind}/{id}/archive`), por trozos."""
+        async with self._stream(f"/{kind}/{resource_id}/archive", timeout=300.0) as response:
             response.raise_for_status()
-            return response.content
+            async for chunk in response.aiter_bytes():
+                yield chunk
 
     async def get_instance_tags(self, instance_id: str) -> dict:
         """Obtener los tags DICOM de una instancia."""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.base_url}/instances/{instance_id}/simplified-tags",
-                auth=self.auth
-            )
-            response.raise_for_status()
-            return response.json()
\ No newline at end of file
+        response = await self._get(f"/instances/{instance_id}/simplified-tags", timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+    # ============================
+    # CAMBIOS
+    # ============================
+
+    async def get_changes(self, since: Optional[int] = None, limit: int = 100) -> dict:
+        """
+        Registro de cambios de Orthanc (`/changes`) a partir de `since`; sin
+        `since`, solo el último cambio (para saber desde dónde empezar).
+        """
+        params = {"limit": limit, "since": since} if since is not None else {"last": ""}
+        response = await self._get("/changes", timeout=30.0, params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+def _project(tags: dict, fields: List[str]) -> dict:
+    """Quedarse solo con los tags pedidos."""
+    return {field: tags[field] for field in fields if field in tags}
\ No newline at end of file
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+import httpx
+
+from src.config.settings import Settings
+from src.repositories.orthanc_repository import OrthancRepository
+from src.utils.cache import TTLCache
+
+logger = logging.getLogger("atim")
+
+T = TypeVar("T")
+
+# Backend en el que se vio por última vez cada recurso (estudio, serie, instancia)
+resource_locations = TTLCache("pacs-locations", max_entries=200_000)
+_LOCATION_TTL_SECONDS = 3600.0
+
+
+class PacsFederation:
+    """
+    Acceso a varios PACS con nombre.
+
+    Los listados y búsquedas se lanzan en paralelo contra todos los backends,
+    cada uno con su propio timeout, y se mezclan etiquetando el origen. Las
+    lecturas de un recurso concreto se dirigen al backend donde se encontró.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.repos = [
+            OrthancRepository(settings, backend)
+            for backend in settings.resolved_pacs_backends
+        ]
+        self.primary = self.repos[0]
+
+    def repo(self, name: Optional[str] = None) -> OrthancRepository:
+        """Repositorio de un backend por nombre (el principal si no se indica)."""
+        if name is None:
+            return self.primary
+        for repo in self.repos:
+            if repo.name == name:
+                return repo
+        raise KeyError(f"Backend PACS desconocido: {name}")
+
+    def _timeout(self, repo: OrthancRepository) -> float:
+        return repo.backend.timeout_seconds or self.settings.pacs_fanout_timeout_seconds
+
+    async def fan_out(
+        self,
+        fn: Callable[[OrthancRepository], Awaitable[T]]
+    ) -> List[Tuple[OrthancRepository, T]]:
+        """
+        Ejecutar `fn` contra todos los backends en paralelo.
+
+        Un backend lento o caído se descarta (queda registrado en el log) sin
+        retrasar a los demás. Si fallan todos se propaga el primer error.
+        """
+        if len(self.repos) == 1:
+            return [(self.primary, await fn(self.primary))]
+
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(fn(repo), timeout=self._timeout(repo)) for repo in self.repos),
+            return_exceptions=True
+        )
+
+        results = []
+        errors = []
+        for repo, outcome in zip(self.repos, outcomes):
+            if isinstance(outcome, BaseException):
+                if isinstance(outcome, asyncio.CancelledError):
+                    raise outcome
+                reason = "timeout" if isinstance(outcome, asyncio.TimeoutError) else str(outcome)
+                logger.warning(f"PACS '{repo.name}' descartado del fan-out: {reason}")
+                errors.append(outcome)
+            else:
+                results.append((repo, outcome))
+
+        if not results and errors:
+            raise errors[0]
+        return results
+
+    # ============================
+    # LOCALIZACIÓN DE RECURSOS
+    # ============================
+
+    def remember(self, repo: OrthancRepository, kind: str, resource_ids: List[str]) -> None:
+        """Recordar en qué backend está cada recurso."""
+        if len(self.repos) == 1:
+            return
+        for resource_id in resource_ids:
+            resource_locations.set((kind, resource_id), repo.name, _LOCATION_TTL_SECONDS)
+
+    async def locate(self, kind: str, resource_id: str) -> OrthancRepository:
+        """
+        Repositorio del backend que contiene un recurso.
+
+        `kind` es el tipo de recurso en la API de Orthanc ("studies", "series",
+        "instances"). Si no se ha visto antes, se pregunta a todos en paralelo y
+        se usa el primero que lo tenga; si nadie lo tiene, el principal.
+        """
+        if len(self.repos) == 1:
+            return self.primary
+
+        name = resource_locations.get((kind, resource_id))
+        if name is not None:
+            try:
+                return self.repo(name)
+            except KeyError:
+                resource_locations.pop((kind, resource_id))
+
+        async def probe(repo: OrthancRepository) -> Optional[OrthancRepository]:
+            try:
+                found = await asyncio.wait_for(
+                    repo.has_resource(kind, resource_id), timeout=self._timeout(repo)
+                )
+            except (httpx.HTTPError, asyncio.TimeoutError):
+                logger.warning(f"PACS '{repo.name}' no respondió al localizar {kind}/{resource_id}")
+                return None
+            return repo if found else None
+
+        # El primero que confirme tener el recurso gana; el resto se cancela
+        probes = [asyncio.ensure_future(probe(repo)) for repo in self.repos]
+        try:
+            for next_done in asyncio.as_completed(probes):
+                repo = await next_done
+                if repo is not None:
+                    self.remember(repo, kind, [resource_id])
+                    return repo
+        finally:
+            for pending in probes:
+                pending.cancel()
+
+        return self.primary
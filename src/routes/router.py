@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 
+from src.controllers.events_controller import router as events_router
 from src.controllers.health_controller import router as health_router
 from src.controllers.studies_controller import router as studies_router
 from src.controllers.transfer_controller import router as transfer_router
@@ -10,4 +11,5 @@ api_router = APIRouter(prefix="/api/v1")
 # Registrar los routers de cada módulo
 api_router.include_router(health_router, tags=["Health"])
 api_router.include_router(studies_router, tags=["Studies"])
-api_router.include_router(transfer_router, tags=["Transfer"])
\ No newline at end of file
+api_router.include_router(transfer_router, tags=["Transfer"])
+api_router.include_router(events_router, tags=["Events"])
\ No newline at end of file
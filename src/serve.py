@@ -0,0 +1,81 @@
+import logging
+import os
+import tempfile
+
+import uvicorn
+
+from src.config.settings import Settings, get_settings
+
+logger = logging.getLogger("atim")
+
+
+def available_cpus() -> int:
+    """CPUs utilizables por el proceso, respetando afinidad y cuota de cgroup."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # Límite de CPU del contenedor (cgroup v2): "max 100000" o "200000 100000"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cpus)
+
+
+def resolve_workers(settings: Settings) -> int:
+    """Número de workers: el configurado o uno por CPU disponible."""
+    if settings.server_workers > 0:
+        return settings.server_workers
+    return available_cpus()
+
+
+def main() -> None:
+    """
+    Arrancar ATIM.
+
+    En desarrollo: un proceso con recarga automática. En cualquier otro entorno:
+    varios workers (uno por CPU por defecto) sin file watcher, con reciclado
+    opcional tras N peticiones y una caché compartida entre ellos para no
+    multiplicar la carga sobre Orthanc.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    settings = get_settings()
+
+    if settings.app_env == "development":
+        uvicorn.run("src.main:app", host=settings.host, port=settings.port, reload=True)
+        return
+
+    workers = resolve_workers(settings)
+
+    # Los workers heredan el entorno: fijar aquí la caché compartida hace que
+    # todos usen el mismo fichero
+    if workers > 1 and not settings.shared_cache_path:
+        os.environ["SHARED_CACHE_PATH"] = os.path.join(tempfile.gettempdir(), "atim-cache.sqlite")
+
+    logger.info(f"Iniciando {workers} workers en {settings.host}:{settings.port}")
+
+    # uvicorn reinicia los workers que terminan (p. ej. al alcanzar
+    # limit_max_requests) y con SIGHUP los recicla uno a uno
+    uvicorn.run(
+        "src.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+        limit_max_requests=settings.server_max_requests or None,
+        timeout_graceful_shutdown=settings.server_graceful_timeout_seconds,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
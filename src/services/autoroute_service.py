@@ -0,0 +1,513 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from datetime import datetime, time as dtime, timedelta
+from fnmatch import fnmatch
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.config.settings import AutoRouteRule, Settings
+from src.repositories.orthanc_repository import OrthancRepository
+from src.repositories.pacs_federation import PacsFederation
+from src.services.changes_service import change_feed
+from src.services.transfer_service import TransferService
+from src.utils.admission import AdmissionRejected
+from src.utils.cache import TTLCache
+
+logger = logging.getLogger("atim")
+
+# Instancias ya enviadas por el enrutado: un StableStudy repetido (llegaron
+# más imágenes al estudio) solo envía las nuevas. Se persisten en el spool
+# (`autoroute.sent.log`) para que un reinicio no las vuelva a subir
+autoroute_sent = TTLCache("autoroute-sent", max_entries=200_000)
+_SENT_TTL_SECONDS = 7 * 24 * 3600.0
+
+# Estudio pendiente: (backend, ID de Orthanc, regla, neonato, médico, sede)
+RouteJob = Tuple[str, str, str, int, int, Optional[int]]
+
+
+def parse_window(window: str) -> Optional[Tuple[dtime, dtime]]:
+    """Franja horaria "HH:MM-HH:MM" (puede cruzar la medianoche); vacía = None."""
+    if not window.strip():
+        return None
+    start, _, end = window.partition("-")
+    return dtime.fromisoformat(start.strip()), dtime.fromisoformat(end.strip())
+
+
+def seconds_until_window(window: Optional[Tuple[dtime, dtime]], now: datetime) -> float:
+    """Segundos hasta que empiece la franja (0 si ya estamos dentro o no hay franja)."""
+    if window is None:
+        return 0.0
+    start, end = window
+    current = now.time()
+    if start <= end:
+        inside = start <= current < end
+    else:
+        inside = current >= start or current < end
+    if inside:
+        return 0.0
+    opens = datetime.combine(now.date(), start)
+    if opens <= now:
+        opens += timedelta(days=1)
+    return (opens - now).total_seconds()
+
+
+def _matches(patterns: List[str], values: List[str]) -> bool:
+    if not patterns:
+        return True
+    return any(fnmatch(value.upper(), pattern.upper()) for pattern in patterns for value in values)
+
+
+class AutoRouter:
+    """
+    Enrutado automático de estudios de Orthanc a JoyCare.
+
+    Escucha los eventos `StableStudy` del poller compartido de `/changes`
+    (el mismo que alimenta el SSE) y compara cada estudio estable con las
+    reglas de `autoroute_rules` (modalidad, institución, PatientID, PACS).
+    Si alguna coincide y el PatientID tiene neonato en `patient_neonato_map`,
+    el estudio completo se encola para transferirse en segundo plano: cuando
+    el clínico lo abre, las imágenes ya están en JoyCare.
+
+    Los estudios se agrupan en lotes (`autoroute_batch_size` o lo que llegue
+    en `autoroute_batch_seconds`) y, si hay `autoroute_window`, solo se
+    envían dentro de esa franja horaria. Las series se transfieren como
+    trabajo masivo, así que ceden el paso a las peticiones interactivas; si el
+    control de admisión no tiene hueco, el estudio se reintenta tras
+    `autoroute_retry_seconds`. Si fallan instancias o series, también (hasta
+    `autoroute_max_retries` veces): el reintento solo envía lo que falta.
+
+    Con varios workers solo uno enruta (el que consigue el lock en el spool).
+    El último cambio de `/changes` procesado de cada backend se guarda junto
+    al lock (`autoroute.cursor.json`); al arrancar, el poller sigue desde ahí,
+    así que lo que quedó estable mientras ATIM estaba parado también se
+    enruta. Los estudios encolados sin enviar retienen el cursor: tras un
+    reinicio se vuelven a evaluar. Las instancias ya enviadas se añaden a
+    `autoroute.sent.log`, en el mismo directorio, para no repetirlas.
+    """
+
+    def __init__(self):
+        self.settings: Optional[Settings] = None
+        self._queue: Optional[asyncio.Queue] = None
+        # (backend, estudio) encolado → Seq de su cambio en `/changes`
+        self._pending: Dict[Tuple[str, str], int] = {}
+        # (backend, estudio) → reintentos por fallos de envío
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._processed: Dict[str, int] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._sending: Optional[asyncio.Future] = None
+        self._lock_file = None
+        self.in_progress = 0
+        self.events = 0
+        self.matched = 0
+        self.unmatched = 0
+        self.unmapped = 0
+        self.batches = 0
+        self.studies_completed = 0
+        self.series_transferred = 0
+        self.instances_transferred = 0
+        self.instances_skipped = 0
+        self.instances_failed = 0
+        self.deferred = 0
+        self.abandoned = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, settings: Settings) -> None:
+        """Arrancar la escucha y el envío por lotes (si está habilitado)."""
+        if not settings.autoroute_enabled or self.running:
+            return
+        if not settings.autoroute_rules:
+            logger.warning("Enrutado automático no iniciado: no hay reglas (AUTOROUTE_RULES)")
+            return
+        if settings.autoroute_uploader_medico_id is None and any(
+            rule.uploader_medico_id is None for rule in settings.autoroute_rules
+        ):
+            logger.error("Enrutado automático no iniciado: falta AUTOROUTE_UPLOADER_MEDICO_ID")
+            return
+        try:
+            parse_window(settings.autoroute_window)
+        except ValueError:
+            logger.error(f"Enrutado automático no iniciado: AUTOROUTE_WINDOW inválida '{settings.autoroute_window}'")
+            return
+        if "StableStudy" not in settings.changes_event_types:
+            logger.error("Enrutado automático no iniciado: StableStudy no está en CHANGES_EVENT_TYPES")
+            return
+        if not await asyncio.to_thread(self._acquire_lock, settings):
+            logger.info("Enrutado automático: lo ejecuta otro worker")
+            return
+
+        self.settings = settings
+        self._queue = asyncio.Queue()
+        loaded = await asyncio.to_thread(self._load_sent)
+        if loaded:
+            logger.info(f"Enrutado automático: {loaded} instancias ya enviadas")
+        cursor = await asyncio.to_thread(self._load_cursor)
+        if cursor:
+            change_feed.resume(cursor)
+            logger.info(f"Enrutado automático: se reanuda /changes desde {cursor}")
+        self._tasks = [
+            asyncio.ensure_future(self._listen()),
+            asyncio.ensure_future(self._sender()),
+        ]
+        logger.info(
+            f"Enrutado automático: {len(settings.autoroute_rules)} reglas, "
+            f"franja {settings.autoroute_window or 'siempre'}"
+        )
+
+    async def stop(self, drain_seconds: float = 0.0) -> None:
+        """
+        Dejar de escuchar y, durante como mucho `drain_seconds`, terminar el
+        lote en envío; después cancelar lo que quede.
+        """
+        tasks = self._tasks + list(self._retries)
+        self._tasks = []
+        self._retries = set()
+        if tasks:
+            # Primero la escucha y los reintentos: no entra nada nuevo
+            for task in tasks[:1] + tasks[2:]:
+                task.cancel()
+            sending = self._sending
+            if sending is not None and not sending.done() and drain_seconds > 0:
+                await asyncio.wait([sending], timeout=drain_seconds)
+            tasks[1].cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._pending:
+                logger.warning(
+                    f"Enrutado automático: {len(self._pending)} estudios quedan sin enviar al apagar; "
+                    "se volverán a evaluar al arrancar"
+                )
+            await asyncio.to_thread(self._save_cursor)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_lock(self, settings: Settings) -> bool:
+        spool = settings.resolved_dimse_spool_dir
+        os.makedirs(spool, exist_ok=True)
+        lock_file = open(os.path.join(spool, "autoroute.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    # ============================
+    # Cursor de /changes
+    # ============================
+
+    def _cursor_path(self, settings: Settings) -> str:
+        return os.path.join(settings.resolved_dimse_spool_dir, "autoroute.cursor.json")
+
+    def _load_cursor(self) -> Dict[str, int]:
+        try:
+            with open(self._cursor_path(self.settings)) as f:
+                return {backend: int(seq) for backend, seq in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Enrutado automático: cursor de /changes ilegible: {e}")
+            return {}
+
+    def _cursor(self) -> Dict[str, int]:
+        """Último cambio procesado por backend, sin pasar de los estudios pendientes."""
+        cursor = dict(self._processed)
+        for (backend, _), seq in self._pending.items():
+            cursor[backend] = min(cursor.get(backend, seq), seq - 1)
+        return cursor
+
+    def _save_cursor(self) -> None:
+        cursor = self._cursor()
+        if not cursor:
+            return
+        path = self._cursor_path(self.settings)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(cursor, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Enrutado automático: no se pudo guardar el cursor de /changes: {e}")
+
+    # ============================
+    # Instancias enviadas
+    # ============================
+
+    def _sent_path(self) -> str:
+        return os.path.join(self.settings.resolved_dimse_spool_dir, "autoroute.sent.log")
+
+    def _load_sent(self) -> int:
+        """
+        Cargar las instancias enviadas que no han caducado y compactar el
+        registro (una línea "caducidad ID" por instancia).
+        """
+        path = self._sent_path()
+        now = time.time()
+        live: Dict[str, float] = {}
+        try:
+            with open(path) as f:
+                for line in f:
+                    expires, _, instance_id = line.strip().partition(" ")
+                    try:
+                        if instance_id and float(expires) > now:
+                            live[instance_id] = float(expires)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Enrutado automático: registro de instancias enviadas ilegible: {e}")
+            return 0
+
+        for instance_id, expires in live.items():
+            autoroute_sent.set(instance_id, True, expires - now)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.writelines(f"{expires:.0f} {instance_id}\n" for instance_id, expires in live.items())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Enrutado automático: no se pudo compactar el registro de enviadas: {e}")
+        return len(live)
+
+    def _record_sent(self, instance_ids: List[str]) -> None:
+        expires = time.time() + _SENT_TTL_SECONDS
+        try:
+            with open(self._sent_path(), "a") as f:
+                f.writelines(f"{expires:.0f} {instance_id}\n" for instance_id in instance_ids)
+        except OSError as e:
+            logger.warning(f"Enrutado automático: no se pudieron registrar instancias enviadas: {e}")
+
+    # ============================
+    # Reglas
+    # ============================
+
+    async def _listen(self) -> None:
+        async for _, _, data in change_feed.listen(self.settings, ["StableStudy"]):
+            if data.get("resource_type") != "Study":
+                continue
+            self.events += 1
+            backend, seq = data["backend"], int(data.get("seq") or 0)
+            try:
+                await self._route(backend, data["resource_id"], seq)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Enrutado automático: error evaluando el estudio {data.get('resource_id')}: {e}")
+            self._processed[backend] = max(self._processed.get(backend, 0), seq)
+            await asyncio.to_thread(self._save_cursor)
+
+    async def _route(self, backend: str, study_id: str, seq: int) -> None:
+        """Evaluar las reglas para un estudio estable y encolarlo si corresponde."""
+        if (backend, study_id) in self._pending:
+            return
+        repo = PacsFederation(self.settings).repo(backend)
+        study = await repo.get_study_details(study_id)
+        series = await repo.get_study_series(study_id)
+        patient_id = study.get("PatientMainDicomTags", {}).get("PatientID", "")
+        institution = study.get("MainDicomTags", {}).get("InstitutionName", "")
+        modalities = sorted({s.get("MainDicomTags", {}).get("Modality", "") for s in series})
+
+        rule = self._match(backend, patient_id, institution, modalities)
+        if rule is None:
+            self.unmatched += 1
+            return
+        neonato_id = self.settings.patient_neonato_map.get(patient_id)
+        if neonato_id is None:
+            self.unmapped += 1
+            logger.warning(
+                f"Enrutado automático: el estudio {study_id} cumple la regla '{rule.name}' "
+                f"pero el PatientID '{patient_id}' no tiene neonato asignado"
+            )
+            return
+
+        self.matched += 1
+        uploader = rule.uploader_medico_id
+        if uploader is None:
+            uploader = self.settings.autoroute_uploader_medico_id
+        sede_id = rule.sede_id if rule.sede_id is not None else self.settings.autoroute_sede_id
+        self._pending[(backend, study_id)] = seq
+        self._queue.put_nowait((backend, study_id, rule.name, neonato_id, uploader, sede_id))
+        logger.info(
+            f"Enrutado automático: estudio {study_id} ({', '.join(modalities)}) → "
+            f"neonato {neonato_id} por la regla '{rule.name}'"
+        )
+
+    def _match(
+        self, backend: str, patient_id: str, institution: str, modalities: List[str]
+    ) -> Optional[AutoRouteRule]:
+        """Primera regla que cumple el estudio."""
+        for rule in self.settings.autoroute_rules:
+            if (
+                _matches(rule.backends, [backend])
+                and _matches(rule.patient_ids, [patient_id])
+                and _matches(rule.institutions, [institution])
+                and _matches(rule.modalities, modalities)
+            ):
+                return rule
+        return None
+
+    # ============================
+    # Envío por lotes
+    # ============================
+
+    async def _next_batch(self) -> List[RouteJob]:
+        settings = self.settings
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.autoroute_batch_seconds
+        while len(batch) < max(1, settings.autoroute_batch_size):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _sender(self) -> None:
+        window = parse_window(self.settings.autoroute_window)
+        limit = asyncio.Semaphore(max(1, self.settings.autoroute_concurrency))
+        while True:
+            batch = await self._next_batch()
+            wait = seconds_until_window(window, datetime.now())
+            if wait > 0:
+                logger.info(
+                    f"Enrutado automático: {len(batch)} estudios esperan a la franja "
+                    f"{self.settings.autoroute_window} ({wait / 60:.0f} min)"
+                )
+                await asyncio.sleep(wait)
+            self.batches += 1
+            self._sending = asyncio.gather(*(self._send_study(job, limit) for job in batch))
+            try:
+                await self._sending
+            finally:
+                self._sending = None
+
+    async def _send_study(self, job: RouteJob, limit: asyncio.Semaphore) -> None:
+        backend, study_id, rule_name, neonato_id, uploader, sede_id = job
+        self.in_progress += 1
+        try:
+            repo = PacsFederation(self.settings).repo(backend)
+            series_ids = (await repo.get_study_details(study_id)).get("Series", [])
+            outcomes = await asyncio.gather(
+                *(self._send_series(repo, series_id, job, limit) for series_id in series_ids),
+                return_exceptions=True
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Enrutado automático: error enviando el estudio {study_id}: {e}")
+            self._retry_failed(job)
+            return
+        finally:
+            self.in_progress -= 1
+
+        deferred = [o for o in outcomes if isinstance(o, AdmissionRejected)]
+        failed = sum(o for o in outcomes if isinstance(o, int))
+        for outcome in outcomes:
+            if isinstance(outcome, Exception) and not isinstance(outcome, AdmissionRejected):
+                self.errors += 1
+                failed += 1
+                logger.error(f"Enrutado automático: error enviando una serie del estudio {study_id}: {outcome}")
+        if deferred:
+            # Las series ya enviadas no se repiten: el reintento solo manda el resto
+            self.deferred += 1
+            delay = max(self.settings.autoroute_retry_seconds, max(o.retry_after for o in deferred))
+            self._schedule_retry(job, delay)
+            return
+        if failed:
+            logger.warning(f"Enrutado automático: el estudio {study_id} tiene {failed} envíos fallidos")
+            self._retry_failed(job)
+            return
+
+        self._pending.pop((backend, study_id), None)
+        self._attempts.pop((backend, study_id), None)
+        self.studies_completed += 1
+        logger.info(f"Enrutado automático: estudio {study_id} enviado (regla '{rule_name}')")
+
+    def _retry_failed(self, job: RouteJob) -> None:
+        """Reintentar un estudio con envíos fallidos o abandonarlo tras `autoroute_max_retries`."""
+        key = (job[0], job[1])
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts > self.settings.autoroute_max_retries:
+            self._attempts.pop(key, None)
+            self._pending.pop(key, None)
+            self.abandoned += 1
+            logger.error(
+                f"Enrutado automático: se abandona el estudio {job[1]} tras "
+                f"{self.settings.autoroute_max_retries} reintentos con fallos"
+            )
+            return
+        self._attempts[key] = attempts
+        self._schedule_retry(job, self.settings.autoroute_retry_seconds)
+
+    def _schedule_retry(self, job: RouteJob, delay: float) -> None:
+        task = asyncio.ensure_future(self._retry(job, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _send_series(
+        self, repo: OrthancRepository, series_id: str, job: RouteJob, limit: asyncio.Semaphore
+    ) -> int:
+        """Enviar las instancias de la serie que faltan; devuelve cuántas fallaron."""
+        _, _, _, neonato_id, uploader, sede_id = job
+        async with limit:
+            instances = await repo.get_series_instances(series_id)
+            sent = {inst.get("ID") for inst in instances if autoroute_sent.contains(inst.get("ID"))}
+            if len(sent) == len(instances):
+                self.instances_skipped += len(sent)
+                return 0
+            result = await TransferService(self.settings).transfer_series(
+                series_id=series_id,
+                neonato_id=neonato_id,
+                uploader_medico_id=uploader,
+                sede_id=sede_id,
+                exclude=sent
+            )
+        transferred_ids = [transferred["orthanc_instance_id"] for transferred in result["results"]]
+        for instance_id in transferred_ids:
+            autoroute_sent.set(instance_id, True, _SENT_TTL_SECONDS)
+        if transferred_ids:
+            await asyncio.to_thread(self._record_sent, transferred_ids)
+        self.series_transferred += 1
+        self.instances_transferred += result["transferred"]
+        self.instances_skipped += result["skipped"]
+        self.instances_failed += result["failed"]
+        return result["failed"]
+
+    async def _retry(self, job: RouteJob, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(job)
+
+    def stats(self) -> dict:
+        """Contadores del enrutado automático."""
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_progress": self.in_progress,
+            "retrying": len(self._retries),
+            "events": self.events,
+            "matched": self.matched,
+            "unmatched": self.unmatched,
+            "unmapped": self.unmapped,
+            "batches": self.batches,
+            "studies_completed": self.studies_completed,
+            "series_transferred": self.series_transferred,
+            "instances_transferred": self.instances_transferred,
+            "instances_skipped": self.instances_skipped,
+            "instances_failed": self.instances_failed,
+            "deferred": self.deferred,
+            "abandoned": self.abandoned,
+            "errors": self.errors,
+        }
+
+
+auto_router = AutoRouter()
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from src.config.settings import Settings
+from src.repositories.orthanc_repository import OrthancRepository
+from src.repositories.pacs_federation import PacsFederation
+
+logger = logging.getLogger("atim")
+
+# Evento ya publicado: (número de secuencia de ATIM, tipo de cambio, datos)
+ChangeEvent = Tuple[int, str, dict]
+
+
+class _Subscriber:
+    __slots__ = ("queue", "types")
+
+    def __init__(self, queue_size: int, types: Optional[Set[str]]):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.types = types
+
+
+def _sse(event_id: Optional[str], event: str, data: dict) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ChangeFeed:
+    """
+    Eventos de llegada de estudios, series e instancias para la UI (SSE).
+
+    Un único poller por backend PACS recorre el registro `/changes` de
+    Orthanc y reparte cada cambio a todos los clientes conectados, de modo
+    que el tráfico hacia Orthanc no depende de cuántos clientes haya: una
+    llamada barata cada `changes_poll_interval_seconds` en lugar de un
+    listado completo de estudios por cliente y sondeo.
+
+    Los últimos `changes_buffer_size` eventos se guardan en memoria: un
+    cliente que se reconecta con `Last-Event-ID` recibe lo que se perdió. Si
+    ese ID ya no está en el buffer (o es de otra ejecución de ATIM) se le
+    envía un evento `reset` para que recargue el listado una vez.
+
+    Los pollers arrancan con el primer cliente y paran tras
+    `changes_idle_seconds` sin ninguno; al volver a arrancar siguen desde el
+    último cambio visto, así que no se pierde nada en medio.
+
+    El reparto es por proceso: con varios workers cada uno tiene su poller
+    por backend (una llamada barata a `/changes` por worker e intervalo) y
+    su propia secuencia de eventos. Un cliente que se reconecta a otro
+    worker recibe un `reset`.
+    """
+
+    def __init__(self):
+        # Distingue los IDs de este proceso de los de otro worker o de una
+        # ejecución anterior (los workers arrancan en el mismo segundo)
+        self.epoch = f"{os.getpid():x}{secrets.token_hex(4)}"
+        self._seq = 0
+        self._buffer: Deque[ChangeEvent] = deque(maxlen=1000)
+        self._subscribers: Set[_Subscriber] = set()
+        self._pollers: Dict[str, asyncio.Task] = {}
+        self._idle_task: Optional[asyncio.Task] = None
+        self.last_change: Dict[str, int] = {}
+        self.published = 0
+        self.replayed = 0
+        self.resets = 0
+        self.dropped_subscribers = 0
+        self.polls = 0
+        self.poll_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._pollers.values())
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    # ============================
+    # Pollers
+    # ============================
+
+    def _ensure_pollers(self, settings: Settings) -> None:
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        if self._buffer.maxlen != settings.changes_buffer_size:
+            self._buffer = deque(self._buffer, maxlen=max(1, settings.changes_buffer_size))
+        for repo in PacsFederation(settings).repos:
+            task = self._pollers.get(repo.name)
+            if task is None or task.done():
+                self._pollers[repo.name] = asyncio.ensure_future(self._poll(repo))
+
+    def resume(self, positions: Dict[str, int]) -> None:
+        """
+        Hacer que los pollers que aún no han arrancado empiecen tras el cambio
+        `positions[backend]` en lugar de al final del registro (p. ej. el
+        enrutado automático tras un reinicio). Lo intermedio se publica como
+        cualquier otro cambio.
+        """
+        for backend, seq in positions.items():
+            self.last_change.setdefault(backend, seq)
+
+    async def _poll(self, repo: OrthancRepository) -> None:
+        settings = repo.settings
+        types = set(settings.changes_event_types)
+        interval = settings.changes_poll_interval_seconds
+        failures = 0
+        while True:
+            try:
+                since = self.last_change.get(repo.name)
+                if since is None:
+                    # Primera vez: empezar por el final, no reenviar el histórico
+                    page = await repo.get_changes()
+                    self.last_change[repo.name] = int(page.get("Last", 0))
+                    continue
+
+                page = await repo.get_changes(since, settings.changes_batch_limit)
+                self.polls += 1
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.poll_errors += 1
+                failures += 1
+                logger.warning(f"Eventos: error leyendo /changes de PACS '{repo.name}': {e}")
+                await asyncio.sleep(min(interval * 2 ** failures, 60.0))
+                continue
+
+            for change in page.get("Changes", []):
+                if change.get("ChangeType") in types:
+                    self._publish(repo.name, change)
+            self.last_change[repo.name] = int(page.get("Last", since))
+            if page.get("Done", True):
+                await asyncio.sleep(interval)
+
+    def _publish(self, backend: str, change: dict) -> None:
+        self._seq += 1
+        change_type = change.get("ChangeType", "")
+        data = {
+            "backend": backend,
+            "change": change_type,
+            "resource_type": change.get("ResourceType"),
+            "resource_id": change.get("ID"),
+            "seq": change.get("Seq"),
+            "date": change.get("Date"),
+        }
+        event = (self._seq, change_type, data)
+        self._buffer.append(event)
+        self.published += 1
+
+        for subscriber in list(self._subscribers):
+            if subscriber.types and change_type not in subscriber.types:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente demasiado lento: se le corta y, al reconectarse con
+                # Last-Event-ID, recupera lo perdido desde el buffer
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: _Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        self.dropped_subscribers += 1
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def _unsubscribe(self, subscriber: _Subscriber, settings: Settings) -> None:
+        self._subscribers.discard(subscriber)
+        if not self._subscribers and self._idle_task is None:
+            self._idle_task = asyncio.ensure_future(self._stop_when_idle(settings.changes_idle_seconds))
+
+    async def _stop_when_idle(self, idle_seconds: float) -> None:
+        await asyncio.sleep(idle_seconds)
+        self._idle_task = None
+        if not self._subscribers:
+            await self.stop()
+
+    async def stop(self) -> None:
+        """Parar los pollers (al apagar ATIM o sin clientes)."""
+        tasks = list(self._pollers.values())
+        self._pollers = {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ============================
+    # Clientes
+    # ============================
+
+    def _replay(self, last_event_id: Optional[str]) -> Tuple[List[ChangeEvent], bool]:
+        """Eventos posteriores a `last_event_id` y si hace falta un `reset`."""
+        if not last_event_id:
+            return [], False
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return [], True
+        seq = int(seq)
+        if self._buffer and seq < self._buffer[0][0] - 1:
+            return [], True
+        return [event for event in self._buffer if event[0] > seq], False
+
+    def _subscribe(
+        self,
+        settings: Settings,
+        last_event_id: Optional[str],
+        wanted: Optional[Set[str]],
+        queue_size: int
+    ) -> Tuple[_Subscriber, List[ChangeEvent], bool]:
+        # Reenviar y suscribirse sin ceder el event loop: no se pierde ni se
+        # duplica ningún evento entre una cosa y la otra
+        subscriber = _Subscriber(queue_size, wanted)
+        missed, reset = self._replay(last_event_id)
+        missed = [event for event in missed if not wanted or event[1] in wanted]
+        self._subscribers.add(subscriber)
+        self._ensure_pollers(settings)
+        return subscriber, missed, reset
+
+    async def listen(self, settings: Settings, types: List[str]) -> AsyncIterator[ChangeEvent]:
+        """
+        Suscripción interna (p. ej. el enrutado automático): los eventos de
+        `types` sin formato SSE. Si se queda atrás y se le corta, vuelve a
+        suscribirse desde el último evento recibido.
+        """
+        wanted = set(types)
+        last_seq = self._seq
+        while True:
+            subscriber, missed, _ = self._subscribe(
+                settings, self.event_id(last_seq), wanted, max(settings.changes_client_queue_size, settings.changes_buffer_size)
+            )
+            try:
+                for event in missed:
+                    last_seq = event[0]
+                    yield event
+                while True:
+                    event = await subscriber.queue.get()
+                    if event is None:
+                        break
+                    last_seq = event[0]
+                    yield event
+            finally:
+                self._unsubscribe(subscriber, settings)
+
+    async def stream(
+        self,
+        settings: Settings,
+        last_event_id: Optional[str] = None,
+        types: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Flujo SSE para un cliente: lo perdido desde `last_event_id` (si se
+        reconecta) y después cada cambio nuevo, con un comentario de
+        keep-alive cada `changes_heartbeat_seconds`.
+        """
+        subscriber, missed, reset = self._subscribe(
+            settings, last_event_id, set(types) if types else None, settings.changes_client_queue_size
+        )
+
+        try:
+            yield f"retry: {int(settings.changes_poll_interval_seconds * 1000) + 1000}\n\n"
+            if reset:
+                self.resets += 1
+                yield _sse(self.event_id(self._seq), "reset", {"reason": "Last-Event-ID fuera del buffer"})
+            for seq, change_type, data in missed:
+                self.replayed += 1
+                yield _sse(self.event_id(seq), change_type, data)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), timeout=settings.changes_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                seq, change_type, data = event
+                yield _sse(self.event_id(seq), change_type, data)
+        finally:
+            self._unsubscribe(subscriber, settings)
+
+    def stats(self) -> dict:
+        """Estado del reparto de eventos."""
+        return {
+            "running": self.running,
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "replayed": self.replayed,
+            "resets": self.resets,
+            "dropped_subscribers": self.dropped_subscribers,
+            "buffered": len(self._buffer),
+            "polls": self.polls,
+            "poll_errors": self.poll_errors,
+            "last_change": dict(self.last_change),
+        }
+
+
+change_feed = ChangeFeed()
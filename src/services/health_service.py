@@ -1,8 +1,37 @@
 from datetime import datetime, timezone
+from typing import List
 
 from src.config.settings import Settings
-from src.repositories.orthanc_repository import OrthancRepository
-from src.models.schemas import HealthResponse, PacsStatusResponse
+from src.repositories.orthanc_repository import (
+    OrthancRepository,
+    orthanc_flight,
+    orthanc_metadata_cache,
+    orthanc_preview_cache,
+)
+from src.repositories.joycare_repository import joycare_neonatos_cache
+from src.repositories.pacs_federation import PacsFederation, resource_locations
+from src.utils.priority_scheduler import schedulers
+from src.utils.shared_cache import get_shared_cache
+from src.services.autoroute_service import auto_router
+from src.services.changes_service import change_feed
+from src.services.prefetch_service import prefetcher
+from src.services.storage_scp_service import storage_scp
+from src.services.studies_service import series_mosaic_cache
+from src.services.transfer_service import configure_transfer_admission
+from src.models.schemas import (
+    HealthResponse,
+    PacsStatusResponse,
+    SingleFlightStats,
+    CacheStats,
+    PrefetchStats,
+    PacsBackendStatus,
+    DimsePoolStats,
+    StorageScpStats,
+    TransferAdmissionStats,
+    SchedulerStats,
+    ChangeFeedStats,
+    AutoRouteStats,
+)
 
 
 class HealthService:
@@ -38,4 +67,82 @@ class HealthService:
             dicomweb_available=dicomweb,
             message=connection["message"],
             timestamp=datetime.now(timezone.utc)
-        )
\ No newline at end of file
+        )
+
+    def get_single_flight_stats(self) -> SingleFlightStats:
+        """Obtener los contadores de coalescencia de llamadas a Orthanc."""
+        return SingleFlightStats(**orthanc_flight.stats())
+
+    def get_cache_stats(self) -> List[CacheStats]:
+        """Obtener el estado de las cachés en memoria."""
+        caches = [
+            orthanc_metadata_cache, orthanc_preview_cache, resource_locations,
+            series_mosaic_cache, joycare_neonatos_cache,
+        ]
+        shared = get_shared_cache(
+            self.settings.shared_cache_path,
+            self.settings.shared_cache_max_mb * 1024 * 1024
+        )
+        if shared is not None:
+            caches.append(shared)
+        return [CacheStats(**cache.stats()) for cache in caches]
+
+    def get_prefetch_stats(self) -> PrefetchStats:
+        """Obtener los contadores del prefetch de estudios."""
+        return PrefetchStats(enabled=self.settings.prefetch_enabled, **prefetcher.stats())
+
+    def get_pacs_backends(self) -> List[PacsBackendStatus]:
+        """Obtener los backends PACS configurados y la carga de sus réplicas."""
+        federation = PacsFederation(self.settings)
+        return [
+            PacsBackendStatus(
+                name=repo.name,
+                primary=repo is federation.primary,
+                timeout_seconds=repo.backend.timeout_seconds or self.settings.pacs_fanout_timeout_seconds,
+                replicas=repo.pool.stats()
+            )
+            for repo in federation.repos
+        ]
+
+    def get_dimse_stats(self) -> List[DimsePoolStats]:
+        """Obtener el estado de los pools de asociaciones DIMSE abiertos."""
+        if not self.settings.dimse_enabled:
+            return []
+        from src.repositories.dimse_repository import dimse_pools
+
+        return [
+            DimsePoolStats(backend=name, **pool.stats())
+            for name, pool in dimse_pools.items()
+        ]
+
+    def get_storage_scp_stats(self) -> StorageScpStats:
+        """Obtener los contadores del Storage SCP embebido."""
+        return StorageScpStats(
+            enabled=self.settings.storage_scp_enabled,
+            listening=storage_scp.listening,
+            ae_title=self.settings.dimse_ae_title,
+            port=self.settings.storage_scp_port,
+            queue_size=self.settings.storage_scp_queue_size,
+            **storage_scp.stats()
+        )
+
+    def get_transfer_admission_stats(self) -> TransferAdmissionStats:
+        """Obtener el uso del control de admisión de transferencias."""
+        return TransferAdmissionStats(**configure_transfer_admission(self.settings).stats())
+
+    def get_scheduler_stats(self) -> List[SchedulerStats]:
+        """Obtener la ocupación y la espera por prioridad de cada upstream."""
+        return [SchedulerStats(**scheduler.stats()) for scheduler in schedulers.values()]
+
+    def get_change_feed_stats(self) -> ChangeFeedStats:
+        """Obtener el estado del reparto de eventos (SSE)."""
+        return ChangeFeedStats(**change_feed.stats())
+
+    def get_autoroute_stats(self) -> AutoRouteStats:
+        """Obtener los contadores del enrutado automático."""
+        return AutoRouteStats(
+            enabled=self.settings.autoroute_enabled,
+            rules=[rule.name for rule in self.settings.autoroute_rules],
+            window=self.settings.autoroute_window,
+            **auto_router.stats()
+        )
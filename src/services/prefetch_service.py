@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from src.repositories.orthanc_repository import OrthancRepository
+from src.utils.priority_scheduler import BULK, priority
+
+logger = logging.getLogger("atim")
+
+
+class Prefetcher:
+    """
+    Precarga en segundo plano de lo que la UI pedirá tras abrir un estudio.
+
+    El flujo típico es: detalle del estudio → instancias de cada serie →
+    preview de cada instancia. Al servir el detalle se lanza una tarea que
+    calienta las cachés del repositorio con las listas de instancias y las
+    primeras N previews de cada serie.
+
+    Es trabajo de baja prioridad: sus llamadas a Orthanc van como masivas
+    (BULK, por estudio) y no ocupan los huecos reservados a lo interactivo,
+    comparte un semáforo pequeño entre todos los estudios, se cancela al
+    agotar su presupuesto de tiempo, y si hay demasiados estudios
+    precargándose a la vez se cancela el más antiguo.
+    """
+
+    def __init__(self):
+        self._tasks: "OrderedDict[Tuple[str, str], asyncio.Task]" = OrderedDict()
+        self._semaphore: asyncio.Semaphore = None
+        self._concurrency = 0
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.budget_exhausted = 0
+        self.series_warmed = 0
+        self.previews_warmed = 0
+
+    def schedule(self, repo: OrthancRepository, study_id: str, series_ids: List[str]) -> None:
+        """Lanzar la precarga de un estudio (no hace nada si está deshabilitada)."""
+        settings = repo.settings
+        if not settings.prefetch_enabled or not series_ids:
+            return
+
+        key = (repo.name, study_id)
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            return
+
+        if self._semaphore is None or self._concurrency != settings.prefetch_concurrency:
+            self._concurrency = max(1, settings.prefetch_concurrency)
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+        # Respetar el máximo de estudios precargándose: cancelar el más antiguo
+        while len(self._tasks) >= max(1, settings.prefetch_max_active):
+            _, oldest = self._tasks.popitem(last=False)
+            oldest.cancel()
+
+        self.scheduled += 1
+        task = asyncio.ensure_future(self._run(repo, study_id, series_ids))
+        self._tasks[key] = task
+        task.add_done_callback(lambda t, k=key: self._finish(k, t))
+
+    def _finish(self, key: Tuple[str, str], task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        study_id = key[1]
+
+        if task.cancelled():
+            self.cancelled += 1
+        elif task.exception() is not None:
+            self.failed += 1
+            logger.warning(f"Prefetch del estudio {study_id} falló: {task.exception()}")
+        elif task.result():
+            self.completed += 1
+        else:
+            self.budget_exhausted += 1
+
+    async def _run(self, repo: OrthancRepository, study_id: str, series_ids: List[str]) -> bool:
+        settings = repo.settings
+        start = time.monotonic()
+
+        try:
+            # La tarea nace en el contexto de la petición (interactivo): las
+            # subtareas de gather heredan la prioridad fijada aquí
+            with priority(BULK, study_id):
+                warm = asyncio.gather(*(
+                    self._warm_series(repo, series_id, settings.prefetch_previews_per_series)
+                    for series_id in series_ids
+                ))
+                # Al cancelar el prefetch, wait_for no recoge el resultado de gather
+                warm.add_done_callback(lambda f: f.cancelled() or f.exception())
+                await asyncio.wait_for(warm, timeout=settings.prefetch_budget_seconds)
+        except asyncio.TimeoutError:
+            logger.info(
+                f"Prefetch del estudio {study_id} cancelado por presupuesto "
+                f"({settings.prefetch_budget_seconds}s)"
+            )
+            return False
+
+        logger.info(
+            f"Prefetch del estudio {study_id} completado: {len(series_ids)} series "
+            f"en {round((time.monotonic() - start) * 1000, 2)}ms"
+        )
+        return True
+
+    async def _warm_series(self, repo: OrthancRepository, series_id: str, previews: int) -> None:
+        # Sin caché de metadatos la lista no queda caliente: solo se pide si
+        # hace falta para elegir las previews, y no cuenta como precargada
+        lists_cached = repo.settings.orthanc_metadata_cache_ttl_seconds > 0
+        if not lists_cached and previews <= 0:
+            return
+        async with self._semaphore:
+            instances = await repo.get_series_instances(series_id)
+        if lists_cached:
+            self.series_warmed += 1
+
+        for inst in instances[:max(0, previews)]:
+            instance_id = inst.get("ID")
+            if repo.is_preview_cached(instance_id):
+                continue
+            async with self._semaphore:
+                await repo.get_instance_preview(instance_id)
+            self.previews_warmed += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores del prefetch."""
+        return {
+            "active": len(self._tasks),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "budget_exhausted": self.budget_exhausted,
+            "series_warmed": self.series_warmed,
+            "previews_warmed": self.previews_warmed,
+        }
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,334 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import shutil
+import uuid
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from src.config.settings import Settings
+from src.repositories.joycare_repository import JoyCareRepository
+from src.utils.dicom_files import instance_filename, read_file, read_tags
+from src.utils.priority_scheduler import BULK, priority
+
+if TYPE_CHECKING:
+    from pynetdicom import evt
+
+logger = logging.getLogger("atim")
+
+# Estados de respuesta C-STORE
+_STATUS_SUCCESS = 0x0000
+_STATUS_PROCESSING_FAILURE = 0x0110
+_STATUS_OUT_OF_RESOURCES = 0xA700
+
+# (ruta en el spool, tags de identidad, neonato destino)
+IngestItem = Tuple[str, Dict[str, str], int]
+
+
+def _discard(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Rechazo definitivo de JoyCare (4xx salvo 408/429): reintentar no cambiará nada."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+    return False
+
+
+class StorageScp:
+    """
+    Storage SCP DICOM embebido: los equipos envían las ecografías (C-STORE)
+    directamente a ATIM, que las reenvía a JoyCare sin pasar por Orthanc.
+
+    Cada instancia se escribe en el spool (`incoming/`) desde el hilo de la
+    asociación, nunca desde el event loop, y se encola en una cola asyncio
+    acotada que consumen unas pocas tareas de subida. Si la cola está llena,
+    la respuesta al C-STORE se retrasa hasta que haya hueco: el equipo emisor
+    frena en lugar de que ATIM acumule archivos sin límite. Si no hay hueco
+    en `storage_scp_enqueue_timeout_seconds` se responde "sin recursos" y el
+    emisor reintentará más tarde.
+
+    Los errores transitorios de JoyCare (red, 5xx, 408/429) se reintentan
+    con espera creciente; si siguen fallando, la instancia se queda en
+    `incoming/`, que se vuelve a recorrer cada `storage_scp_rescan_seconds`
+    (y al arrancar) para reencolar lo que no esté ya en la cola. Solo lo que
+    JoyCare rechaza (4xx) se mueve a `failed/`, que se reintenta una vez en
+    cada arranque.
+    """
+
+    def __init__(self):
+        self.settings: Optional[Settings] = None
+        self._server = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Rutas de `incoming/` en la cola o subiéndose (el barrido las salta)
+        self._queued: Set[str] = set()
+        self.incoming_dir = ""
+        self.failed_dir = ""
+        self.received = 0
+        self.rejected = 0
+        self.forwarded = 0
+        self.failed = 0
+        self.retried = 0
+        self.deferred = 0
+        self.recovered = 0
+        self.backpressure_waits = 0
+        self.backpressure_timeouts = 0
+
+    @property
+    def listening(self) -> bool:
+        return self._server is not None
+
+    async def start(self, settings: Settings) -> None:
+        """Arrancar el SCP y las tareas de subida (si está habilitado)."""
+        if not settings.storage_scp_enabled or self.listening:
+            return
+        if settings.storage_scp_uploader_medico_id is None:
+            logger.error("Storage SCP no iniciado: falta STORAGE_SCP_UPLOADER_MEDICO_ID")
+            return
+
+        # pynetdicom solo se carga si el SCP está habilitado
+        from pynetdicom import AE, ALL_TRANSFER_SYNTAXES, StoragePresentationContexts, _config, evt
+        from pynetdicom.sop_class import Verification
+
+        # Las instancias recibidas se escriben a disco por trozos, sin decodificarlas
+        _config.STORE_RECV_CHUNKED_DATASET = True
+
+        self.settings = settings
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=max(1, settings.storage_scp_queue_size))
+        spool = settings.resolved_dimse_spool_dir
+        self.incoming_dir = os.path.join(spool, "incoming")
+        self.failed_dir = os.path.join(spool, "failed")
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+        ae = AE(ae_title=settings.dimse_ae_title)
+        ae.maximum_pdu_size = 0
+        ae.dimse_timeout = settings.dimse_timeout_seconds
+        ae.network_timeout = settings.dimse_timeout_seconds
+        for context in StoragePresentationContexts:
+            ae.add_supported_context(context.abstract_syntax, ALL_TRANSFER_SYNTAXES)
+        ae.add_supported_context(Verification)
+
+        # Lo que JoyCare rechazó en una ejecución anterior se reintenta una vez
+        # por arranque (p. ej. tras corregir PATIENT_NEONATO_MAP)
+        await asyncio.to_thread(self._requeue_failed)
+
+        try:
+            self._server = await asyncio.to_thread(
+                ae.start_server,
+                (settings.host, settings.storage_scp_port),
+                block=False,
+                evt_handlers=[(evt.EVT_C_STORE, self._on_store)],
+            )
+        except OSError as e:
+            # Con varios workers solo uno puede escuchar en el puerto
+            logger.warning(f"Storage SCP no iniciado en el puerto {settings.storage_scp_port}: {e}")
+            return
+
+        self._workers = [
+            asyncio.ensure_future(self._worker())
+            for _ in range(max(1, settings.storage_scp_upload_concurrency))
+        ]
+        self._workers.append(asyncio.ensure_future(self._rescan_loop()))
+        logger.info(
+            f"Storage SCP escuchando como {settings.dimse_ae_title} "
+            f"en el puerto {settings.storage_scp_port}"
+        )
+
+    async def stop(self, drain_seconds: float = 0.0) -> None:
+        """
+        Dejar de aceptar asociaciones y, durante como mucho `drain_seconds`,
+        terminar de subir lo encolado; lo que no dé tiempo sigue en el spool
+        y se reencola al arrancar.
+        """
+        if self._server is not None:
+            await asyncio.to_thread(self._server.shutdown)
+            self._server = None
+        if self._workers and drain_seconds > 0:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_seconds)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Storage SCP: {self._queue.qsize()} instancias sin subir al apagar, "
+                    "quedan en el spool para el próximo arranque"
+                )
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ============================
+    # Recepción (hilos de pynetdicom)
+    # ============================
+
+    def _on_store(self, event: "evt.Event") -> int:
+        path = os.path.join(self.incoming_dir, f"{uuid.uuid4().hex}.dcm")
+        # Marcada antes de aparecer en `incoming/`: el barrido no la reencola
+        self._queued.add(path)
+        shutil.move(event.dataset_path, path)
+        self.received += 1
+
+        item = self._route(path)
+        if item is None:
+            _discard(path)
+            self._queued.discard(path)
+            self.rejected += 1
+            return _STATUS_PROCESSING_FAILURE
+
+        if self._queue.full():
+            self.backpressure_waits += 1
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        try:
+            # Bloquea este hilo (y la respuesta al emisor), no el event loop
+            future.result(timeout=self.settings.storage_scp_enqueue_timeout_seconds)
+        except concurrent.futures.TimeoutError:
+            if not future.cancel():
+                # Se encoló justo al vencer el plazo: ya está en la cola
+                return _STATUS_SUCCESS
+            _discard(path)
+            self._queued.discard(path)
+            self.backpressure_timeouts += 1
+            logger.warning("Storage SCP: cola de subida llena, instancia rechazada")
+            return _STATUS_OUT_OF_RESOURCES
+        return _STATUS_SUCCESS
+
+    def _route(self, path: str) -> Optional[IngestItem]:
+        """Leer la identidad de la instancia y resolver su neonato destino."""
+        try:
+            tags = read_tags(path)
+        except Exception as e:
+            logger.warning(f"Storage SCP: instancia ilegible: {e}")
+            return None
+        neonato_id = self.settings.patient_neonato_map.get(tags.get("PatientID", ""))
+        if neonato_id is None:
+            logger.warning(
+                f"Storage SCP: PatientID '{tags.get('PatientID', '')}' sin neonato "
+                f"asignado, instancia {tags.get('SOPInstanceUID', '')} rechazada"
+            )
+            return None
+        return path, tags, neonato_id
+
+    # ============================
+    # Subida a JoyCare (event loop)
+    # ============================
+
+    def _requeue_failed(self) -> None:
+        for name in os.listdir(self.failed_dir):
+            try:
+                shutil.move(os.path.join(self.failed_dir, name), os.path.join(self.incoming_dir, name))
+            except OSError as e:
+                logger.warning(f"Storage SCP: no se pudo reintentar {name} de failed/: {e}")
+
+    async def _rescan_loop(self) -> None:
+        while True:
+            await self._rescan()
+            await asyncio.sleep(max(1.0, self.settings.storage_scp_rescan_seconds))
+
+    async def _rescan(self) -> None:
+        """Reencolar lo que hay en `incoming/` sin estar ya en la cola."""
+        recovered = 0
+        for name in await asyncio.to_thread(os.listdir, self.incoming_dir):
+            path = os.path.join(self.incoming_dir, name)
+            if path in self._queued or not os.path.exists(path):
+                continue
+            item = await asyncio.to_thread(self._route, path)
+            if item is None:
+                await asyncio.to_thread(self._move_to_failed, path)
+                continue
+            self._queued.add(path)
+            await self._queue.put(item)
+            recovered += 1
+        if recovered:
+            self.recovered += recovered
+            logger.info(f"Storage SCP: {recovered} instancias reencoladas desde el spool")
+
+    def _move_to_failed(self, path: str) -> None:
+        try:
+            shutil.move(path, os.path.join(self.failed_dir, os.path.basename(path)))
+        except OSError as e:
+            logger.warning(f"Storage SCP: no se pudo mover {path} a failed/: {e}")
+
+    async def _worker(self) -> None:
+        joycare = JoyCareRepository(self.settings)
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._forward(joycare, item)
+            except Exception as e:
+                # Un fallo inesperado no debe acabar con el worker
+                logger.error(f"Storage SCP: error procesando {item[0]}: {e}")
+            finally:
+                self._queued.discard(item[0])
+                self._queue.task_done()
+
+    async def _forward(self, joycare: JoyCareRepository, item: IngestItem) -> None:
+        path, tags, neonato_id = item
+        sop_instance_uid = tags.get("SOPInstanceUID", path)
+        retries = max(0, self.settings.storage_scp_upload_retries)
+        attempt = 0
+        while True:
+            try:
+                file_bytes = await asyncio.to_thread(read_file, path)
+                with priority(BULK, neonato_id):
+                    await joycare.upload_ecografia(
+                        neonato_id=neonato_id,
+                        file_bytes=file_bytes,
+                        filename=instance_filename(tags),
+                        uploader_medico_id=self.settings.storage_scp_uploader_medico_id,
+                        sede_id=self.settings.storage_scp_sede_id,
+                        mime_type="application/dicom"
+                    )
+                break
+            except Exception as e:
+                if _is_permanent(e):
+                    self.failed += 1
+                    logger.error(f"Storage SCP: JoyCare rechazó {sop_instance_uid}: {e}")
+                    await asyncio.to_thread(self._move_to_failed, path)
+                    return
+                attempt += 1
+                if attempt > retries:
+                    # Se queda en `incoming/`: el próximo barrido lo reencola
+                    self.deferred += 1
+                    logger.warning(
+                        f"Storage SCP: {sop_instance_uid} sin subir tras {retries} reintentos, "
+                        f"queda en el spool: {e}"
+                    )
+                    return
+                self.retried += 1
+                delay = self.settings.storage_scp_retry_backoff_seconds * 2 ** (attempt - 1)
+                logger.warning(
+                    f"Storage SCP: error subiendo {sop_instance_uid} a JoyCare, "
+                    f"reintento {attempt}/{retries} en {delay:.0f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+
+        self.forwarded += 1
+        await asyncio.to_thread(_discard, path)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores del Storage SCP."""
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "forwarded": self.forwarded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "recovered": self.recovered,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "backpressure_waits": self.backpressure_waits,
+            "backpressure_timeouts": self.backpressure_timeouts,
+        }
+
+
+storage_scp = StorageScp()
@@ -1,36 +1,111 @@
+import asyncio
 import logging
-from typing import List
+import math
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
 
 from src.config.settings import Settings
+from src.repositories.dicomweb_repository import DicomWebRepository
 from src.repositories.orthanc_repository import OrthancRepository
+from src.repositories.pacs_federation import PacsFederation
+from src.services.prefetch_service import prefetcher
+from src.utils.cache import TTLCache
+from src.utils.dicom_ids import orthanc_id
+from src.utils.preview_render import PreviewOptions, preview_options, run_in_render_pool
+from src.utils.priority_scheduler import BULK, priority
+from src.utils.single_flight import SingleFlight
+from src.utils.zip_stream import ZipStream
 from src.models.schemas import (
     PatientSummary,
     StudySummary,
     StudyDetail,
     InstanceSummary,
+    InstanceTags,
+    MosaicTile,
+    SeriesMosaic,
 )
 
 logger = logging.getLogger("atim")
 
+# Mosaicos ya compuestos: (imagen, índice). La clave lleva el LastUpdate de
+# la serie, así que un cambio en la serie genera uno nuevo
+series_mosaic_cache = TTLCache(
+    "series-mosaics", max_entries=256, max_bytes=256 * 1024 * 1024
+)
+mosaic_flight = SingleFlight("mosaics")
+
+FRAME_MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    "raw": "application/octet-stream",
+}
+
+
+# Lado máximo que admite cada codificador (JPEG 65535, WebP 16383)
+_MOSAIC_MAX_SIDE = {"jpeg": 65500, "png": 65500, "webp": 16383}
+
+
+class MosaicTooLarge(ValueError):
+    """El mosaico pedido no cabe en los límites de tamaño de la imagen."""
+
+
+def mosaic_columns(
+    count: int, tile_size: int, columns: Optional[int], image_format: str, max_pixels: int
+) -> int:
+    """
+    Columnas del mosaico: las pedidas (o una rejilla cuadrada) ajustadas para
+    que ningún lado pase del máximo del formato. Lanza `MosaicTooLarge` si
+    aun así no cabe o supera `max_pixels`.
+    """
+    max_tiles = max(1, _MOSAIC_MAX_SIDE[image_format] // tile_size)
+    if count > max_tiles * max_tiles or count * tile_size * tile_size > max_pixels:
+        raise MosaicTooLarge(
+            f"{count} miniaturas de {tile_size} px no caben en un mosaico {image_format}: "
+            "usar un `tile` menor"
+        )
+    columns = columns or max(1, math.ceil(math.sqrt(count)))
+    return min(max(columns, math.ceil(count / max_tiles)), max_tiles, max(1, count))
+
+
+def _instance_order(instance_number: Optional[str], instance_id: str) -> tuple:
+    """Orden por InstanceNumber; las instancias sin número, al final."""
+    try:
+        return (0, int(instance_number), instance_id)
+    except (TypeError, ValueError):
+        return (1, 0, instance_id)
+
 
 class StudiesService:
     """Servicio para consultar estudios, series e instancias desde Orthanc."""
 
     def __init__(self, settings: Settings):
         self.settings = settings
-        self.orthanc_repo = OrthancRepository(settings)
+        self.federation = PacsFederation(settings)
 
     # ============================
     # PACIENTES
     # ============================
 
     async def get_all_patients(self) -> List[PatientSummary]:
-        """Obtener todos los pacientes con su información básica."""
-        patient_ids = await self.orthanc_repo.get_all_patients()
+        """Obtener todos los pacientes de todos los PACS con su información básica."""
+        results = await self.federation.fan_out(self._list_patients)
+        patients = [patient for _, batch in results for patient in batch]
+
+        logger.info(f"Se encontraron {len(patients)} pacientes en {len(results)} PACS")
+        return patients
+
+    async def _list_patients(self, repo: OrthancRepository) -> List[PatientSummary]:
+        """Listar los pacientes de un PACS."""
+        patient_ids = await repo.get_all_patients()
         patients = []
 
         for pid in patient_ids:
-            details = await self.orthanc_repo.get_patient_details(pid)
+            details = await repo.get_patient_details(pid)
             main_tags = details.get("MainDicomTags", {})
 
             patients.append(PatientSummary(
@@ -39,10 +114,10 @@ class StudiesService:
                 patient_name=main_tags.get("PatientName"),
                 birth_date=main_tags.get("PatientBirthDate"),
                 sex=main_tags.get("PatientSex"),
-                studies_count=len(details.get("Studies", []))
+                studies_count=len(details.get("Studies", [])),
+                source=repo.name
             ))
 
-        logger.info(f"Se encontraron {len(patients)} pacientes en Orthanc")
         return patients
 
     # ============================
@@ -50,46 +125,141 @@ class StudiesService:
     # ============================
 
     async def get_all_studies(self) -> List[StudySummary]:
-        """Obtener todos los estudios con su información básica."""
-        study_ids = await self.orthanc_repo.get_all_studies()
+        """Obtener todos los estudios de todos los PACS con su información básica."""
+        results = await self.federation.fan_out(self._list_studies)
+        studies = []
+        for repo, batch in results:
+            self.federation.remember(repo, "studies", [study.orthanc_id for study in batch])
+            studies.extend(batch)
+
+        logger.info(f"Se encontraron {len(studies)} estudios en {len(results)} PACS")
+        return studies
+
+    async def _list_studies(self, repo: OrthancRepository) -> List[StudySummary]:
+        """Listar los estudios de un PACS (una consulta QIDO-RS si DICOMweb está habilitado)."""
+        dicomweb = DicomWebRepository(repo)
+        if dicomweb.enabled:
+            try:
+                return await self._list_studies_dicomweb(dicomweb)
+            except (httpx.HTTPError, ValueError) as e:
+                dicomweb.mark_unavailable(e)
+
+        study_ids = await repo.get_all_studies()
         studies = []
 
         for sid in study_ids:
-            details = await self.orthanc_repo.get_study_details(sid)
-            main_tags = details.get("MainDicomTags", {})
-            patient_tags = details.get("PatientMainDicomTags", {})
-
-            studies.append(StudySummary(
-                orthanc_id=sid,
-                study_instance_uid=main_tags.get("StudyInstanceUID"),
-                study_date=main_tags.get("StudyDate"),
-                study_description=main_tags.get("StudyDescription"),
-                patient_name=patient_tags.get("PatientName"),
-                patient_id=patient_tags.get("PatientID"),
-                series_count=len(details.get("Series", []))
-            ))
+            details = await repo.get_study_details(sid)
+            studies.append(self._study_summary(repo, {"ID": sid, **details}))
+
+        return studies
+
+    async def search_studies(
+        self,
+        patient_name: Optional[str] = None,
+        patient_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        modality: Optional[str] = None,
+        limit: int = 100
+    ) -> List[StudySummary]:
+        """
+        Buscar estudios en todos los PACS con /tools/find.
+
+        Los filtros se traducen a criterios DICOM, de modo que Orthanc solo
+        devuelve los estudios que coinciden. Cada PACS aporta sus `limit` más
+        recientes; se mezclan, se ordenan por fecha (más recientes primero) y
+        se recortan a `limit`.
+        """
+        query: Dict[str, str] = {}
+        if patient_name:
+            query["PatientName"] = patient_name
+        if patient_id:
+            query["PatientID"] = patient_id
+        if date_from or date_to:
+            query["StudyDate"] = f"{date_from or ''}-{date_to or ''}"
+        if modality:
+            query["ModalitiesInStudy"] = modality
 
-        logger.info(f"Se encontraron {len(studies)} estudios en Orthanc")
+        async def search(repo: OrthancRepository) -> List[StudySummary]:
+            return [
+                self._study_summary(repo, details)
+                for details in await repo.find_studies(query, limit)
+            ]
+
+        results = await self.federation.fan_out(search)
+        studies = []
+        for repo, batch in results:
+            self.federation.remember(repo, "studies", [study.orthanc_id for study in batch])
+            studies.extend(batch)
+
+        studies.sort(key=lambda study: study.study_date or "", reverse=True)
+        logger.info(f"Búsqueda de estudios {query}: {len(studies)} resultados")
+        return studies[:limit]
+
+    @staticmethod
+    def _study_summary(repo: OrthancRepository, details: dict) -> StudySummary:
+        """Construir un StudySummary a partir de un estudio expandido de Orthanc."""
+        main_tags = details.get("MainDicomTags", {})
+        patient_tags = details.get("PatientMainDicomTags", {})
+        return StudySummary(
+            orthanc_id=details.get("ID"),
+            study_instance_uid=main_tags.get("StudyInstanceUID"),
+            study_date=main_tags.get("StudyDate"),
+            study_description=main_tags.get("StudyDescription"),
+            patient_name=patient_tags.get("PatientName"),
+            patient_id=patient_tags.get("PatientID"),
+            series_count=len(details.get("Series", [])),
+            source=repo.name
+        )
+
+    async def _list_studies_dicomweb(self, dicomweb: DicomWebRepository) -> List[StudySummary]:
+        """Listar los estudios de un PACS con una sola consulta QIDO-RS."""
+        studies = []
+        for tags in await dicomweb.search_studies():
+            studies.append(self._study_summary_from_qido(tags, dicomweb.name))
         return studies
 
+    @staticmethod
+    def _study_summary_from_qido(tags: dict, source: str) -> StudySummary:
+        """Construir un StudySummary a partir de un resultado QIDO-RS simplificado."""
+        study_uid = tags.get("StudyInstanceUID", "")
+        patient_id = tags.get("PatientID", "")
+        return StudySummary(
+            orthanc_id=orthanc_id(patient_id, study_uid),
+            study_instance_uid=study_uid or None,
+            study_date=tags.get("StudyDate"),
+            study_description=tags.get("StudyDescription"),
+            patient_name=tags.get("PatientName"),
+            patient_id=patient_id or None,
+            series_count=int(tags.get("NumberOfStudyRelatedSeries") or 0),
+            source=source
+        )
+
     async def get_study_detail(self, study_id: str) -> StudyDetail:
         """Obtener el detalle de un estudio con todas sus series."""
-        details = await self.orthanc_repo.get_study_details(study_id)
+        repo = await self.federation.locate("studies", study_id)
+        details = await repo.get_study_details(study_id)
         main_tags = details.get("MainDicomTags", {})
         patient_tags = details.get("PatientMainDicomTags", {})
 
         # Obtener info de cada serie
-        series_list = []
-        for series_id in details.get("Series", []):
-            series_details = await self.orthanc_repo.get_series_details(series_id)
-            series_tags = series_details.get("MainDicomTags", {})
+        series_list = None
+        dicomweb = DicomWebRepository(repo)
+        if dicomweb.enabled and main_tags.get("StudyInstanceUID"):
+            try:
+                series_list = await self._get_series_dicomweb(
+                    dicomweb, patient_tags.get("PatientID", ""), main_tags["StudyInstanceUID"]
+                )
+            except (httpx.HTTPError, ValueError) as e:
+                dicomweb.mark_unavailable(e)
 
-            series_list.append({
-                "orthanc_id": series_id,
-                "modality": series_tags.get("Modality"),
-                "series_description": series_tags.get("SeriesDescription"),
-                "instances_count": len(series_details.get("Instances", []))
-            })
+        if series_list is None:
+            series_list = await self._get_series_rest(repo, details.get("Series", []))
+
+        # Precargar en segundo plano lo que la UI pedirá a continuación
+        series_ids = [s["orthanc_id"] for s in series_list]
+        self.federation.remember(repo, "series", series_ids)
+        prefetcher.schedule(repo, study_id, series_ids)
 
         return StudyDetail(
             orthanc_id=study_id,
@@ -99,16 +269,51 @@ class StudiesService:
             patient_name=patient_tags.get("PatientName"),
             patient_id=patient_tags.get("PatientID"),
             series_count=len(series_list),
+            source=repo.name,
             series=series_list
         )
 
+    async def _get_series_rest(self, repo: OrthancRepository, series_ids: List[str]) -> List[dict]:
+        """Resumen de cada serie con una llamada REST por serie."""
+        series_list = []
+        for series_id in series_ids:
+            series_details = await repo.get_series_details(series_id)
+            series_tags = series_details.get("MainDicomTags", {})
+
+            series_list.append({
+                "orthanc_id": series_id,
+                "modality": series_tags.get("Modality"),
+                "series_description": series_tags.get("SeriesDescription"),
+                "instances_count": len(series_details.get("Instances", []))
+            })
+        return series_list
+
+    async def _get_series_dicomweb(
+        self,
+        dicomweb: DicomWebRepository,
+        patient_id: str,
+        study_uid: str
+    ) -> List[dict]:
+        """Resumen de todas las series de un estudio con una sola consulta QIDO-RS."""
+        series_list = []
+        for tags in await dicomweb.search_series(study_uid):
+            series_list.append({
+                "orthanc_id": orthanc_id(patient_id, study_uid, tags.get("SeriesInstanceUID", "")),
+                "modality": tags.get("Modality"),
+                "series_description": tags.get("SeriesDescription"),
+                "instances_count": int(tags.get("NumberOfSeriesRelatedInstances") or 0)
+            })
+        return series_list
+
     # ============================
     # SERIES
     # ============================
 
     async def get_series_instances(self, series_id: str) -> List[InstanceSummary]:
         """Obtener todas las instancias de una serie."""
-        instances = await self.orthanc_repo.get_series_instances(series_id)
+        repo = await self.federation.locate("series", series_id)
+        instances = await repo.get_series_instances(series_id)
+        self.federation.remember(repo, "instances", [inst.get("ID") for inst in instances])
         result = []
 
         for inst in instances:
@@ -122,6 +327,123 @@ class StudiesService:
         logger.info(f"Serie {series_id}: {len(result)} instancias encontradas")
         return result
 
+    async def get_series_tags(self, series_id: str, fields: List[str]) -> List[InstanceTags]:
+        """
+        Obtener los tags de todas las instancias de una serie en una sola
+        llamada a Orthanc, ordenadas por InstanceNumber.
+        """
+        repo = await self.federation.locate("series", series_id)
+        tags_by_instance = await repo.get_series_instances_tags(series_id, fields)
+        self.federation.remember(repo, "instances", list(tags_by_instance))
+
+        def order(item):
+            return _instance_order(item[1].get("InstanceNumber"), item[0])
+
+        return [
+            InstanceTags(orthanc_id=instance_id, tags=tags)
+            for instance_id, tags in sorted(tags_by_instance.items(), key=order)
+        ]
+
+    async def get_series_mosaic(
+        self,
+        series_id: str,
+        tile_size: Optional[int] = None,
+        columns: Optional[int] = None,
+        image_format: Optional[str] = None,
+        quality: Optional[int] = None
+    ) -> Tuple[bytes, SeriesMosaic]:
+        """
+        Mosaico con la miniatura de cada instancia de la serie (por
+        InstanceNumber) y su índice. Se compone una vez y se sirve de caché
+        mientras la serie no cambie (su `LastUpdate`).
+        """
+        repo = await self.federation.locate("series", series_id)
+        details = await repo.get_series_details(series_id)
+        tile_size = tile_size or self.settings.mosaic_tile_size
+        image_format = image_format or self.settings.mosaic_format
+        quality = quality or self.settings.mosaic_quality
+        key = (repo.name, series_id, details.get("LastUpdate"), tile_size, columns, image_format, quality)
+
+        mosaic = series_mosaic_cache.get(key)
+        if mosaic is None:
+            mosaic = await mosaic_flight.do(key, lambda: self._build_series_mosaic(
+                repo, series_id, details.get("LastUpdate"), tile_size, columns, image_format, quality
+            ))
+            series_mosaic_cache.set(key, mosaic, self.settings.mosaic_cache_ttl_seconds)
+        return mosaic
+
+    async def _build_series_mosaic(
+        self,
+        repo: OrthancRepository,
+        series_id: str,
+        last_update: Optional[str],
+        tile_size: int,
+        columns: Optional[int],
+        image_format: str,
+        quality: int
+    ) -> Tuple[bytes, SeriesMosaic]:
+        start = time.monotonic()
+        instances = await repo.get_series_instances(series_id)
+        self.federation.remember(repo, "instances", [inst.get("ID") for inst in instances])
+        total = len(instances)
+        instances = sorted(
+            instances,
+            key=lambda inst: _instance_order(inst.get("MainDicomTags", {}).get("InstanceNumber"), inst.get("ID"))
+        )[:max(1, self.settings.mosaic_max_instances)]
+        columns = mosaic_columns(
+            len(instances), tile_size, columns, image_format, self.settings.mosaic_max_pixels
+        )
+
+        # Miniaturas de la caché de previews (con el tamaño por defecto de las
+        # previews se comparten con ellas), unas pocas a la vez
+        options = PreviewOptions(tile_size, self.settings.preview_format, self.settings.preview_quality)
+        semaphore = asyncio.Semaphore(max(1, self.settings.mosaic_concurrency))
+
+        async def thumbnail(instance_id: str) -> Optional[bytes]:
+            async with semaphore:
+                try:
+                    return await repo.get_instance_preview(instance_id, options)
+                except Exception as e:
+                    logger.warning(f"Mosaico de la serie {series_id}: sin miniatura de {instance_id}: {e}")
+                    return None
+
+        thumbnails = await asyncio.gather(*(thumbnail(inst.get("ID")) for inst in instances))
+        image, boxes = await run_in_render_pool(
+            self.settings.preview_render_workers, "compose_mosaic",
+            thumbnails, tile_size, columns, image_format, quality
+        )
+
+        tiles, missing = [], []
+        for inst, box in zip(instances, boxes):
+            if box is None:
+                missing.append(inst.get("ID"))
+                continue
+            x, y, width, height = box
+            tiles.append(MosaicTile(
+                instance_id=inst.get("ID"),
+                instance_number=inst.get("MainDicomTags", {}).get("InstanceNumber"),
+                x=x, y=y, width=width, height=height
+            ))
+        rows = max(1, math.ceil(len(instances) / columns))
+        index = SeriesMosaic(
+            series_id=series_id,
+            last_update=last_update,
+            tile_size=tile_size,
+            columns=columns,
+            rows=rows,
+            width=columns * tile_size,
+            height=rows * tile_size,
+            format=image_format,
+            total_instances=total,
+            tiles=tiles,
+            missing=missing
+        )
+        logger.info(
+            f"Mosaico de la serie {series_id}: {len(tiles)} miniaturas "
+            f"en {round((time.monotonic() - start) * 1000, 2)}ms"
+        )
+        return image, index
+
     # ============================
     # INSTANCIAS (Descarga)
     # ============================
@@ -129,14 +451,212 @@ class StudiesService:
     async def get_instance_file(self, instance_id: str) -> bytes:
         """Descargar el archivo DICOM de una instancia."""
         logger.info(f"Descargando instancia DICOM: {instance_id}")
-        file_bytes = await self.orthanc_repo.get_instance_file(instance_id)
+        repo = await self.federation.locate("instances", instance_id)
+        file_bytes = await repo.get_instance_file(instance_id)
         logger.info(f"Instancia {instance_id}: {len(file_bytes)} bytes descargados")
         return file_bytes
 
-    async def get_instance_preview(self, instance_id: str) -> bytes:
-        """Obtener la vista previa PNG de una instancia."""
-        return await self.orthanc_repo.get_instance_preview(instance_id)
+    async def get_instance_preview(
+        self,
+        instance_id: str,
+        size: Optional[int] = None,
+        image_format: Optional[str] = None,
+        quality: Optional[int] = None,
+        window_center: Optional[float] = None,
+        window_width: Optional[float] = None
+    ) -> Tuple[bytes, str]:
+        """Obtener la vista previa de una instancia y su tipo de contenido."""
+        options = preview_options(
+            self.settings, size, image_format, quality, window_center, window_width
+        )
+        repo = await self.federation.locate("instances", instance_id)
+        preview_bytes = await repo.get_instance_preview(instance_id, options)
+        media_type = FRAME_MEDIA_TYPES[options.image_format] if options is not None else "image/png"
+        return preview_bytes, media_type
+
+    # ============================
+    # FRAMES (cine multiframe)
+    # ============================
+
+    async def _frame_count(self, repo: OrthancRepository, instance_id: str) -> int:
+        details = await repo.get_instance_details(instance_id)
+        try:
+            return max(1, int(details.get("MainDicomTags", {}).get("NumberOfFrames") or 1))
+        except ValueError:
+            return 1
+
+    async def get_instance_frame(self, instance_id: str, frame: int, image_format: str) -> bytes:
+        """Obtener un frame de una instancia (índice desde 0)."""
+        repo = await self.federation.locate("instances", instance_id)
+        count = await self._frame_count(repo, instance_id)
+        if not 0 <= frame < count:
+            raise IndexError(f"La instancia {instance_id} tiene {count} frames (0-{count - 1})")
+        return await repo.get_instance_frame(instance_id, frame, image_format)
+
+    async def stream_instance_frames(
+        self,
+        instance_id: str,
+        start: int,
+        end: Optional[int],
+        image_format: str
+    ) -> Tuple[AsyncIterator[bytes], str]:
+        """
+        Entregar los frames `start`..`end` (inclusive) como un cuerpo
+        multipart/mixed, una parte por frame y en orden, según van llegando.
+
+        Se piden `frames_stream_concurrency` frames por adelantado, de modo que
+        el visor puede empezar a reproducir con el primero mientras llegan los
+        siguientes. Devuelve el generador y el boundary del multipart.
+        """
+        repo = await self.federation.locate("instances", instance_id)
+        count = await self._frame_count(repo, instance_id)
+        last = count - 1 if end is None else min(end, count - 1)
+        if not 0 <= start <= last:
+            raise IndexError(f"La instancia {instance_id} tiene {count} frames (0-{count - 1})")
+
+        boundary = uuid.uuid4().hex
+        media_type = FRAME_MEDIA_TYPES[image_format]
+        window = max(1, self.settings.frames_stream_concurrency)
+
+        async def parts() -> AsyncIterator[bytes]:
+            pending: deque = deque()
+            next_frame = start
+            try:
+                while pending or next_frame <= last:
+                    while len(pending) < window and next_frame <= last:
+                        pending.append((next_frame, asyncio.ensure_future(
+                            repo.get_instance_frame(instance_id, next_frame, image_format)
+                        )))
+                        next_frame += 1
+                    frame, task = pending.popleft()
+                    data = await task
+                    yield (
+                        f"--{boundary}\r\n"
+                        f"Content-Type: {media_type}\r\n"
+                        f"Content-Length: {len(data)}\r\n"
+                        f"X-Frame-Index: {frame}\r\n\r\n"
+                    ).encode() + data + b"\r\n"
+                yield f"--{boundary}--\r\n".encode()
+            except Exception as e:
+                # Las cabeceras ya se enviaron: se corta la conexión (sin el
+                # boundary final) para que el cliente sepa que está incompleto
+                logger.error(f"Streaming de frames de {instance_id} interrumpido: {str(e)}")
+                raise
+            finally:
+                for _, task in pending:
+                    task.cancel()
+
+        logger.info(f"Streaming de frames {start}-{last} de la instancia {instance_id} ({image_format})")
+        return parts(), boundary
 
     async def get_instance_tags(self, instance_id: str) -> dict:
         """Obtener los tags DICOM de una instancia."""
-        return await self.orthanc_repo.get_instance_tags(instance_id)
\ No newline at end of file
+        repo = await self.federation.locate("instances", instance_id)
+        return await repo.get_instance_tags(instance_id)
+
+    # ============================
+    # ARCHIVOS ZIP (series y estudios)
+    # ============================
+
+    async def archive_series(self, series_id: str) -> AsyncIterator[bytes]:
+        """ZIP de una serie completa, generado en streaming."""
+        repo = await self.federation.locate("series", series_id)
+        if self.settings.archive_proxy_orthanc:
+            return await self._proxy_archive(repo, "series", series_id)
+        instances = await self._ordered_instances(repo, series_id)
+        entries = [
+            (f"DICOM/PAT00001/STU00001/SER00001/IMG{number:05d}", instance_id)
+            for number, instance_id in enumerate(instances, start=1)
+        ]
+        return self._zip_instances(repo, series_id, entries)
+
+    async def archive_study(self, study_id: str) -> AsyncIterator[bytes]:
+        """ZIP de un estudio completo (todas sus series), generado en streaming."""
+        repo = await self.federation.locate("studies", study_id)
+        if self.settings.archive_proxy_orthanc:
+            return await self._proxy_archive(repo, "studies", study_id)
+        series_list = await repo.get_study_series(study_id)
+        series_list.sort(key=lambda s: _instance_order(s.get("MainDicomTags", {}).get("SeriesNumber"), s.get("ID")))
+        entries = []
+        for series_number, series in enumerate(series_list, start=1):
+            instances = await self._ordered_instances(repo, series.get("ID"))
+            entries.extend(
+                (f"DICOM/PAT00001/STU00001/SER{series_number:05d}/IMG{number:05d}", instance_id)
+                for number, instance_id in enumerate(instances, start=1)
+            )
+        return self._zip_instances(repo, study_id, entries)
+
+    async def _ordered_instances(self, repo: OrthancRepository, series_id: str) -> List[str]:
+        instances = await repo.get_series_instances(series_id)
+        self.federation.remember(repo, "instances", [inst.get("ID") for inst in instances])
+        instances.sort(key=lambda inst: _instance_order(inst.get("MainDicomTags", {}).get("InstanceNumber"), inst.get("ID")))
+        return [inst.get("ID") for inst in instances]
+
+    def _zip_instances(
+        self,
+        repo: OrthancRepository,
+        resource_id: str,
+        entries: List[Tuple[str, str]]
+    ) -> AsyncIterator[bytes]:
+        """
+        Generar el ZIP con los archivos de `entries` (nombre, instancia) en
+        orden. Se descargan `archive_concurrency` instancias por adelantado
+        como trabajo masivo; en memoria solo están esas y la entrada en curso.
+
+        Los nombres siguen el formato de los File ID de un DICOMDIR
+        (componentes de hasta 8 caracteres en mayúsculas, sin extensión).
+        """
+        window = max(1, self.settings.archive_concurrency)
+
+        async def fetch(instance_id: str) -> bytes:
+            with priority(BULK, resource_id):
+                return await repo.get_instance_file(instance_id)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            archive = ZipStream(self.settings.archive_compression)
+            pending: deque = deque()
+            next_entry = 0
+            try:
+                while pending or next_entry < len(entries):
+                    while len(pending) < window and next_entry < len(entries):
+                        name, instance_id = entries[next_entry]
+                        pending.append((name, asyncio.ensure_future(fetch(instance_id))))
+                        next_entry += 1
+                    name, task = pending.popleft()
+                    data = await task
+                    yield await asyncio.to_thread(archive.add, name, data)
+                yield await asyncio.to_thread(archive.close)
+            except Exception as e:
+                # Las cabeceras ya se enviaron: se corta la conexión sin cerrar
+                # el ZIP, para que el cliente no lo tome por completo
+                logger.error(f"ZIP de {resource_id} interrumpido: {str(e)}")
+                raise
+            finally:
+                for _, task in pending:
+                    task.cancel()
+            logger.info(f"ZIP de {resource_id} enviado: {len(entries)} instancias")
+
+        return chunks()
+
+    async def _proxy_archive(self, repo: OrthancRepository, kind: str, resource_id: str) -> AsyncIterator[bytes]:
+        """
+        Reenviar el ZIP de Orthanc. Se espera al primer trozo antes de
+        responder, para que un error de Orthanc llegue como 404/502.
+        """
+        stream = repo.stream_archive(kind, resource_id)
+        with priority(BULK, resource_id):
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                await stream.aclose()
+                raise RuntimeError(f"Orthanc devolvió un ZIP vacío para {kind}/{resource_id}")
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+        return chunks()
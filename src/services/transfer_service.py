@@ -1,12 +1,39 @@
+import asyncio
 import logging
-from typing import List, Optional
+import os
+from typing import TYPE_CHECKING, List, Optional, Set, Tuple
+
+import httpx
 
 from src.config.settings import Settings
-from src.repositories.orthanc_repository import OrthancRepository
+from src.repositories.dicomweb_repository import DicomWebRepository
 from src.repositories.joycare_repository import JoyCareRepository
+from src.repositories.orthanc_repository import OrthancRepository
+from src.repositories.pacs_federation import PacsFederation
+from src.utils.admission import AdmissionController
+from src.utils.dicom_files import instance_filename, read_file, read_tags
+from src.utils.dicom_ids import orthanc_id
+from src.utils.priority_scheduler import BULK, priority
+
+if TYPE_CHECKING:
+    from src.repositories.dimse_repository import DimseRepository
 
 logger = logging.getLogger("atim")
 
+# Compartido por todas las peticiones: limita transferencias y bytes en memoria
+transfer_admission = AdmissionController()
+
+
+def configure_transfer_admission(settings: Settings) -> AdmissionController:
+    """Aplicar los límites de la configuración al control de admisión."""
+    transfer_admission.configure(
+        max_active=settings.transfer_max_concurrent,
+        max_bytes=settings.transfer_max_inflight_bytes,
+        max_queued=settings.transfer_max_queued,
+        queue_timeout_seconds=settings.transfer_queue_timeout_seconds,
+    )
+    return transfer_admission
+
 
 class TransferService:
     """
@@ -16,8 +43,9 @@ class TransferService:
 
     def __init__(self, settings: Settings):
         self.settings = settings
-        self.orthanc_repo = OrthancRepository(settings)
+        self.federation = PacsFederation(settings)
         self.joycare_repo = JoyCareRepository(settings)
+        configure_transfer_admission(settings)
 
     async def transfer_instance(
         self,
@@ -28,7 +56,26 @@ class TransferService:
     ) -> dict:
         """
         Transferir una instancia DICOM desde Orthanc a JoyCare.
-        
+
+        Pasa por el control de admisión con el tamaño del archivo
+        (`FileSize`); lanza AdmissionRejected si no hay capacidad.
+        """
+        orthanc_repo = await self.federation.locate("instances", instance_id)
+        details = await orthanc_repo.get_instance_details(instance_id)
+        async with transfer_admission.admit(int(details.get("FileSize") or 0)):
+            return await self._transfer_instance(
+                orthanc_repo, instance_id, neonato_id, uploader_medico_id, sede_id
+            )
+
+    async def _transfer_instance(
+        self,
+        orthanc_repo: OrthancRepository,
+        instance_id: str,
+        neonato_id: int,
+        uploader_medico_id: int,
+        sede_id: Optional[int]
+    ) -> dict:
+        """
         1. Descarga el archivo DICOM desde Orthanc
         2. Obtiene los tags para el nombre del archivo
         3. Sube el archivo a JoyCare
@@ -38,23 +85,42 @@ class TransferService:
             f"neonato={neonato_id}, médico={uploader_medico_id}"
         )
 
-        # 1. Descargar archivo DICOM desde Orthanc
-        file_bytes = await self.orthanc_repo.get_instance_file(instance_id)
+        # 1. Descargar archivo DICOM desde el PACS que tiene la instancia
+        file_bytes = await orthanc_repo.get_instance_file(instance_id)
         logger.info(f"Descargado de Orthanc: {len(file_bytes)} bytes")
 
         # 2. Obtener tags para construir un nombre de archivo descriptivo
         try:
-            tags = await self.orthanc_repo.get_instance_tags(instance_id)
-            patient_name = tags.get("PatientName", "unknown")
-            modality = tags.get("Modality", "US")
-            instance_number = tags.get("InstanceNumber", "0")
-            filename = f"{patient_name}_{modality}_{instance_number}.dcm"
-            # Limpiar caracteres no válidos
-            filename = "".join(c if c.isalnum() or c in "._-" else "_" for c in filename)
+            tags = await orthanc_repo.get_instance_tags(instance_id)
+            filename = self._build_filename(tags)
         except Exception:
             filename = f"{instance_id}.dcm"
 
         # 3. Subir a JoyCare
+        return await self._upload(
+            instance_id=instance_id,
+            file_bytes=file_bytes,
+            filename=filename,
+            neonato_id=neonato_id,
+            uploader_medico_id=uploader_medico_id,
+            sede_id=sede_id
+        )
+
+    @staticmethod
+    def _build_filename(tags: dict) -> str:
+        """Nombre de archivo descriptivo a partir de los tags de la instancia."""
+        return instance_filename(tags)
+
+    async def _upload(
+        self,
+        instance_id: str,
+        file_bytes: bytes,
+        filename: str,
+        neonato_id: int,
+        uploader_medico_id: int,
+        sede_id: Optional[int]
+    ) -> dict:
+        """Subir una instancia ya descargada a JoyCare."""
         result = await self.joycare_repo.upload_ecografia(
             neonato_id=neonato_id,
             file_bytes=file_bytes,
@@ -80,26 +146,76 @@ class TransferService:
         series_id: str,
         neonato_id: int,
         uploader_medico_id: int,
-        sede_id: Optional[int] = None
+        sede_id: Optional[int] = None,
+        exclude: Optional[Set[str]] = None
     ) -> dict:
         """
         Transferir TODAS las instancias de una serie desde Orthanc a JoyCare.
         
         Útil cuando una serie tiene múltiples imágenes (ej: ecografía con varios frames).
+        Las instancias de `exclude` (IDs de Orthanc ya enviados) se omiten.
+
+        Las instancias se suben de una en una, así que ante el control de
+        admisión la serie ocupa lo que su instancia más grande (`FileSize`).
+        Es trabajo masivo: sus llamadas a Orthanc y JoyCare ceden el paso a
+        las interactivas y se reparten por turnos con las de otros neonatos.
         """
         logger.info(f"Iniciando transferencia de serie completa: {series_id}")
 
         # Obtener todas las instancias de la serie
-        instances = await self.orthanc_repo.get_series_instances(series_id)
+        orthanc_repo = await self.federation.locate("series", series_id)
+        instances = await orthanc_repo.get_series_instances(series_id)
+        self.federation.remember(orthanc_repo, "instances", [inst.get("ID") for inst in instances])
         logger.info(f"Serie {series_id}: {len(instances)} instancias encontradas")
 
+        peak_bytes = max((int(inst.get("FileSize") or 0) for inst in instances), default=0)
+        async with transfer_admission.admit(peak_bytes):
+            with priority(BULK, neonato_id):
+                return await self._transfer_series(
+                    orthanc_repo, series_id, instances, neonato_id, uploader_medico_id, sede_id,
+                    exclude or set()
+                )
+
+    async def _transfer_series(
+        self,
+        orthanc_repo: OrthancRepository,
+        series_id: str,
+        instances: list,
+        neonato_id: int,
+        uploader_medico_id: int,
+        sede_id: Optional[int],
+        exclude: Set[str]
+    ) -> dict:
         results = []
         errors = []
+        pending = [inst.get("ID") for inst in instances if inst.get("ID") not in exclude]
+        skipped = len(instances) - len(pending)
 
-        for inst in instances:
-            instance_id = inst.get("ID")
+        # Con DIMSE (C-GET) o DICOMweb (WADO-RS) la serie llega en una sola
+        # operación; lo que no llegue por esas vías se transfiere instancia a
+        # instancia por REST
+        if self.settings.dimse_enabled and pending:
+            # pynetdicom solo se carga si DIMSE está habilitado
+            from src.repositories.dimse_repository import DimseRepository
+
+            dimse = DimseRepository(orthanc_repo)
+            if dimse.enabled:
+                pending = await self._transfer_series_dimse(
+                    dimse, orthanc_repo, series_id, pending, exclude,
+                    neonato_id, uploader_medico_id, sede_id, results, errors
+                )
+
+        dicomweb = DicomWebRepository(orthanc_repo)
+        if dicomweb.enabled and pending:
+            pending = await self._transfer_series_dicomweb(
+                dicomweb, orthanc_repo, series_id, pending, exclude,
+                neonato_id, uploader_medico_id, sede_id, results, errors
+            )
+
+        for instance_id in pending:
             try:
-                result = await self.transfer_instance(
+                result = await self._transfer_instance(
+                    orthanc_repo=orthanc_repo,
                     instance_id=instance_id,
                     neonato_id=neonato_id,
                     uploader_medico_id=uploader_medico_id,
@@ -119,10 +235,135 @@ class TransferService:
             "total_instances": len(instances),
             "transferred": len(results),
             "failed": len(errors),
+            "skipped": skipped,
             "results": results,
             "errors": errors
         }
 
+    async def _transfer_series_dicomweb(
+        self,
+        dicomweb: DicomWebRepository,
+        orthanc_repo: OrthancRepository,
+        series_id: str,
+        instance_ids: List[str],
+        exclude: Set[str],
+        neonato_id: int,
+        uploader_medico_id: int,
+        sede_id: Optional[int],
+        results: List[dict],
+        errors: List[dict]
+    ) -> List[str]:
+        """
+        Transferir una serie descargándola con WADO-RS en streaming: cada
+        instancia se sube a JoyCare en cuanto termina de llegar.
+
+        Devuelve los IDs de las instancias que no llegaron por DICOMweb.
+        """
+        remaining = set(instance_ids)
+        try:
+            study_uid, series_uid = await self._series_uids(orthanc_repo, series_id)
+            async for file_bytes in dicomweb.retrieve_series(study_uid, series_uid):
+                await self._upload_retrieved(
+                    file_bytes, study_uid, series_uid, series_id, remaining, exclude,
+                    neonato_id, uploader_medico_id, sede_id, results, errors
+                )
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            dicomweb.mark_unavailable(e)
+
+        return [instance_id for instance_id in instance_ids if instance_id in remaining]
+
+    async def _transfer_series_dimse(
+        self,
+        dimse: "DimseRepository",
+        orthanc_repo: OrthancRepository,
+        series_id: str,
+        instance_ids: List[str],
+        exclude: Set[str],
+        neonato_id: int,
+        uploader_medico_id: int,
+        sede_id: Optional[int],
+        results: List[dict],
+        errors: List[dict]
+    ) -> List[str]:
+        """
+        Transferir una serie recuperándola con C-GET: cada instancia llega al
+        spool en disco y se sube a JoyCare mientras las siguientes siguen
+        llegando por la misma asociación.
+
+        Devuelve los IDs de las instancias que no llegaron por DIMSE.
+        """
+        from src.repositories.dimse_repository import DimseError
+
+        remaining = set(instance_ids)
+        try:
+            study_uid, series_uid = await self._series_uids(orthanc_repo, series_id)
+            async for path in dimse.retrieve_series(study_uid, series_uid):
+                try:
+                    file_bytes = await asyncio.to_thread(read_file, path)
+                finally:
+                    await asyncio.to_thread(os.unlink, path)
+                await self._upload_retrieved(
+                    file_bytes, study_uid, series_uid, series_id, remaining, exclude,
+                    neonato_id, uploader_medico_id, sede_id, results, errors
+                )
+        except (httpx.HTTPError, KeyError, OSError, ValueError, DimseError, RuntimeError) as e:
+            dimse.mark_unavailable(e)
+
+        return [instance_id for instance_id in instance_ids if instance_id in remaining]
+
+    @staticmethod
+    async def _series_uids(orthanc_repo: OrthancRepository, series_id: str) -> Tuple[str, str]:
+        """StudyInstanceUID y SeriesInstanceUID de una serie."""
+        series = await orthanc_repo.get_series_details(series_id)
+        study = await orthanc_repo.get_study_details(series["ParentStudy"])
+        return study["MainDicomTags"]["StudyInstanceUID"], series["MainDicomTags"]["SeriesInstanceUID"]
+
+    async def _upload_retrieved(
+        self,
+        file_bytes: bytes,
+        study_uid: str,
+        series_uid: str,
+        series_id: str,
+        remaining: Set[str],
+        exclude: Set[str],
+        neonato_id: int,
+        uploader_medico_id: int,
+        sede_id: Optional[int],
+        results: List[dict],
+        errors: List[dict]
+    ) -> None:
+        """
+        Subir una instancia recibida por DIMSE o DICOMweb y marcarla como
+        recibida (las de `exclude` solo se descartan).
+        """
+        try:
+            tags = read_tags(file_bytes)
+        except Exception as e:
+            # Sin tags no se sabe qué instancia es: quedará para REST
+            logger.warning(f"Instancia ilegible recibida en serie {series_id}: {str(e)}")
+            return
+        instance_id = orthanc_id(
+            tags.get("PatientID", ""), study_uid, series_uid, tags.get("SOPInstanceUID", "")
+        )
+        remaining.discard(instance_id)
+        if instance_id in exclude:
+            return
+        try:
+            results.append(await self._upload(
+                instance_id=instance_id,
+                file_bytes=file_bytes,
+                filename=self._build_filename(tags),
+                neonato_id=neonato_id,
+                uploader_medico_id=uploader_medico_id,
+                sede_id=sede_id
+            ))
+        except Exception as e:
+            logger.error(f"Error transfiriendo instancia {instance_id}: {str(e)}")
+            errors.append({
+                "instance_id": instance_id,
+                "error": str(e)
+            })
+
     async def get_joycare_neonatos(self) -> list:
         """Obtener la lista de neonatos desde JoyCare (para el frontend)."""
         return await self.joycare_repo.get_neonatos()
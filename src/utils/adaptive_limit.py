@@ -0,0 +1,158 @@
+import math
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Optional, Tuple
+
+from src.config.settings import Settings
+
+# Respuestas que indican un upstream saturado (reducen el límite como un error)
+OVERLOAD_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+
+class AdaptiveLimiter:
+    """
+    Límite de concurrencia adaptativo hacia un upstream (gradiente + AIMD).
+
+    Compara la latencia reciente (media móvil corta) con la de referencia,
+    una estimación de la latencia sin carga: el mínimo de la media reciente,
+    al que se deja subir despacio (`baseline_drift_per_second`) para seguir
+    los cambios en la mezcla de llamadas (metadatos, previews, archivos).
+    Mientras la reciente no supere `tolerance` veces la de referencia el
+    límite crece, con un margen de la raíz del límite; si el upstream se
+    satura la latencia sube, el gradiente baja de 1 y el límite se reduce en
+    proporción. Un error (timeout, conexión rechazada, 5xx o 429) reduce el
+    límite multiplicativamente por `backoff`, como mucho una vez por cada
+    `limit` respuestas para no desplomarlo con una sola ráfaga.
+
+    Se recalcula una vez por ventana de `limit` respuestas (unas por RTT),
+    no con cada una: así el límite no oscila al ritmo de cada muestra. Solo
+    sube si de verdad se está usando (más de la mitad en curso): con poco
+    tráfico no hay información para subirlo.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 2,
+        max_limit: int = 64,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        smoothing: float = 0.2,
+        baseline_drift_per_second: float = 0.01,
+        history_size: int = 200,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.tolerance = max(1.0, tolerance)
+        self.backoff = min(max(backoff, 0.1), 0.99)
+        self.smoothing = smoothing
+        self.baseline_drift_per_second = baseline_drift_per_second
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.short_rtt = 0.0
+        self.baseline_rtt = 0.0
+        self._last_sample = 0.0
+        self._window_rtt = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0
+        self.samples = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+        self._since_drop = 0
+        self.history: Deque[Tuple[datetime, int, str]] = deque(maxlen=history_size)
+        self._record_change("inicial")
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _record_change(self, reason: str) -> None:
+        self.history.append((datetime.now(timezone.utc), self.limit, reason))
+
+    def _set(self, value: float, reason: str) -> None:
+        before = self.limit
+        self._limit = min(max(value, self.min_limit), self.max_limit)
+        if self.limit != before:
+            if self.limit > before:
+                self.increases += 1
+            else:
+                self.decreases += 1
+            self._record_change(reason)
+
+    def record(self, rtt_seconds: float, in_flight: int, error: bool) -> int:
+        """Registrar una respuesta (latencia, llamadas en curso, error) y devolver el nuevo límite."""
+        self.samples += 1
+        self._since_drop += 1
+
+        if error:
+            self.errors += 1
+            if self._since_drop >= self.limit:
+                self._since_drop = 0
+                self._set(self._limit * self.backoff, "error")
+            return self.limit
+
+        self._window_rtt += rtt_seconds
+        self._window_count += 1
+        self._window_in_flight = max(self._window_in_flight, in_flight)
+        if self._window_count < max(self.limit, 4):
+            return self.limit
+
+        window_rtt = self._window_rtt / self._window_count
+        in_flight = self._window_in_flight
+        self._window_rtt = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0
+
+        now = time.monotonic()
+        if self.baseline_rtt <= 0:
+            self.short_rtt = self.baseline_rtt = window_rtt
+            self._last_sample = now
+            return self.limit
+        self.short_rtt += 0.5 * (window_rtt - self.short_rtt)
+        drift = math.exp(self.baseline_drift_per_second * (now - self._last_sample))
+        self._last_sample = now
+        self.baseline_rtt = min(self.baseline_rtt * drift, self.short_rtt)
+
+        if self.short_rtt <= 0:
+            return self.limit
+        gradient = max(0.5, min(1.0, self.tolerance * self.baseline_rtt / self.short_rtt))
+        if gradient >= 1.0 and in_flight < self._limit / 2:
+            # Con el límite infrautilizado no se sabe si aguantaría más
+            return self.limit
+
+        target = self._limit * gradient + math.sqrt(self._limit)
+        value = self._limit * (1 - self.smoothing) + target * self.smoothing
+        self._set(value, "latencia" if gradient < 1.0 else "holgura")
+        return self.limit
+
+    def stats(self) -> dict:
+        """Límite actual, latencias de referencia e historial de cambios."""
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "short_rtt_ms": round(1000 * self.short_rtt, 2),
+            "baseline_rtt_ms": round(1000 * self.baseline_rtt, 2),
+            "samples": self.samples,
+            "errors": self.errors,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "history": [
+                {"at": at, "limit": limit, "reason": reason}
+                for at, limit, reason in self.history
+            ],
+        }
+
+
+def adaptive_limiter(settings: Settings, initial: int) -> Optional[AdaptiveLimiter]:
+    """Límite adaptativo para un upstream que empieza en `initial` (None si está deshabilitado)."""
+    if not settings.scheduler_adaptive:
+        return None
+    return AdaptiveLimiter(
+        initial,
+        min_limit=settings.scheduler_adaptive_min,
+        max_limit=settings.scheduler_adaptive_max,
+        tolerance=settings.scheduler_adaptive_tolerance,
+        backoff=settings.scheduler_adaptive_backoff,
+    )
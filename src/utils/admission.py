@@ -0,0 +1,156 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Tuple
+
+
+class AdmissionRejected(Exception):
+    """No hay capacidad para la transferencia; reintentar tras `retry_after` segundos."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Control de admisión: como mucho `max_active` trabajos a la vez y, entre
+    todos, `max_bytes` de datos en memoria (lo que cada trabajo declara al
+    entrar).
+
+    Lo que no cabe espera en una cola FIFO acotada (`max_queued`) hasta
+    `queue_timeout_seconds`; si la cola está llena o se agota la espera se
+    rechaza con `AdmissionRejected`, que incluye una estimación de cuándo
+    reintentar. Un trabajo más grande que todo el presupuesto se admite solo
+    cuando no hay nada más en curso, para que no quede bloqueado siempre.
+    """
+
+    def __init__(self):
+        self.max_active = 1
+        self.max_bytes = 0
+        self.max_queued = 0
+        self.queue_timeout_seconds = 0.0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self.active = 0
+        self.inflight_bytes = 0
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected = 0
+        self._wait_seconds = 0.0
+        self._avg_duration = 1.0
+
+    def configure(self, max_active: int, max_bytes: int, max_queued: int, queue_timeout_seconds: float) -> None:
+        """Actualizar los límites (se llama con la configuración de cada petición)."""
+        changed = (max(1, max_active), max(0, max_bytes)) != (self.max_active, self.max_bytes)
+        self.max_active = max(1, max_active)
+        self.max_bytes = max(0, max_bytes)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout_seconds = max(0.0, queue_timeout_seconds)
+        if changed:
+            self._wake()
+
+    def _fits(self, nbytes: int) -> bool:
+        if self.active >= self.max_active:
+            return False
+        return self.active == 0 or self.inflight_bytes + nbytes <= self.max_bytes
+
+    def _take(self, nbytes: int) -> None:
+        self.active += 1
+        self.inflight_bytes += nbytes
+        self.admitted += 1
+
+    def _release(self, nbytes: int) -> None:
+        self.active -= 1
+        self.inflight_bytes -= nbytes
+        self._wake()
+
+    def _wake(self) -> None:
+        # FIFO estricto: si el primero no cabe, los siguientes esperan detrás
+        while self._waiters:
+            nbytes, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self._take(nbytes)
+            future.set_result(None)
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Esperar (como mucho `timeout` s) a que no quede nada en curso ni en cola."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.active or self._waiters:
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que haya hueco, según la duración media."""
+        rounds = (len(self._waiters) + self.max_active) / self.max_active
+        return min(300, max(1, math.ceil(self._avg_duration * rounds)))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(reason, self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, nbytes: int) -> AsyncIterator[None]:
+        """Reservar un hueco y `nbytes` del presupuesto mientras dura el bloque."""
+        nbytes = max(0, nbytes)
+        if not self._waiters and self._fits(nbytes):
+            self._take(nbytes)
+        else:
+            if len(self._waiters) >= self.max_queued:
+                raise self._reject("Capacidad de transferencias agotada y cola llena")
+            future = asyncio.get_running_loop().create_future()
+            entry = (nbytes, future)
+            self._waiters.append(entry)
+            self.queued_total += 1
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(future, self.queue_timeout_seconds)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                if future.done() and not future.cancelled():
+                    # Admitida justo al vencer el plazo: devolver el hueco
+                    self._release(nbytes)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise self._reject(
+                    f"Sin capacidad para la transferencia tras {self.queue_timeout_seconds:.0f}s en cola"
+                ) from None
+            finally:
+                self._wait_seconds += time.monotonic() - start
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            # Media móvil de la duración, para estimar Retry-After
+            self._avg_duration += 0.2 * ((time.monotonic() - start) - self._avg_duration)
+            self._release(nbytes)
+
+    def stats(self) -> dict:
+        """Uso actual y contadores."""
+        return {
+            "max_concurrent": self.max_active,
+            "active": self.active,
+            "max_inflight_bytes": self.max_bytes,
+            "inflight_bytes": self.inflight_bytes,
+            "concurrency_utilization": round(self.active / self.max_active, 3),
+            "bytes_utilization": round(self.inflight_bytes / self.max_bytes, 3) if self.max_bytes else 0.0,
+            "max_queued": self.max_queued,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected": self.rejected,
+            "avg_queue_wait_ms": round(1000 * self._wait_seconds / self.queued_total, 1) if self.queued_total else 0.0,
+            "avg_duration_seconds": round(self._avg_duration, 3),
+            "retry_after_seconds": self.retry_after(),
+        }
@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from pynetdicom import AE, build_role, evt
+from pynetdicom.association import Association
+
+logger = logging.getLogger("atim")
+
+StoreSink = Callable[[evt.Event], int]
+
+
+class PooledAssociation:
+    """Asociación abierta del pool y destino actual de sus C-STORE entrantes."""
+
+    def __init__(self, pool: "AssociationPool"):
+        self.pool = pool
+        self.assoc: Optional[Association] = None
+        self.sink: Optional[StoreSink] = None
+        self.last_used = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.assoc is not None and self.assoc.is_established
+
+    def on_store(self, event: evt.Event) -> int:
+        """Handler de EVT_C_STORE: reenviar a quien esté usando la asociación."""
+        if self.sink is None:
+            # Sub-operación fuera de una recuperación (no debería ocurrir)
+            return 0xA700
+        return self.sink(event)
+
+
+class AssociationPool:
+    """
+    Asociaciones DIMSE reutilizables contra un mismo SCP.
+
+    Abrir una asociación (TCP + A-ASSOCIATE con todos los contextos de
+    presentación) cuesta varios round-trips; el pool las mantiene abiertas
+    entre recuperaciones y las cierra cuando llevan `idle_seconds` sin uso.
+    Como mucho `max_size` asociaciones a la vez: quien pide una más espera.
+
+    pynetdicom es síncrono: las operaciones se ejecutan en `executor`, que
+    tiene un hilo por asociación posible.
+    """
+
+    def __init__(
+        self,
+        ae_title: str,
+        host: str,
+        port: int,
+        called_ae_title: str,
+        contexts: List[tuple],
+        scp_sop_classes: List[str],
+        max_size: int = 2,
+        idle_seconds: float = 20.0,
+        timeout_seconds: float = 60.0,
+    ):
+        self.host = host
+        self.port = port
+        self.called_ae_title = called_ae_title
+        self.max_size = max(1, max_size)
+        self.idle_seconds = idle_seconds
+
+        self.ae = AE(ae_title=ae_title)
+        self.ae.acse_timeout = timeout_seconds
+        self.ae.dimse_timeout = timeout_seconds
+        self.ae.network_timeout = timeout_seconds
+        for abstract_syntax, transfer_syntaxes in contexts:
+            self.ae.add_requested_context(abstract_syntax, transfer_syntaxes)
+        # En C-GET el SCP nos envía las instancias por la misma asociación:
+        # hay que negociar el rol de SCP de almacenamiento para cada clase
+        self._roles = [build_role(uid, scp_role=True) for uid in scp_sop_classes]
+
+        self._idle: List[PooledAssociation] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_size, thread_name_prefix="dimse")
+        self.active = 0
+        self.opened = 0
+        self.reused = 0
+        self.failed = 0
+        self.closed_idle = 0
+
+    def _open(self) -> PooledAssociation:
+        pooled = PooledAssociation(self)
+        assoc = self.ae.associate(
+            self.host,
+            self.port,
+            ae_title=self.called_ae_title,
+            ext_neg=self._roles,
+            evt_handlers=[(evt.EVT_C_STORE, pooled.on_store)],
+        )
+        if not assoc.is_established:
+            with self._lock:
+                self.failed += 1
+            raise ConnectionError(
+                f"Asociación DIMSE rechazada por {self.called_ae_title}@{self.host}:{self.port}"
+            )
+        with self._lock:
+            self.opened += 1
+        pooled.assoc = assoc
+        return pooled
+
+    def _take_idle(self) -> Optional[PooledAssociation]:
+        now = time.monotonic()
+        found = None
+        stale = []
+        with self._lock:
+            while self._idle and found is None:
+                pooled = self._idle.pop()
+                if pooled.alive and now - pooled.last_used < self.idle_seconds:
+                    found = pooled
+                else:
+                    stale.append(pooled)
+            self.closed_idle += len(stale)
+        # A-RELEASE espera respuesta del peer: fuera del lock
+        for pooled in stale:
+            self._close(pooled)
+        return found
+
+    @staticmethod
+    def _close(pooled: PooledAssociation) -> None:
+        if pooled.alive:
+            pooled.assoc.release()
+
+    @contextmanager
+    def acquire(self, sink: StoreSink) -> Iterator[Association]:
+        """
+        Reservar una asociación y dirigir sus C-STORE entrantes a `sink`.
+        Si algo falla durante el uso, la asociación se aborta en lugar de
+        volver al pool.
+        """
+        self._slots.acquire()
+        pooled = None
+        healthy = False
+        try:
+            pooled = self._take_idle()
+            if pooled is None:
+                pooled = self._open()
+            else:
+                with self._lock:
+                    self.reused += 1
+            pooled.sink = sink
+            with self._lock:
+                self.active += 1
+            try:
+                yield pooled.assoc
+                healthy = pooled.alive
+            finally:
+                with self._lock:
+                    self.active -= 1
+                pooled.sink = None
+        finally:
+            if pooled is not None and pooled.assoc is not None:
+                if healthy:
+                    pooled.last_used = time.monotonic()
+                    with self._lock:
+                        self._idle.append(pooled)
+                elif pooled.alive:
+                    pooled.assoc.abort()
+            self._slots.release()
+
+    def close_idle(self, force: bool = False) -> int:
+        """Cerrar las asociaciones ociosas (todas si `force`). Devuelve cuántas."""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            keep = []
+            for pooled in self._idle:
+                if force or not pooled.alive or now - pooled.last_used >= self.idle_seconds:
+                    stale.append(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+            self.closed_idle += len(stale)
+        for pooled in stale:
+            self._close(pooled)
+        return len(stale)
+
+    def stats(self) -> dict:
+        """Estado del pool."""
+        return {
+            "peer": f"{self.called_ae_title}@{self.host}:{self.port}",
+            "max_size": self.max_size,
+            "active": self.active,
+            "idle": len(self._idle),
+            "opened": self.opened,
+            "reused": self.reused,
+            "failed": self.failed,
+            "closed_idle": self.closed_idle,
+        }
@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Optional, Tuple
+
+_MISSING = object()
+
+
+def _size(value: Any) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(len(item) for item in value if isinstance(item, (bytes, bytearray)))
+    return 0
+
+
+class TTLCache:
+    """
+    Caché LRU en memoria con expiración por entrada.
+
+    Se limita por número de entradas y, opcionalmente, por bytes (para
+    contenido binario como previews: cuentan los valores `bytes` y los
+    `bytes` de primer nivel de una tupla, p. ej. `(imagen, índice)`). No es thread-safe: está pensada para
+    usarse desde el event loop de la aplicación.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024, max_bytes: Optional[int] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Obtener un valor vigente, o `default` si no existe o expiró."""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def contains(self, key: Hashable) -> bool:
+        """Saber si hay un valor vigente sin contarlo como acierto ni fallo."""
+        entry = self._data.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """Guardar un valor durante `ttl` segundos (ttl <= 0 no guarda nada)."""
+        if ttl <= 0:
+            return
+
+        size = _size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        if key in self._data:
+            self._remove(key)
+
+        self._data[key] = (time.monotonic() + ttl, value, size)
+        self._bytes += size
+        self._evict()
+
+    def pop(self, key: Hashable) -> None:
+        """Invalidar una entrada."""
+        if key in self._data:
+            self._remove(key)
+
+    def dump(self) -> List[Tuple[Hashable, Any, float]]:
+        """Entradas vigentes (de la menos a la más usada) con los segundos que les quedan."""
+        now = time.monotonic()
+        return [
+            (key, value, expires_at - now)
+            for key, (expires_at, value, _) in self._data.items()
+            if expires_at > now
+        ]
+
+    def load(self, entries: Iterable[Tuple[Hashable, Any, float]]) -> int:
+        """Añadir entradas volcadas con `dump` (sin pisar las que ya haya); devuelve cuántas."""
+        loaded = 0
+        for key, value, ttl in entries:
+            if ttl > 0 and key not in self._data:
+                self.set(key, value, ttl)
+                loaded += 1
+        return loaded
+
+    def clear(self) -> None:
+        """Vaciar la caché."""
+        self._data.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Contadores de uso de la caché."""
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,108 @@
+import fcntl
+import gzip
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
+
+from src.utils.cache import TTLCache
+
+logger = logging.getLogger("atim")
+
+_SNAPSHOT_VERSION = 1
+
+# Entradas vigentes por caché: clave → (valor, segundos que le quedan)
+_Entries = Dict[str, Dict[Hashable, Tuple[Any, float]]]
+
+
+def _key(value: Any) -> Any:
+    # JSON guarda las tuplas como listas: las claves vuelven a ser tuplas
+    if isinstance(value, list):
+        return tuple(_key(item) for item in value)
+    return value
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    # Varios workers guardan al apagarse a la vez: uno detrás de otro
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _read_entries(path: str) -> _Entries:
+    """Entradas aún vigentes de un snapshot (descontando el tiempo desde que se guardó)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Snapshot de cachés ilegible en {path}: {e}")
+        return {}
+    if snapshot.get("version") != _SNAPSHOT_VERSION:
+        return {}
+
+    elapsed = max(0.0, time.time() - float(snapshot.get("saved_at", 0)))
+    caches: _Entries = {}
+    for name, entries in snapshot.get("caches", {}).items():
+        caches[name] = {
+            _key(key): (value, ttl - elapsed)
+            for key, value, ttl in entries
+            if ttl - elapsed > 0
+        }
+    return caches
+
+
+def save_snapshot(path: str, caches: List[TTLCache]) -> int:
+    """
+    Guardar las entradas vigentes de `caches` (con el TTL que les queda) en
+    un JSON comprimido con gzip, mezcladas con las que ya hubiera en el
+    archivo: con varios workers cada uno añade las suyas y se conservan las
+    de cachés que este proceso no guarda. Se escribe a un temporal y se
+    renombra, así que un apagado a medias no deja un snapshot corrupto.
+    Devuelve cuántas entradas tiene el snapshot. Llamar con asyncio.to_thread.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with _locked(path):
+        merged = _read_entries(path)
+        for cache in caches:
+            entries = merged.setdefault(cache.name, {})
+            for key, value, ttl in cache.dump():
+                if isinstance(value, (bytes, bytearray)):
+                    continue
+                previous = entries.get(key)
+                if previous is None or ttl >= previous[1]:
+                    entries[key] = (value, ttl)
+
+        snapshot = {
+            "version": _SNAPSHOT_VERSION,
+            "saved_at": time.time(),
+            "caches": {
+                name: [[key, value, round(ttl, 3)] for key, (value, ttl) in entries.items()]
+                for name, entries in merged.items()
+            },
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    return sum(len(entries) for entries in merged.values())
+
+
+def load_snapshot(path: str, caches: List[TTLCache]) -> int:
+    """
+    Cargar un snapshot guardado con `save_snapshot`. A cada entrada se le
+    descuenta el tiempo transcurrido desde que se guardó: las que habrían
+    caducado mientras ATIM estaba parado no se cargan. Devuelve cuántas
+    entradas se cargaron. Llamar con asyncio.to_thread.
+    """
+    merged = _read_entries(path)
+    total = 0
+    for cache in caches:
+        entries = merged.get(cache.name, {})
+        total += cache.load((key, value, ttl) for key, (value, ttl) in entries.items())
+    return total
@@ -0,0 +1,49 @@
+import os
+from io import BytesIO
+from typing import Dict, Iterable, Union
+
+# Tags necesarios para identificar una instancia y nombrar su archivo
+IDENTITY_TAGS = (
+    "PatientID", "PatientName", "StudyInstanceUID", "SeriesInstanceUID",
+    "SOPInstanceUID", "Modality", "InstanceNumber",
+)
+
+
+def read_tags(
+    data: Union[bytes, str, os.PathLike],
+    keywords: Iterable[str] = IDENTITY_TAGS
+) -> Dict[str, str]:
+    """
+    Leer tags de un archivo DICOM (en memoria o en disco) sin decodificar el
+    pixel data.
+
+    Devuelve solo los tags presentes, como texto (igual que `simplified-tags`
+    de Orthanc).
+    """
+    import pydicom  # diferido: no cargarlo al arrancar ATIM
+
+    keywords = list(keywords)
+    source = BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+    ds = pydicom.dcmread(source, stop_before_pixels=True, specific_tags=keywords)
+    tags = {}
+    for keyword in keywords:
+        value = ds.get(keyword)
+        if value is not None:
+            tags[keyword] = str(value)
+    return tags
+
+
+def instance_filename(tags: Dict[str, str]) -> str:
+    """Nombre de archivo descriptivo a partir de los tags de la instancia."""
+    patient_name = tags.get("PatientName", "unknown")
+    modality = tags.get("Modality", "US")
+    instance_number = tags.get("InstanceNumber", "0")
+    filename = f"{patient_name}_{modality}_{instance_number}.dcm"
+    # Limpiar caracteres no válidos
+    return "".join(c if c.isalnum() or c in "._-" else "_" for c in filename)
+
+
+def read_file(path: str) -> bytes:
+    """Contenido de un archivo del spool (para llamar con asyncio.to_thread)."""
+    with open(path, "rb") as f:
+        return f.read()
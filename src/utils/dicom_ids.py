@@ -0,0 +1,14 @@
+import hashlib
+
+
+def orthanc_id(*uids: str) -> str:
+    """
+    Calcular el identificador que Orthanc asigna a un recurso a partir de sus UIDs.
+
+    Orthanc usa el SHA-1 de los identificadores DICOM de la jerarquía unidos
+    por '|', en 5 grupos de 8 caracteres:
+    paciente = (PatientID), estudio = (PatientID, StudyInstanceUID),
+    serie = (..., SeriesInstanceUID), instancia = (..., SOPInstanceUID).
+    """
+    digest = hashlib.sha1("|".join(uids).encode()).hexdigest()
+    return "-".join(digest[i:i + 8] for i in range(0, 40, 8))
@@ -0,0 +1,45 @@
+from typing import Any, Dict
+
+# Tags que ATIM pide por QIDO-RS (keyword → tag en hexadecimal)
+TAGS = {
+    "PatientName": "00100010",
+    "PatientID": "00100020",
+    "PatientBirthDate": "00100030",
+    "PatientSex": "00100040",
+    "StudyInstanceUID": "0020000D",
+    "StudyDate": "00080020",
+    "StudyTime": "00080030",
+    "StudyDescription": "00081030",
+    "AccessionNumber": "00080050",
+    "InstitutionName": "00080080",
+    "ModalitiesInStudy": "00080061",
+    "NumberOfStudyRelatedSeries": "00201206",
+    "NumberOfStudyRelatedInstances": "00201208",
+    "SeriesInstanceUID": "0020000E",
+    "SeriesNumber": "00200011",
+    "SeriesDescription": "0008103E",
+    "Modality": "00080060",
+    "NumberOfSeriesRelatedInstances": "00201209",
+    "SOPInstanceUID": "00080018",
+    "InstanceNumber": "00200013",
+}
+_KEYWORDS = {tag: keyword for keyword, tag in TAGS.items()}
+
+
+def simplify(dataset: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convertir un objeto DICOM JSON (PS3.18 F.2) en un dict keyword → valor.
+
+    Los valores únicos se desenvuelven, los nombres de persona (PN) se reducen
+    a su representación alfabética y los tags desconocidos conservan su clave
+    hexadecimal.
+    """
+    result = {}
+    for tag, element in dataset.items():
+        values = element.get("Value")
+        if values is None:
+            continue
+        if element.get("vr") == "PN":
+            values = [v.get("Alphabetic") if isinstance(v, dict) else v for v in values]
+        result[_KEYWORDS.get(tag.upper(), tag)] = values[0] if len(values) == 1 else values
+    return result
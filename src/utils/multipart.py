@@ -0,0 +1,94 @@
+from typing import Dict, List, Optional, Tuple
+
+Part = Tuple[Dict[str, str], bytes]
+
+
+def parse_boundary(content_type: str) -> str:
+    """Extraer el boundary de una cabecera Content-Type multipart."""
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary":
+            return value.strip().strip('"')
+    raise ValueError(f"Content-Type sin boundary: {content_type}")
+
+
+class MultipartParser:
+    """
+    Parser incremental de cuerpos multipart (p. ej. multipart/related de WADO-RS).
+
+    Se le van pasando trozos con `feed()` según llegan de la red y devuelve
+    las partes completas en cuanto se cierran, de modo que en memoria solo
+    queda la parte en curso y no la respuesta entera.
+    """
+
+    def __init__(self, boundary: str):
+        self._delimiter = b"--" + boundary.encode()
+        self._separator = b"\r\n" + self._delimiter
+        self._buffer = bytearray()
+        self._state = "preamble"
+        self._headers: Dict[str, str] = {}
+        self._scan_from = 0
+        self.finished = False
+
+    def feed(self, chunk: bytes) -> List[Part]:
+        """Añadir datos y devolver las partes que quedaron completas."""
+        self._buffer += chunk
+        parts: List[Part] = []
+
+        while not self.finished:
+            if self._state == "preamble":
+                index = self._buffer.find(self._delimiter)
+                if index < 0:
+                    # Conservar un posible delimitador partido entre trozos
+                    del self._buffer[:max(0, len(self._buffer) - len(self._delimiter))]
+                    break
+                del self._buffer[:index + len(self._delimiter)]
+                self._state = "after_delimiter"
+
+            elif self._state == "after_delimiter":
+                if len(self._buffer) < 2:
+                    break
+                if self._buffer[:2] == b"--":
+                    self.finished = True
+                    break
+                line_end = self._buffer.find(b"\r\n")
+                if line_end < 0:
+                    break
+                del self._buffer[:line_end + 2]
+                self._state = "headers"
+
+            elif self._state == "headers":
+                if len(self._buffer) < 2:
+                    break
+                if self._buffer[:2] == b"\r\n":
+                    # Parte sin cabeceras
+                    self._headers = {}
+                    del self._buffer[:2]
+                else:
+                    end = self._buffer.find(b"\r\n\r\n")
+                    if end < 0:
+                        break
+                    self._headers = self._parse_headers(bytes(self._buffer[:end]))
+                    del self._buffer[:end + 4]
+                self._state = "body"
+                self._scan_from = 0
+
+            elif self._state == "body":
+                index = self._buffer.find(self._separator, self._scan_from)
+                if index < 0:
+                    self._scan_from = max(0, len(self._buffer) - len(self._separator) + 1)
+                    break
+                parts.append((self._headers, bytes(self._buffer[:index])))
+                del self._buffer[:index + len(self._separator)]
+                self._state = "after_delimiter"
+
+        return parts
+
+    @staticmethod
+    def _parse_headers(raw: bytes) -> Dict[str, str]:
+        headers = {}
+        for line in raw.decode("latin-1").split("\r\n"):
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        return headers
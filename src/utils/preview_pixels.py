@@ -0,0 +1,184 @@
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pydicom
+from PIL import Image
+from pydicom.dataset import FileMetaDataset
+from pydicom.encaps import encapsulate, generate_pixel_data_frame
+from pydicom.pixel_data_handlers.util import convert_color_space
+from pydicom.uid import UID
+
+from src.utils.preview_render import PreviewOptions
+
+# Render de previews y mosaicos: solo se importa en los procesos del pool
+# (ver `run_in_render_pool`)
+
+_PIL_FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+# Tags del módulo de imagen necesarios para decodificar un frame suelto
+FRAME_TAGS = (
+    "Rows", "Columns", "SamplesPerPixel", "PhotometricInterpretation",
+    "PlanarConfiguration", "BitsAllocated", "BitsStored", "HighBit",
+    "PixelRepresentation", "RescaleSlope", "RescaleIntercept",
+    "WindowCenter", "WindowWidth",
+)
+_INT_TAGS = {
+    "Rows", "Columns", "SamplesPerPixel", "PlanarConfiguration",
+    "BitsAllocated", "BitsStored", "HighBit", "PixelRepresentation",
+}
+
+
+def _first_frame_only(ds: pydicom.Dataset) -> None:
+    """Dejar solo el primer frame para no decodificar el cine completo."""
+    frames = int(ds.get("NumberOfFrames") or 1)
+    if frames <= 1:
+        return
+    if ds.file_meta.TransferSyntaxUID.is_compressed:
+        first = next(generate_pixel_data_frame(ds.PixelData, frames))
+        ds.PixelData = encapsulate([first])
+    else:
+        frame_bytes = ds.Rows * ds.Columns * ds.SamplesPerPixel * (ds.BitsAllocated // 8)
+        ds.PixelData = ds.PixelData[:frame_bytes]
+    ds.NumberOfFrames = 1
+
+
+def _downscale(pixels: np.ndarray, size: int) -> np.ndarray:
+    """
+    Reducir para que el lado mayor mida como mucho `size`: media por bloques
+    del factor entero (antialiasing) y muestreo al tamaño exacto.
+    """
+    height, width = pixels.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1.0:
+        return pixels
+    factor = int(1 / scale)
+    if factor > 1:
+        h, w = height // factor * factor, width // factor * factor
+        pixels = pixels[:h, :w].reshape(
+            h // factor, factor, w // factor, factor, *pixels.shape[2:]
+        ).mean(axis=(1, 3))
+    out_h = max(1, round(height * scale))
+    out_w = max(1, round(width * scale))
+    rows = (np.arange(out_h) * pixels.shape[0] / out_h).astype(np.intp)
+    cols = (np.arange(out_w) * pixels.shape[1] / out_w).astype(np.intp)
+    return pixels[rows][:, cols]
+
+
+def _first_value(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, pydicom.multival.MultiValue):
+        value = value[0] if value else None
+    return float(value) if value is not None else None
+
+
+def _window(pixels: np.ndarray, center: Optional[float], width: Optional[float]) -> np.ndarray:
+    """Ventana/nivel lineal (DICOM PS3.3 C.11.2.1.2) a 8 bits; sin ventana, min/max."""
+    if center is None or width is None or width < 1:
+        low, high = float(pixels.min()), float(pixels.max())
+        center, width = (low + high) / 2, max(high - low, 1.0)
+    scaled = (pixels - (center - 0.5)) / max(width - 1, 1.0) + 0.5
+    return (np.clip(scaled, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def _encode(image: np.ndarray, mode: str, image_format: str, quality: int) -> bytes:
+    out = BytesIO()
+    params = {"quality": quality} if image_format != "png" else {"compress_level": 6}
+    Image.fromarray(image, mode).save(out, _PIL_FORMATS[image_format], **params)
+    return out.getvalue()
+
+
+def _frame_dataset(tags: Dict[str, str], transfer_syntax: str, frame: bytes) -> pydicom.Dataset:
+    """Dataset de un solo frame a partir de los tags simplificados y sus bytes tal cual."""
+    uid = UID(transfer_syntax)
+    ds = pydicom.Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = uid
+    ds.is_little_endian = uid.is_little_endian
+    ds.is_implicit_VR = uid.is_implicit_VR
+    for keyword in FRAME_TAGS:
+        value = tags.get(keyword)
+        if value not in (None, ""):
+            setattr(ds, keyword, int(value) if keyword in _INT_TAGS else value)
+    ds.NumberOfFrames = 1
+    if uid.is_compressed:
+        ds.add_new(0x7FE00010, "OB", encapsulate([frame]))
+    else:
+        ds.add_new(0x7FE00010, "OW" if int(ds.get("BitsAllocated") or 8) > 8 else "OB", frame)
+    return ds
+
+
+def render_preview(file_bytes: bytes, options: PreviewOptions) -> bytes:
+    """Decodificar el primer frame de un archivo DICOM y codificarlo como miniatura."""
+    ds = pydicom.dcmread(BytesIO(file_bytes))
+    _first_frame_only(ds)
+    return _render(ds, options)
+
+
+def render_frame_preview(
+    tags: Dict[str, str], transfer_syntax: str, frame: bytes, options: PreviewOptions
+) -> bytes:
+    """Como `render_preview`, pero con un frame suelto (`/frames/0/raw`) y los tags de la instancia."""
+    return _render(_frame_dataset(tags, transfer_syntax, frame), options)
+
+
+def _render(ds: pydicom.Dataset, options: PreviewOptions) -> bytes:
+    pixels = ds.pixel_array
+    photometric = str(ds.get("PhotometricInterpretation", "MONOCHROME2"))
+
+    if int(ds.get("SamplesPerPixel") or 1) == 1:
+        pixels = pixels.astype(np.float32)
+        pixels = _downscale(pixels, options.size)
+        slope = float(ds.get("RescaleSlope") or 1.0)
+        intercept = float(ds.get("RescaleIntercept") or 0.0)
+        if slope != 1.0 or intercept != 0.0:
+            pixels = pixels * slope + intercept
+        center, width = options.window_center, options.window_width
+        if center is None:
+            center, width = _first_value(ds.get("WindowCenter")), _first_value(ds.get("WindowWidth"))
+        image = _window(pixels, center, width)
+        if photometric == "MONOCHROME1":
+            image = 255 - image
+        mode = "L"
+    else:
+        if photometric in ("YBR_FULL", "YBR_FULL_422"):
+            pixels = convert_color_space(pixels, photometric, "RGB")
+        if int(ds.get("BitsStored") or 8) > 8:
+            pixels = pixels >> (int(ds.BitsStored) - 8)
+        image = _downscale(pixels, options.size).astype(np.uint8)
+        mode = "RGB"
+
+    return _encode(image, mode, options.image_format, options.quality)
+
+
+def compose_mosaic(
+    thumbnails: List[Optional[bytes]],
+    tile: int,
+    columns: int,
+    image_format: str,
+    quality: int
+) -> Tuple[bytes, List[Optional[Tuple[int, int, int, int]]]]:
+    """
+    Colocar las miniaturas en una rejilla de `columns` columnas con celdas de
+    `tile` píxeles (cada una centrada en su celda, fondo negro). Devuelve la
+    imagen y, por miniatura, su rectángulo (x, y, ancho, alto); None donde no
+    había miniatura.
+    """
+    rows = max(1, -(-len(thumbnails) // columns))
+    canvas = np.zeros((rows * tile, columns * tile, 3), dtype=np.uint8)
+    boxes: List[Optional[Tuple[int, int, int, int]]] = []
+    for index, data in enumerate(thumbnails):
+        if data is None:
+            boxes.append(None)
+            continue
+        with Image.open(BytesIO(data)) as thumbnail:
+            pixels = np.asarray(thumbnail.convert("RGB"))
+        pixels = _downscale(pixels, tile)
+        height, width = pixels.shape[:2]
+        x = (index % columns) * tile + (tile - width) // 2
+        y = (index // columns) * tile + (tile - height) // 2
+        canvas[y:y + height, x:x + width] = pixels
+        boxes.append((x, y, width, height))
+    return _encode(canvas, "RGB", image_format, quality), boxes
+
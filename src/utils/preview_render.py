@@ -0,0 +1,95 @@
+import asyncio
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, NamedTuple, Optional
+
+from src.config.settings import Settings
+
+PREVIEW_FORMATS = ("jpeg", "png", "webp")
+
+
+class PreviewOptions(NamedTuple):
+    """Parámetros de una preview renderizada (también forman la clave de caché)."""
+    size: int
+    image_format: str
+    quality: int
+    window_center: Optional[float] = None
+    window_width: Optional[float] = None
+
+
+def preview_options(
+    settings: Settings,
+    size: Optional[int] = None,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    window_center: Optional[float] = None,
+    window_width: Optional[float] = None
+) -> Optional[PreviewOptions]:
+    """
+    Parámetros completos de una preview local (lo que no se indique, de la
+    configuración), o None para usar la PNG de Orthanc: solo si el render
+    local está deshabilitado y no se pidió ningún parámetro.
+    """
+    requested = (size, image_format, quality, window_center, window_width)
+    if not settings.preview_local_render and all(value is None for value in requested):
+        return None
+    if window_center is None or window_width is None:
+        window_center = window_width = None
+    return PreviewOptions(
+        size=size or settings.preview_size,
+        image_format=image_format or settings.preview_format,
+        quality=quality or settings.preview_quality,
+        window_center=window_center,
+        window_width=window_width,
+    )
+
+
+# ============================
+# Pool de procesos
+# ============================
+
+# El render es CPU puro: en procesos aparte no bloquea el event loop ni
+# compite por el GIL con las peticiones
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: no heredar hilos ni sockets del servidor
+        _pool = ProcessPoolExecutor(
+            max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def _call(name: str, *args: Any) -> Any:
+    # En el proceso del pool: NumPy, Pillow y pydicom se cargan aquí, nunca en
+    # el worker de ATIM
+    return getattr(importlib.import_module("src.utils.preview_pixels"), name)(*args)
+
+
+async def run_in_render_pool(workers: int, name: str, *args: Any) -> Any:
+    """
+    Ejecutar `name` de preview_pixels (`render_frame_preview`, `render_preview`
+    o `compose_mosaic`)
+    en el pool de procesos (se recrea si un proceso muere).
+    """
+    global _pool
+    pool = _get_pool(workers)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, _call, name, *args)
+    except BrokenProcessPool:
+        if _pool is pool:
+            _pool = None
+        raise
+
+
+def shutdown_render_pool() -> None:
+    """Cerrar los procesos de render (al apagar ATIM)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
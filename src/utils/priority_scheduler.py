@@ -0,0 +1,261 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Deque, Dict, Hashable, Iterator, Optional, Tuple
+
+from src.utils.adaptive_limit import AdaptiveLimiter
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITY_CLASSES = (INTERACTIVE, BULK)
+
+# Prioridad de la tarea actual y clave de reparto (p. ej. el neonato) del
+# trabajo masivo. Por defecto todo es interactivo: solo se marca como masivo
+# lo que se sabe que lo es (series, ingesta del Storage SCP)
+_current_priority: ContextVar[Tuple[str, Hashable]] = ContextVar(
+    "atim_priority", default=(INTERACTIVE, None)
+)
+
+
+@contextmanager
+def priority(priority_class: str, fair_key: Hashable = None) -> Iterator[None]:
+    """Ejecutar el bloque con una clase de prioridad (y clave de reparto)."""
+    token = _current_priority.set((priority_class, fair_key))
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> Tuple[str, Hashable]:
+    """Clase de prioridad y clave de reparto de la tarea actual."""
+    return _current_priority.get()
+
+
+class SlotTicket:
+    """Hueco concedido: quien lo usa marca `error` si el upstream respondió con un fallo."""
+
+    __slots__ = ("error",)
+
+    def __init__(self):
+        self.error = False
+
+
+class _ClassStats:
+    __slots__ = ("active", "granted", "waited", "wait_seconds", "max_wait_seconds")
+
+    def __init__(self):
+        self.active = 0
+        self.granted = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class PriorityScheduler:
+    """
+    Reparto de las conexiones a un upstream entre trabajo interactivo y masivo.
+
+    Como mucho `capacity` llamadas a la vez. El trabajo masivo nunca ocupa los
+    `interactive_reserved` últimos huecos, de modo que una petición
+    interactiva (un clínico abriendo un estudio o transfiriendo una imagen)
+    encuentra sitio aunque haya una serie de 500 instancias en curso. Al
+    liberarse un hueco pasa primero lo interactivo (FIFO); lo masivo se
+    reparte por turnos entre claves (neonatos), para que una serie grande no
+    deje esperando a las de otros pacientes.
+
+    Los huecos se reservan por llamada HTTP, no por transferencia: entre una
+    instancia y la siguiente de una serie lo interactivo puede adelantarse.
+
+    Con un `limiter` la capacidad deja de ser fija: cada llamada le pasa su
+    latencia y si falló, y la capacidad sigue al límite que calcula.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int = 8,
+        interactive_reserved: int = 2,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ):
+        self.name = name
+        self.capacity = 1
+        self.interactive_reserved = 0
+        self.limiter = limiter
+        if limiter is not None:
+            capacity = limiter.limit
+        self._interactive: Deque[asyncio.Future] = deque()
+        self._bulk: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self._stats: Dict[str, _ClassStats] = {name: _ClassStats() for name in PRIORITY_CLASSES}
+        self.configure(capacity, interactive_reserved)
+
+    def configure(self, capacity: int, interactive_reserved: Optional[int] = None) -> None:
+        """Cambiar la capacidad (y la reserva interactiva) y despachar lo que quepa."""
+        self.capacity = max(1, capacity)
+        if interactive_reserved is not None:
+            self.interactive_reserved = max(0, interactive_reserved)
+        self._dispatch()
+
+    @property
+    def active(self) -> int:
+        return sum(stats.active for stats in self._stats.values())
+
+    @property
+    def bulk_limit(self) -> int:
+        """Huecos que puede ocupar el trabajo masivo (al menos uno)."""
+        return max(1, self.capacity - self.interactive_reserved)
+
+    def _can_run(self, priority_class: str) -> bool:
+        if self.active >= self.capacity:
+            return False
+        if priority_class == BULK:
+            return self._stats[BULK].active < self.bulk_limit
+        return True
+
+    def _grant(self, priority_class: str) -> None:
+        stats = self._stats[priority_class]
+        stats.active += 1
+        stats.granted += 1
+
+    def _next_bulk(self) -> Optional[asyncio.Future]:
+        """Siguiente espera masiva, por turnos entre claves."""
+        while self._bulk:
+            key, waiters = self._bulk.popitem(last=False)
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            if not waiters:
+                continue
+            future = waiters.popleft()
+            if waiters:
+                self._bulk[key] = waiters
+            return future
+        return None
+
+    def _dispatch(self) -> None:
+        while self._interactive and self._can_run(INTERACTIVE):
+            future = self._interactive.popleft()
+            if not future.done():
+                self._grant(INTERACTIVE)
+                future.set_result(None)
+        while not self._interactive and self._can_run(BULK):
+            future = self._next_bulk()
+            if future is None:
+                break
+            self._grant(BULK)
+            future.set_result(None)
+
+    def _release(self, priority_class: str) -> None:
+        self._stats[priority_class].active -= 1
+        self._dispatch()
+
+    def _enqueue(self, priority_class: str, fair_key: Hashable) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        if priority_class == BULK:
+            self._bulk.setdefault(fair_key, deque()).append(future)
+        else:
+            self._interactive.append(future)
+        return future
+
+    def _has_waiters(self, priority_class: str) -> bool:
+        if self._interactive:
+            return True
+        return priority_class == BULK and any(self._bulk.values())
+
+    @asynccontextmanager
+    async def slot(self, sample: bool = True) -> AsyncIterator[SlotTicket]:
+        """
+        Ocupar un hueco con la prioridad de la tarea actual mientras dura el
+        bloque. Si `sample`, la duración del bloque (y si lanzó una excepción
+        o se marcó `ticket.error`) alimenta el límite adaptativo; las
+        descargas en streaming no, porque duran lo que tarde quien las consume.
+        """
+        priority_class, fair_key = current_priority()
+        if priority_class not in self._stats:
+            priority_class = INTERACTIVE
+
+        if not self._has_waiters(priority_class) and self._can_run(priority_class):
+            self._grant(priority_class)
+        else:
+            future = self._enqueue(priority_class, fair_key)
+            # Las esperas canceladas siguen en cola hasta el próximo despacho:
+            # si solo había esas, puede que haya hueco ya
+            self._dispatch()
+            start = time.monotonic()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Concedido justo al cancelarse: devolver el hueco
+                    self._release(priority_class)
+                else:
+                    future.cancel()
+                raise
+            waited = time.monotonic() - start
+            stats = self._stats[priority_class]
+            stats.waited += 1
+            stats.wait_seconds += waited
+            stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+        ticket = SlotTicket()
+        in_flight = self.active
+        start = time.monotonic()
+        try:
+            yield ticket
+        except Exception:
+            ticket.error = True
+            raise
+        finally:
+            self._release(priority_class)
+            if sample and self.limiter is not None:
+                limit = self.limiter.record(time.monotonic() - start, in_flight, ticket.error)
+                if limit != self.capacity:
+                    self.configure(limit)
+
+    def stats(self) -> dict:
+        """Ocupación y espera en cola por clase de prioridad."""
+        queued = {
+            INTERACTIVE: sum(1 for f in self._interactive if not f.done()),
+            BULK: sum(1 for waiters in self._bulk.values() for f in waiters if not f.done()),
+        }
+        classes = {}
+        for name, stats in self._stats.items():
+            classes[name] = {
+                "active": stats.active,
+                "queued": queued[name],
+                "granted": stats.granted,
+                "waited": stats.waited,
+                "avg_wait_ms": round(1000 * stats.wait_seconds / stats.granted, 2) if stats.granted else 0.0,
+                "max_wait_ms": round(1000 * stats.max_wait_seconds, 2),
+            }
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "interactive_reserved": self.interactive_reserved,
+            "bulk_keys": sum(1 for waiters in self._bulk.values() if waiters),
+            "classes": classes,
+            "adaptive": self.limiter.stats() if self.limiter is not None else None,
+        }
+
+
+schedulers: Dict[str, PriorityScheduler] = {}
+
+
+def get_scheduler(
+    name: str,
+    capacity: int,
+    interactive_reserved: int,
+    limiter: Optional[Callable[[], AdaptiveLimiter]] = None,
+) -> PriorityScheduler:
+    """
+    Planificador compartido de un upstream (se crea la primera vez que se
+    pide). `limiter` construye su límite adaptativo, si lo hay.
+    """
+    scheduler = schedulers.get(name)
+    if scheduler is None:
+        scheduler = PriorityScheduler(
+            name, capacity, interactive_reserved, limiter() if limiter is not None else None
+        )
+        schedulers[name] = scheduler
+    return scheduler
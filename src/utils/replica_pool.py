@@ -0,0 +1,70 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator, List
+
+
+class ReplicaPool:
+    """
+    Balanceo de lecturas entre réplicas de un mismo archivo PACS.
+
+    Elige la réplica con menos peticiones en curso (least-outstanding-requests);
+    en caso de empate rota el punto de partida para repartir la carga. Una
+    réplica que rechazó una conexión queda apartada durante `cooldown_seconds`
+    mientras haya otras disponibles.
+    """
+
+    def __init__(self, urls: List[str], cooldown_seconds: float = 5.0):
+        self.urls = list(urls)
+        self.cooldown_seconds = cooldown_seconds
+        self.outstanding = [0] * len(self.urls)
+        self.served = [0] * len(self.urls)
+        self.failures = [0] * len(self.urls)
+        self._failed_at = [0.0] * len(self.urls)
+        self._next = 0
+
+    def pick(self, exclude: frozenset = frozenset()) -> int:
+        """Índice de la réplica menos ocupada, ignorando las de `exclude`."""
+        count = len(self.urls)
+        now = time.monotonic()
+        best = None
+        best_rank = None
+        for offset in range(count):
+            index = (self._next + offset) % count
+            if index in exclude:
+                continue
+            cooling = now - self._failed_at[index] < self.cooldown_seconds
+            rank = (cooling, self.outstanding[index])
+            if best is None or rank < best_rank:
+                best, best_rank = index, rank
+        if best is None:
+            raise LookupError("No quedan réplicas disponibles")
+        self._next = (best + 1) % count
+        return best
+
+    def mark_failed(self, index: int) -> None:
+        """Registrar que una réplica rechazó la conexión."""
+        self.failures[index] += 1
+        self._failed_at[index] = time.monotonic()
+
+    @contextmanager
+    def acquire(self, exclude: frozenset = frozenset()) -> Iterator[int]:
+        """Reservar una réplica mientras dura la petición."""
+        index = self.pick(exclude)
+        self.outstanding[index] += 1
+        try:
+            yield index
+        finally:
+            self.outstanding[index] -= 1
+            self.served[index] += 1
+
+    def stats(self) -> List[dict]:
+        """Estado de cada réplica."""
+        return [
+            {
+                "url": url,
+                "outstanding": self.outstanding[i],
+                "served": self.served[i],
+                "failures": self.failures[i],
+            }
+            for i, url in enumerate(self.urls)
+        ]
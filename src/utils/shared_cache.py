@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+logger = logging.getLogger("atim")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+class SharedCache:
+    """
+    Caché compartida entre procesos respaldada por SQLite.
+
+    Con varios workers de uvicorn cada proceso tiene su propia caché en
+    memoria; esta capa común evita que cada worker vuelva a pedir a Orthanc lo
+    que otro ya obtuvo. Guarda `bytes` tal cual y el resto como JSON.
+
+    Todas las operaciones corren en un único hilo dedicado por proceso, dueño
+    de la conexión, para no bloquear el event loop.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-cache")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.entries = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # ============================
+    # OPERACIONES (en el hilo dedicado)
+    # ============================
+
+    def _get_sync(self, key: str) -> Any:
+        row = self._connect().execute(
+            "SELECT kind, value FROM cache WHERE key = ? AND expires_at >= ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        kind, value = row
+        return bytes(value) if kind == "b" else json.loads(value)
+
+    def _set_sync(self, key: str, value: Any, ttl: float) -> None:
+        if isinstance(value, (bytes, bytearray)):
+            kind, blob = "b", bytes(value)
+        else:
+            kind, blob = "j", json.dumps(value, separators=(",", ":")).encode()
+
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, kind, value, size, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, kind, blob, len(blob), time.time() + ttl)
+        )
+
+        self._writes += 1
+        if self._writes % 256 == 1:
+            self._maintain(conn)
+
+    def _maintain(self, conn: sqlite3.Connection) -> None:
+        """Borrar lo expirado y, si se supera el límite, lo que antes expira."""
+        deleted = conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+
+        while total > self.max_bytes and entries:
+            rows = conn.execute(
+                "SELECT key, size FROM cache ORDER BY expires_at LIMIT 64"
+            ).fetchall()
+            conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k, _ in rows])
+            deleted += len(rows)
+            entries -= len(rows)
+            total -= sum(size for _, size in rows)
+
+        self.entries, self.bytes = entries, total
+        self.evictions += deleted
+
+    # ============================
+    # API ASÍNCRONA
+    # ============================
+
+    async def get(self, key: str) -> Any:
+        """Obtener un valor vigente o None."""
+        try:
+            value = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._get_sync, key
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Caché compartida no disponible: {e}")
+            return None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        """Guardar un valor durante `ttl` segundos."""
+        if ttl <= 0:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._set_sync, key, value, ttl
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"No se pudo escribir en la caché compartida: {e}")
+
+    def stats(self) -> dict:
+        """Contadores de uso (entradas y bytes según el último mantenimiento)."""
+        return {
+            "name": "shared",
+            "entries": self.entries,
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_shared_cache: Optional[SharedCache] = None
+
+
+def get_shared_cache(path: str, max_bytes: int) -> Optional[SharedCache]:
+    """Caché compartida del proceso, o None si no hay ruta configurada."""
+    global _shared_cache
+    if not path:
+        return None
+    if _shared_cache is None or _shared_cache.path != path:
+        _shared_cache = SharedCache(path, max_bytes)
+    return _shared_cache
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger("atim")
+
+
+class _Flight:
+    """Llamada upstream en curso compartida por varios solicitantes."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalescencia de peticiones idénticas concurrentes (patrón "single-flight").
+
+    Mientras una llamada con una clave dada está en curso, las peticiones
+    con la misma clave no vuelven a ir al upstream: esperan la misma tarea
+    y reciben su mismo resultado o su misma excepción.
+
+    La llamada real corre en una tarea propia, de modo que la cancelación de
+    un solicitante no cancela a los demás. Solo si todos los solicitantes se
+    cancelan se cancela también la llamada upstream.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.cancelled = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecutar `fn` una sola vez por clave entre todas las peticiones concurrentes."""
+        self.calls += 1
+        flight = self._flights.get(key)
+
+        if flight is None:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(fn())
+            flight = _Flight(task)
+            self._flights[key] = flight
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Si el que se cancela es el último solicitante, la llamada ya no
+            # le sirve a nadie y se cancela también. Se retira ya del mapa:
+            # quien llegue mientras termina de cancelarse lanza una nueva
+            if flight.waiters == 1 and not flight.task.done():
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        """Retirar la llamada del mapa de vuelos y contabilizar su resultado."""
+        if self._flights.get(key) is not None and self._flights[key].task is task:
+            del self._flights[key]
+
+        if task.cancelled():
+            self.cancelled += 1
+        elif task.exception() is not None:
+            # Marcar la excepción como consumida aunque nadie la espere ya
+            self.errors += 1
+            logger.debug(f"[{self.name}] Llamada coalescida falló: {key}: {task.exception()}")
+
+    def stats(self) -> dict:
+        """Contadores de coalescencia."""
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._flights),
+        }
@@ -0,0 +1,142 @@
+import importlib.abc
+import importlib.machinery as machinery
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("atim")
+
+
+def process_uptime() -> Optional[float]:
+    """Segundos desde que arrancó este proceso (Linux, resolución de ~10 ms), o None."""
+    try:
+        with open("/proc/self/stat") as f:
+            # El nombre del proceso va entre paréntesis y puede tener espacios
+            fields = f.read().rpartition(")")[2].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - started)
+
+
+class _TimedSourceLoader(machinery.SourceFileLoader):
+    def exec_module(self, module) -> None:
+        with startup_timer.measure(module.__name__):
+            super().exec_module(module)
+
+
+class _TimedExtensionLoader(machinery.ExtensionFileLoader):
+    def exec_module(self, module) -> None:
+        with startup_timer.measure(module.__name__):
+            super().exec_module(module)
+
+
+_TIMED_LOADERS = {
+    machinery.SourceFileLoader: _TimedSourceLoader,
+    machinery.ExtensionFileLoader: _TimedExtensionLoader,
+}
+
+
+class _Measure:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer: "StartupTimer", name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+        self.timer._children.append(0.0)
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.start
+        children = self.timer._children.pop()
+        # Tiempo propio del módulo, sin lo que tardaron sus imports
+        self.timer.import_times[self.name] = elapsed - children
+        if self.timer._children:
+            self.timer._children[-1] += elapsed
+
+
+class StartupTimer(importlib.abc.MetaPathFinder):
+    """
+    Desglose del arranque de un worker: tiempo de cada fase y tiempo propio
+    de importación de cada módulo (como `python -X importtime`, pero en el
+    log). Mientras está instalado envuelve el cargador de los módulos `.py`
+    y de las extensiones nativas; se desinstala al terminar el arranque.
+    """
+
+    def __init__(self):
+        self.import_times: Dict[str, float] = {}
+        self.phases: List[Tuple[str, float]] = []
+        self._children: List[float] = []
+        self._last = time.perf_counter()
+        self._healthy_logged = False
+
+    # ============================
+    # Importaciones
+    # ============================
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is None:
+            return None
+        timed = _TIMED_LOADERS.get(type(spec.loader))
+        if timed is not None:
+            spec.loader = timed(spec.loader.name, spec.loader.path)
+        return spec
+
+    def measure(self, name: str) -> _Measure:
+        return _Measure(self, name)
+
+    def install(self) -> None:
+        """Medir las importaciones siguientes (justo antes del buscador de rutas estándar)."""
+        if self in sys.meta_path:
+            return
+        index = sys.meta_path.index(machinery.PathFinder) if machinery.PathFinder in sys.meta_path else 0
+        sys.meta_path.insert(index, self)
+        self._last = time.perf_counter()
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    # ============================
+    # Fases
+    # ============================
+
+    def mark(self, phase: str) -> None:
+        """Cerrar una fase del arranque (tiempo desde la marca anterior)."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, top: int = 10) -> None:
+        """Registrar el desglose del arranque y los módulos más lentos de importar."""
+        self.uninstall()
+        uptime = process_uptime()
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+        since = f"{uptime:.2f}s desde el inicio del proceso" if uptime is not None else "listo"
+        logger.info(f"Arranque: {since} ({phases})")
+        if self.import_times:
+            slowest = sorted(self.import_times.items(), key=lambda item: item[1], reverse=True)[:top]
+            logger.info(
+                f"Importación: {len(self.import_times)} módulos en "
+                f"{sum(self.import_times.values()):.2f}s; los más lentos: "
+                + ", ".join(f"{name} {1000 * seconds:.0f}ms" for name, seconds in slowest)
+            )
+
+    def healthy(self) -> None:
+        """Registrar (una vez) cuánto tardó el proceso en responder sano a /health."""
+        if self._healthy_logged:
+            return
+        self._healthy_logged = True
+        uptime = process_uptime()
+        if uptime is not None:
+            logger.info(f"Primer /health sano a los {uptime:.2f}s del inicio del proceso")
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,58 @@
+import time
+import zipfile
+from typing import List, Tuple
+
+# Métodos de compresión admitidos en ARCHIVE_COMPRESSION
+ZIP_COMPRESSION = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+
+class _ChunkSink:
+    """
+    Destino de escritura sin `seek` ni `tell`: zipfile lo detecta, escribe
+    cada entrada con descriptor de datos y no vuelve atrás, así que lo
+    escrito se puede enviar en cuanto se recoge.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """
+    ZIP generado por partes: `add` devuelve los bytes de cada entrada y
+    `close` el directorio central. En memoria solo está la entrada en curso,
+    sin archivo temporal, sea cual sea el tamaño total.
+
+    Las llamadas hacen el CRC (y la compresión): desde el event loop,
+    llamarlas con asyncio.to_thread.
+    """
+
+    def __init__(self, compression: str = "stored"):
+        self._sink = _ChunkSink()
+        self._compression = ZIP_COMPRESSION[compression]
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=self._compression, allowZip64=True)
+        self._date_time: Tuple[int, ...] = time.localtime()[:6]
+
+    def add(self, name: str, data: bytes) -> bytes:
+        """Añadir una entrada y devolver sus bytes (cabecera local, datos y descriptor)."""
+        info = zipfile.ZipInfo(name, self._date_time)
+        info.compress_type = self._compression
+        self._zip.writestr(info, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Cerrar el ZIP y devolver el directorio central."""
+        self._zip.close()
+        return self._sink.drain()